@@ -1,11 +1,9 @@
 """This is the code for only demo in hugging face. The mina code can be run as it is mentioned in readme."""
 
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 
-import shutil
-import tempfile
 import gradio as gr
 
 from src.panaroma_stitcher.kornia import KorniaStitcher
@@ -41,31 +39,32 @@ class StitcherDemo:
         self.param_values["matcher"] = "smnn"
         self.param_values["thr"] = 0.8
 
-    def temp_dir(self, files: Any) -> str:
-        """create temp folder for uploading the images in gradio"""
-        temp_dir = Path(tempfile.gettempdir()) / "uploaded_images"
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-        temp_dir.mkdir(parents=True, exist_ok=True)
-        for file in files:
-            file_name = Path(file).name
-            dest_path = temp_dir / file_name
-            shutil.move(file, str(dest_path))
-        return str(temp_dir)
+    @staticmethod
+    def uploaded_images(files: Any) -> List[bytes]:
+        """Read the encoded uploaded images in gradio in the order of their names"""
+        paths = sorted(
+            (
+                Path(file)
+                for file in files
+                if Path(file).suffix in [".jpg", ".png", ".tif"]
+            ),
+            key=lambda path: path.name,
+        )
+        return [path.read_bytes() for path in paths]
 
     def callback(self, files: Any) -> Optional[Any]:
         """Callback function to be used within gradio"""
         print(self.param_values)
-        input_dir = self.temp_dir(files)
+        images = self.uploaded_images(files)
         if self.param_values["model"] == "Simple Stitcher":
-            stitcher1 = SimpleStitcher(
-                image_dir=Path(input_dir),
+            stitcher1 = SimpleStitcher.from_images(
+                images,
                 stitcher_type=self.param_values["stitcher_type"],
             )
             return stitcher1.stitcher()
         if self.param_values["model"] == "Detailed Stitcher":
-            stitcher2 = DetailedStitcher(
-                image_dir=Path(input_dir),
+            stitcher2 = DetailedStitcher.from_images(
+                images,
                 feature_number=self.param_values["num_feat"],
                 device="cpu",
                 detector_method=self.param_values["detect_method"],
@@ -76,7 +75,7 @@ class StitcherDemo:
             )
             return stitcher2.stitcher()
         if self.param_values["model"] == "Kornia Stitcher":
-            stitcher3 = KorniaStitcher(image_dir=Path(input_dir))
+            stitcher3 = KorniaStitcher.from_images(images)
             if self.param_values["method"] == "loftr":
                 stitcher3.loftr_matcher(model=self.param_values["loftr_model"])
             if self.param_values["method"] == "local":
@@ -93,16 +92,16 @@ class StitcherDemo:
                 )
             return stitcher3.stitcher()
         if self.param_values["model"] == "Sequential Stitcher":
-            stitcher4 = SequentialStitcher(
-                image_dir=Path(input_dir),
+            stitcher4 = SequentialStitcher.from_images(
+                images,
                 feature_detector=self.param_values["detector_method"],
                 matcher_type=self.param_values["matching_method"],
                 number_feature=self.param_values["number_feature"],
                 final_size=(1000, 3000),
             )
             return stitcher4.stitcher()
-        stitcher5 = KeypointStitcher(
-            image_dir=Path(input_dir),
+        stitcher5 = KeypointStitcher.from_images(
+            images,
             feature_detector=self.param_values["detector_method"],
             matcher_type=self.param_values["matching_method"],
             number_feature=self.param_values["number_feature"],
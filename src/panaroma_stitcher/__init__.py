@@ -2,16 +2,49 @@
 
 __version__ = "0.2.0"
 
-from .utility import ImageLoader
-from .detailed_stitcher import DetailedStitcher
-from .keypoint_stitcher import KeypointStitcher
-from .kornia import KorniaStitcher
-from .opencv_simple import SimpleStitcher
+from typing import TYPE_CHECKING, Any, List
+import importlib
+
+if TYPE_CHECKING:
+    from .utility import ImageLoader
+    from .auto_stitcher import AutoStitcher
+    from .detailed_stitcher import DetailedStitcher
+    from .keypoint_stitcher import KeypointStitcher
+    from .kornia import KorniaStitcher
+    from .opencv_simple import SimpleStitcher
+    from .online import MosaicSession
+
+# The stitchers are imported on first access so that torch, kornia and the stitching library are only loaded when needed
+_LAZY_IMPORTS = {
+    "ImageLoader": ".utility",
+    "AutoStitcher": ".auto_stitcher",
+    "DetailedStitcher": ".detailed_stitcher",
+    "KeypointStitcher": ".keypoint_stitcher",
+    "KorniaStitcher": ".kornia",
+    "SimpleStitcher": ".opencv_simple",
+    "MosaicSession": ".online",
+}
 
 __all__ = [
     "ImageLoader",
+    "AutoStitcher",
     "DetailedStitcher",
     "KeypointStitcher",
     "KorniaStitcher",
     "SimpleStitcher",
+    "MosaicSession",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    """Import the public classes lazily"""
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    """List the lazy public classes together with the module attributes"""
+    return sorted(list(globals()) + __all__)
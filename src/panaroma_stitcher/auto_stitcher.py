@@ -0,0 +1,348 @@
+"""Stitch with the cheapest backend that passes cheap registration checks, falling back within a time budget"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import logging
+import multiprocessing
+import tempfile
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from .batch import build_stitcher
+from .benchmark import STITCHERS
+from .cache import cached_result
+from .profiling import span
+from .utility import ImageLoader
+
+logger = logging.getLogger(__name__)
+
+# The backends in increasing order of their usual cost. kornia needs its model weights and runs only if requested.
+BACKENDS = ["simple", "sequential", "detailed", "keypoint"]
+# These backends chain the homographies of consecutive frames, so they need every consecutive pair to register
+CHAINED_BACKENDS = ["sequential", "keypoint"]
+CHECK_SIDE = 800
+
+
+def _check_image(
+    image: npt.NDArray[Any], max_side: int
+) -> Tuple[npt.NDArray[Any], float]:
+    """Return the grayscale image downscaled to max_side and its scale"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def _pair_record(
+    matcher: Any, left: Tuple[Any, Any, float], right: Tuple[Any, Any, float]
+) -> Dict[str, Any]:
+    """Match the ORB features of a pair and fit the homography that maps the right image into the left one"""
+    record: Dict[str, Any] = {
+        "matches": 0,
+        "inlier_ratio": 0.0,
+        "condition": float("inf"),
+        "homography": None,
+    }
+    if left[1] is None or right[1] is None:
+        return record
+    good = [
+        pair[0]
+        for pair in matcher.knnMatch(right[1], left[1], k=2)
+        if len(pair) == 2 and pair[0].distance < 0.75 * pair[1].distance
+    ]
+    record["matches"] = len(good)
+    if len(good) < 4:
+        return record
+    homography, mask = cv2.findHomography(
+        np.asarray([right[0][match.queryIdx].pt for match in good], np.float32),
+        np.asarray([left[0][match.trainIdx].pt for match in good], np.float32),
+        cv2.RANSAC,
+        3.0,
+    )
+    if homography is None:
+        return record
+    record["inlier_ratio"] = float(mask.mean())
+    homography = (
+        np.diag([1 / left[2], 1 / left[2], 1.0])
+        @ homography
+        @ np.diag([right[2], right[2], 1.0])
+    )
+    homography /= homography[2, 2]
+    if np.linalg.det(homography[:2, :2]) > 0:
+        record["condition"] = float(np.linalg.cond(homography[:2, :2]))
+    record["homography"] = homography
+    return record
+
+
+def check_pairs(
+    images: Sequence[npt.NDArray[Any]],
+    number_feature: int = 1000,
+    max_side: int = CHECK_SIDE,
+) -> List[Dict[str, Any]]:
+    """Match ORB features of the consecutive images at a low resolution and fit their RANSAC homographies.
+
+    Every record has the pair, its number of ratio-test matches, the inlier ratio of RANSAC, the condition number of
+    the linear part of the homography (infinite if it flips the image) and the homography that maps the second image
+    into the first one at the full resolution.
+    """
+    orb = cv2.ORB.create(number_feature)
+    features = []
+    for image in images:
+        gray, scale = _check_image(image, max_side)
+        keypoints, descriptors = orb.detectAndCompute(gray, None)  # type: ignore[call-overload]
+        features.append((keypoints, descriptors, scale))
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    return [
+        {
+            "pair": (idx - 1, idx),
+            **_pair_record(matcher, features[idx - 1], features[idx]),
+        }
+        for idx in range(1, len(images))
+    ]
+
+
+def projected_canvas(
+    homographies: Sequence[npt.NDArray[Any]], shapes: Sequence[Tuple[int, ...]]
+) -> Optional[Tuple[float, float, float, float]]:
+    """Return the (left, top, right, bottom) box of the frame corners in the first frame, None if one is behind it"""
+    points = []
+    for homography, shape in zip(homographies, shapes):
+        height, width = shape[:2]
+        corners = np.array(
+            [[0, 0, 1], [width, 0, 1], [width, height, 1], [0, height, 1]], float
+        )
+        projected = corners @ homography.T
+        if (projected[:, 2] <= 1e-6).any():
+            return None
+        points.append(projected[:, :2] / projected[:, 2:])
+    stacked = np.concatenate(points)
+    left, top = stacked.min(axis=0)
+    right, bottom = stacked.max(axis=0)
+    return float(left), float(top), float(right), float(bottom)
+
+
+def _attempt(
+    name: str, options: Mapping[str, Any], images: Sequence[Any], result_path: str
+) -> Optional[Any]:
+    """Stitch the loaded images with one backend"""
+    stitcher = build_stitcher(name, options, {}, image_data=images)
+    if name == "kornia":
+        return stitcher.stitcher(result_path)
+    return stitcher.stitcher(result_path, False)
+
+
+def _isolated_attempt(  # pylint: disable=R0913, R0917
+    name: str,
+    options: Mapping[str, Any],
+    images: Sequence[Any],
+    result_path: str,
+    array_path: str,
+    queue: Any,
+) -> None:
+    """Run an attempt in a child process, save its result to array_path and report an error message or None"""
+    try:
+        result = _attempt(name, options, images, result_path)
+        if result is not None:
+            np.save(array_path, np.asarray(result))
+        queue.put(None)
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        queue.put(str(error) or type(error).__name__)
+
+
+@dataclass
+class AutoStitcher(ImageLoader):  # pylint: disable=too-many-instance-attributes
+    """Try the backends in increasing cost order until one returns a plausible panorama within time_budget seconds.
+
+    Before any backend runs, the consecutive frames are matched at a low resolution. The backends that chain the
+    consecutive homographies are skipped if a pair has too few matches or inliers, an ill-conditioned homography or a
+    projected canvas that explodes. The sequential backend is also skipped if the canvas starts left of or above the
+    first frame, because its canvas cannot hold frames there. Nothing runs if no consecutive pair overlaps at all. With isolate, every attempt
+    runs in a child process that is stopped when the time budget runs out.
+    """
+
+    backends: Sequence[str] = field(default_factory=lambda: list(BACKENDS))
+    time_budget: float = field(default=120.0)
+    min_matches: int = field(default=30)
+    min_inlier_ratio: float = field(default=0.25)
+    max_condition: float = field(default=10.0)
+    max_canvas_ratio: float = field(default=4.0)
+    number_feature: int = field(default=500)
+    isolate: bool = field(default=True)
+    attempts: List[Dict[str, Any]] = field(init=False, default_factory=list)
+
+    def __post_init__(self) -> None:
+        """Check the backends and load the images"""
+        unknown = [name for name in self.backends if name not in STITCHERS]
+        if unknown:
+            raise ValueError(
+                f"The stitchers {unknown} are not defined. Use some of {STITCHERS}"
+            )
+        super().__post_init__()
+        self.opencv_load_images()
+
+    def precheck(self) -> Dict[str, Any]:
+        """Check the consecutive pairs and return their records, the projected canvas and the backends to skip"""
+        with span("precheck"):
+            pairs = check_pairs(self.images)
+        passed = [
+            record["matches"] >= self.min_matches
+            and record["inlier_ratio"] >= self.min_inlier_ratio
+            and record["condition"] <= self.max_condition
+            for record in pairs
+        ]
+        canvas = None
+        reason = ""
+        if not all(passed):
+            failed = pairs[passed.index(False)]
+            reason = (
+                f"pair {failed['pair']} has {failed['matches']} matches, an inlier ratio of "
+                f"{failed['inlier_ratio']:.2f} and a condition number of {failed['condition']:.1f}"
+            )
+        else:
+            chain = [np.eye(3)]
+            for record in pairs:
+                chain.append(chain[-1] @ record["homography"])
+            canvas = projected_canvas(chain, [image.shape for image in self.images])
+            frames = sum(image.shape[0] * image.shape[1] for image in self.images)
+            if canvas is None:
+                reason = "a frame is projected behind the camera"
+            elif (canvas[2] - canvas[0]) * (canvas[3] - canvas[1]) > (
+                self.max_canvas_ratio * frames
+            ):
+                reason = f"the projected canvas {canvas} is larger than {self.max_canvas_ratio} times the frames"
+                canvas = None
+        skip = {name: reason for name in CHAINED_BACKENDS if reason}
+        # The sequential canvas starts at the first frame, so frames projected left of or above it would be clipped
+        if canvas is not None and min(canvas[0], canvas[1]) < -0.5:
+            skip["sequential"] = (
+                f"the projected canvas {canvas} starts left of or above the first frame"
+            )
+        if not any(record["matches"] >= self.min_matches for record in pairs):
+            skip = {name: "no consecutive pair overlaps" for name in STITCHERS}
+        return {"pairs": pairs, "canvas": canvas, "skip": skip}
+
+    def _options(
+        self, name: str, canvas: Optional[Tuple[float, ...]]
+    ) -> Dict[str, Any]:
+        """Options of a backend for the already loaded and ordered images"""
+        options: Dict[str, Any] = {
+            "device": self.device,
+            "compiled_kernels": self.compiled_kernels,
+            "memory_budget_mb": self.memory_budget_mb,
+            "execution": self.execution,
+            "tile_format": self.tile_format,
+        }
+        if name in CHAINED_BACKENDS:
+            options["number_feature"] = self.number_feature
+        if name == "sequential" and canvas is not None:
+            options["final_size"] = (int(np.ceil(canvas[3])), int(np.ceil(canvas[2])))
+        return options
+
+    def _plausible(self, result: Any) -> str:
+        """Return why a result is not a panorama of the frames or an empty string"""
+        if result is None:
+            return "no result"
+        result = np.asarray(result)
+        if result.ndim < 2 or result.size == 0:
+            return "empty result"
+        area = result.shape[0] * result.shape[1]
+        frames = [image.shape[0] * image.shape[1] for image in self.images]
+        if area < 0.1 * max(frames):
+            return f"the result of {result.shape[:2]} is smaller than a frame"
+        if area > self.max_canvas_ratio * sum(frames):
+            return f"the result of {result.shape[:2]} is larger than {self.max_canvas_ratio} times the frames"
+        return ""
+
+    def _run(
+        self, name: str, options: Mapping[str, Any], result_path: str, remaining: float
+    ) -> Tuple[Optional[Any], str]:
+        """Run one attempt and return its result and the error or timeout message"""
+        if not self.isolate:
+            try:
+                return _attempt(name, options, self.images, result_path), ""
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                return None, str(error) or type(error).__name__
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            array_path = str(Path(tmp_dir) / "result.npy")
+            process = context.Process(
+                target=_isolated_attempt,
+                args=(name, options, self.images, result_path, array_path, queue),
+                daemon=True,
+            )
+            process.start()
+            process.join(remaining)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+                return None, f"stopped after the time budget of {self.time_budget}s"
+            message = queue.get() if not queue.empty() else "the process crashed"
+            if Path(array_path).exists():
+                return np.load(array_path), ""
+            return None, message or ""
+
+    @cached_result
+    def stitcher(  # pylint: disable=unused-argument
+        self, result_path: str = "", framer: bool = True
+    ) -> Optional[Any]:
+        """Stitch with the first backend whose result is plausible and record the time of every attempt.
+
+        The RGB result of the backend is cropped already, so framer is only kept for the interface of the stitchers.
+        """
+        start = time.perf_counter()
+        self.attempts = []
+        if len(self.images) < 2:
+            logger.warning("At least two images are needed for stitching.")
+            return None
+        check = self.precheck()
+        logger.info(
+            "Checking %s pairs took %.2fs.",
+            len(check["pairs"]),
+            time.perf_counter() - start,
+        )
+        for name in self.backends:
+            remaining = self.time_budget - (time.perf_counter() - start)
+            record: Dict[str, Any] = {"backend": name, "seconds": 0.0}
+            self.attempts.append(record)
+            if name in check["skip"]:
+                record.update(status="skipped", reason=check["skip"][name])
+            elif remaining <= 0:
+                record.update(status="skipped", reason="the time budget is spent")
+            else:
+                attempt_start = time.perf_counter()
+                result, reason = self._run(
+                    name, self._options(name, check["canvas"]), "", remaining
+                )
+                reason = reason or self._plausible(result)
+                record.update(
+                    status="failed" if reason else "ok",
+                    reason=reason,
+                    seconds=time.perf_counter() - attempt_start,
+                )
+            logger.info(
+                "Backend %s: %s in %.2fs %s",
+                name,
+                record["status"],
+                record["seconds"],
+                record["reason"],
+            )
+            if record["status"] == "ok":
+                logger.info(
+                    "The panorama was stitched by %s after %.2fs.",
+                    name,
+                    time.perf_counter() - start,
+                )
+                if result_path != "":
+                    # The backends return their results without the black areas already
+                    self.save_result(result, result_path, False)
+                return result
+        logger.warning(
+            "No backend stitched the images within %.2fs.", time.perf_counter() - start
+        )
+        return None
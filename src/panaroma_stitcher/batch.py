@@ -0,0 +1,225 @@
+"""Batch stitching of many image directories with a process pool and a resumable manifest"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from .benchmark import STITCHERS, list_datasets
+from .execution import ExecutionConfig
+
+logger = logging.getLogger(__name__)
+
+STITCHER_CLASSES = {
+    "simple": (".opencv_simple", "SimpleStitcher"),
+    "keypoint": (".keypoint_stitcher", "KeypointStitcher"),
+    "sequential": (".sequential_stitcher", "SequentialStitcher"),
+    "detailed": (".detailed_stitcher", "DetailedStitcher"),
+    "kornia": (".kornia", "KorniaStitcher"),
+}
+
+_WORKER: Dict[str, Any] = {}
+
+
+def read_jobs(source: Path, output_dir: Path) -> List[Dict[str, str]]:
+    """Return the jobs of a root directory (one job per image directory) or of a manifest file.
+
+    Every line of a manifest file is either an image directory or a JSON object with data_path and optionally result_path.
+    """
+    if source.is_dir():
+        return [
+            {
+                "data_path": str(dataset),
+                "result_path": str(output_dir / f"{dataset.name}.png"),
+            }
+            for dataset in list_datasets(source)
+        ]
+    jobs = []
+    with open(source, "r", encoding="utf-8") as manifest_file:
+        for line in manifest_file:
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line) if line.startswith("{") else {"data_path": line}
+            job.setdefault(
+                "result_path", str(output_dir / f"{Path(job['data_path']).name}.png")
+            )
+            jobs.append(job)
+    return jobs
+
+
+def job_settings(
+    method: str,
+    options: Mapping[str, Any],
+    resize_shape: Optional[Tuple[int, int]],
+    framer: bool,
+) -> Dict[str, Any]:
+    """Settings of a batch as they are written to every manifest record"""
+    settings: Dict[str, Any] = json.loads(
+        json.dumps(
+            {
+                "method": method,
+                "options": dict(options),
+                "resize_shape": resize_shape,
+                "framer": framer,
+            },
+            default=str,
+        )
+    )
+    return settings
+
+
+def finished_jobs(
+    manifest_path: Path, settings: Optional[Mapping[str, Any]] = None
+) -> Set[str]:
+    """Return the data paths of the jobs that already finished successfully in a manifest, with the same settings if given"""
+    if not manifest_path.exists():
+        return set()
+    with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+        records = [json.loads(line) for line in manifest_file if line.strip()]
+    return {
+        record["data_path"]
+        for record in records
+        if record["status"] == "ok"
+        and all(record.get(key) == value for key, value in (settings or {}).items())
+    }
+
+
+def pending_jobs(
+    jobs: List[Dict[str, str]],
+    manifest_path: Path,
+    settings: Optional[Mapping[str, Any]] = None,
+) -> List[Dict[str, str]]:
+    """Return the jobs that did not finish yet with the settings and create their output directories"""
+    done = finished_jobs(manifest_path, settings)
+    pending = [job for job in jobs if job["data_path"] not in done]
+    logger.info(
+        "Batch of %s jobs: %s finished before and %s pending.",
+        len(jobs),
+        len(jobs) - len(pending),
+        len(pending),
+    )
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    for job in pending:
+        Path(job["result_path"]).parent.mkdir(parents=True, exist_ok=True)
+    return pending
+
+
+def build_stitcher(
+    method: str, options: Mapping[str, Any], warm: Dict[str, Any], **inputs: Any
+) -> Any:
+    """Create a stitcher for new inputs and reuse the deep kornia matcher kept in the warm state of the worker"""
+    module, class_name = STITCHER_CLASSES[method]
+    stitcher_class = getattr(importlib.import_module(module, __package__), class_name)
+    options = dict(options)
+    loftr_model = options.pop("loftr_model", "outdoor")
+    stitcher = stitcher_class(**inputs, **options)
+    if method == "kornia":
+        if f"loftr_{loftr_model}" not in warm:
+            stitcher.loftr_matcher(loftr_model)
+            warm[f"loftr_{loftr_model}"] = stitcher.matcher
+        stitcher.matcher = warm[f"loftr_{loftr_model}"]
+    return stitcher
+
+
+def _init_worker(
+    method: str,
+    options: Mapping[str, Any],
+    resize_shape: Optional[Tuple[int, int]],
+    framer: bool,
+    execution: ExecutionConfig,
+) -> None:
+    """Import the stitcher once per worker, size its thread pools and keep its settings for all the jobs of the worker"""
+    importlib.import_module(STITCHER_CLASSES[method][0], __package__)
+    execution.apply()
+    _WORKER.update(
+        {
+            "method": method,
+            "options": dict(options),
+            "resize_shape": resize_shape,
+            "framer": framer,
+            "settings": job_settings(method, options, resize_shape, framer),
+        }
+    )
+
+
+def _run_job(job: Mapping[str, str]) -> Dict[str, Any]:
+    """Stitch one image directory in a worker and return its manifest record"""
+    record: Dict[str, Any] = {
+        **job,
+        **_WORKER["settings"],
+        "status": "ok",
+        "worker": os.getpid(),
+    }
+    start = time.perf_counter()
+    try:
+        stitcher = build_stitcher(
+            _WORKER["method"],
+            _WORKER["options"],
+            _WORKER,
+            image_dir=Path(job["data_path"]),
+            resize_shape=_WORKER["resize_shape"],
+        )
+        if _WORKER["method"] == "kornia":
+            result = stitcher.stitcher(job["result_path"])
+        else:
+            result = stitcher.stitcher(job["result_path"], _WORKER["framer"])
+        if result is None:
+            record["status"] = "failed"
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        record["status"] = "error"
+        record["error"] = str(error)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def run_batch(  # pylint: disable=R0913, R0917
+    jobs: List[Dict[str, str]],
+    manifest_path: Path,
+    method: str = "simple",
+    options: Optional[Mapping[str, Any]] = None,
+    resize_shape: Optional[Tuple[int, int]] = None,
+    framer: bool = True,
+    workers: int = 1,
+    threads: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Run the jobs that did not finish with the same settings on a process pool and append their records to the manifest.
+
+    The CPUs are split between the workers, and every worker gets threads library threads or an equal share.
+    """
+    if method not in STITCHERS:
+        raise ValueError(
+            f"The stitcher {method} is not defined. Use one of {STITCHERS}"
+        )
+    pending = pending_jobs(
+        jobs,
+        manifest_path,
+        job_settings(method, options or {}, resize_shape, framer),
+    )
+    records = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            method,
+            options or {},
+            resize_shape,
+            framer,
+            ExecutionConfig(workers, threads),
+        ),
+    ) as executor, open(manifest_path, "a", encoding="utf-8") as manifest_file:
+        futures = [executor.submit(_run_job, job) for job in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            manifest_file.write(json.dumps(record) + "\n")
+            manifest_file.flush()
+            records.append(record)
+            logger.info("Batch job %s: %s", record["data_path"], record["status"])
+    return records
@@ -0,0 +1,283 @@
+"""Benchmark of the stitchers over image directories"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from . import profiling
+from .synthetic import alignment_error, read_ground_truth
+
+logger = logging.getLogger(__name__)
+
+STITCHERS = ["simple", "keypoint", "sequential", "detailed", "kornia"]
+IMAGE_SUFFIXES = [".jpg", ".png", ".tif"]
+
+
+def list_datasets(data_root: Path) -> List[Path]:
+    """List the image directories below a data root (or the root itself if it contains images)"""
+    candidates = [data_root] + sorted(
+        path for path in data_root.iterdir() if path.is_dir()
+    )
+    return [
+        path
+        for path in candidates
+        if any(file.suffix in IMAGE_SUFFIXES for file in path.glob("*"))
+    ]
+
+
+def scaled_shape(dataset: Path, scale: float) -> Optional[Tuple[int, int]]:
+    """Return the resize_shape of a dataset for a scale of its first image or None for the original size"""
+    if scale == 1.0:
+        return None
+    first_image = sorted(
+        file for file in dataset.glob("*") if file.suffix in IMAGE_SUFFIXES
+    )[0]
+    height, width = cv2.imread(str(first_image)).shape[:2]
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def create_stitcher(
+    name: str, dataset: Path, resize_shape: Optional[Tuple[int, int]]
+) -> Any:
+    """Create one of the stitchers with its default settings for benchmarking"""
+    # pylint: disable=import-outside-toplevel
+    if name == "simple":
+        from .opencv_simple import SimpleStitcher
+
+        return SimpleStitcher(image_dir=dataset, resize_shape=resize_shape)
+    if name == "keypoint":
+        from .keypoint_stitcher import KeypointStitcher
+
+        return KeypointStitcher(
+            image_dir=dataset, resize_shape=resize_shape, number_feature=500
+        )
+    if name == "sequential":
+        from .sequential_stitcher import SequentialStitcher
+
+        return SequentialStitcher(
+            image_dir=dataset, resize_shape=resize_shape, number_feature=500
+        )
+    if name == "detailed":
+        from .detailed_stitcher import DetailedStitcher
+
+        return DetailedStitcher(image_dir=dataset, resize_shape=resize_shape)
+    if name == "kornia":
+        from .kornia import KorniaStitcher
+
+        stitcher = KorniaStitcher(image_dir=dataset, resize_shape=resize_shape)
+        stitcher.loftr_matcher()
+        return stitcher
+    raise ValueError(f"The stitcher {name} is not defined. Use one of {STITCHERS}")
+
+
+class _StageSink:
+    """Sum the wall time of the profiling spans per stage name"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        """Add a span to its stage"""
+        self.stages[record["name"]] = (
+            self.stages.get(record["name"], 0.0) + record["wall_seconds"]
+        )
+
+    def close(self) -> None:
+        """Nothing to flush"""
+
+
+def _add_alignment_error(record: Dict[str, Any], stitcher: Any, dataset: Path) -> None:
+    """Add the alignment error against the ground truth of synthetic datasets for stitchers with homographies.
+
+    The ground truth is converted to the coordinates of the scaled frames, so the error is in scaled pixels.
+    """
+    ground_truth = read_ground_truth(dataset)
+    if ground_truth is None or not hasattr(stitcher, "homographies"):
+        return
+    frame_shape = stitcher.images[0].shape
+    view_height, view_width = ground_truth["view_shape"][:2]
+    scaling = np.diag([frame_shape[1] / view_width, frame_shape[0] / view_height, 1.0])
+    truth = [
+        scaling @ np.asarray(homography) @ np.linalg.inv(scaling)
+        for homography in ground_truth["homographies"]
+    ]
+    try:
+        record["alignment_error"] = alignment_error(
+            stitcher.homographies(), truth, frame_shape
+        )
+    except (cv2.error, ValueError, TypeError) as error:
+        logger.warning("Alignment error of %s is not available: %s", dataset, error)
+
+
+def run_case(name: str, dataset: Path, scale: float) -> Dict[str, Any]:
+    """Run one stitcher on one dataset and return its timing and memory record"""
+    record: Dict[str, Any] = {
+        "stitcher": name,
+        "dataset": dataset.name,
+        "scale": scale,
+        "status": "ok",
+        "stages": {},
+    }
+    sink = _StageSink()
+    profiling.enable(sink)
+    start = time.perf_counter()
+    try:
+        stage_start = time.perf_counter()
+        stitcher = create_stitcher(name, dataset, scaled_shape(dataset, scale))
+        record["stages"]["setup"] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        result = stitcher.stitcher()
+        record["stages"]["stitch"] = time.perf_counter() - stage_start
+        record["output_megapixels"] = (
+            0.0 if result is None else result.shape[0] * result.shape[1] / 1e6
+        )
+        if result is None:
+            record["status"] = "failed"
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        logger.warning("Benchmark of %s on %s failed: %s", name, dataset, error)
+        record["status"] = "error"
+        record["error"] = str(error)
+    record["wall_seconds"] = time.perf_counter() - start
+    profiling.disable()
+    record["stages"].update(sink.stages)
+    if record["status"] == "ok":
+        _add_alignment_error(record, stitcher, dataset)
+    record["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info("Benchmark record: %s", record)
+    return record
+
+
+def run_suite(
+    data_root: Path,
+    stitchers: Sequence[str] = tuple(STITCHERS),
+    scales: Sequence[float] = (0.5, 1.0),
+    isolate: bool = True,
+) -> Dict[str, Any]:
+    """Benchmark the stitchers over all datasets and scales.
+
+    With isolate, every case runs in a fresh process so that its peak RSS is not mixed with other cases.
+    """
+    records = []
+    for dataset in list_datasets(data_root):
+        for name in stitchers:
+            for scale in scales:
+                if not isolate:
+                    records.append(run_case(name, dataset, scale))
+                    continue
+                with ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    records.append(
+                        executor.submit(run_case, name, dataset, scale).result()
+                    )
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": records,
+    }
+
+
+def _median_seconds(function: Any, repeats: int) -> float:
+    """Median wall time of a function"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def _synthetic_frame(
+    shape: Tuple[int, int]
+) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.uint8], Tuple[int, int, int, int]]:
+    """Return a frame that is black outside of its ROI, a canvas and the ROI"""
+    rng = np.random.default_rng(0)
+    canvas = rng.integers(0, 256, (*shape, 3), dtype=np.uint8)
+    frame = np.zeros_like(canvas)
+    roi = (shape[0] // 4, shape[0] * 3 // 4, shape[1] // 3, shape[1] * 2 // 3)
+    frame[roi[0] : roi[1], roi[2] : roi[3]] = rng.integers(
+        0, 256, (roi[1] - roi[0], roi[3] - roi[2], 3), dtype=np.uint8
+    )
+    return frame, canvas, roi
+
+
+def run_kernels(
+    shape: Tuple[int, int] = (2000, 3000), repeats: int = 5
+) -> Dict[str, Any]:
+    """Benchmark the compiled kernels against the opencv call chains on a synthetic warped frame and canvas"""
+    # pylint: disable=import-outside-toplevel
+    from . import kernels
+    from .sequential_stitcher import SequentialStitcher
+    from .utility import padded_foreground_mask
+
+    frame, canvas, roi = _synthetic_frame(shape)
+    # Pasting in place is idempotent, so both chains give the same result on the canvas after the kernel ran
+    cases: Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]] = {
+        "paste": (
+            lambda: SequentialStitcher.stitch_cleaner(frame, canvas),
+            lambda: kernels.paste_nonblack(frame, canvas, 1, roi),
+        ),
+        "mask": (
+            lambda: padded_foreground_mask(frame),
+            lambda: padded_foreground_mask(frame, True),
+        ),
+    }
+    records = {}
+    for name, (opencv_chain, kernel) in cases.items():
+        records[name] = {
+            "identical": bool(np.array_equal(kernel(), opencv_chain())),
+            "opencv_seconds": _median_seconds(opencv_chain, repeats),
+            "compiled_seconds": _median_seconds(kernel, repeats),
+        }
+        records[name]["speedup"] = (
+            records[name]["opencv_seconds"] / records[name]["compiled_seconds"]
+        )
+    logger.info("Kernel benchmark: %s", records)
+    return {"shape": list(shape), "repeats": repeats, "cases": records}
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2
+) -> List[Dict[str, Any]]:
+    """Return the cases whose wall time or peak RSS grew more than the tolerance compared to a baseline"""
+    baseline_records = {
+        (record["stitcher"], record["dataset"], record["scale"]): record
+        for record in baseline["results"]
+    }
+    regressions = []
+    for record in results["results"]:
+        reference = baseline_records.get(
+            (record["stitcher"], record["dataset"], record["scale"])
+        )
+        if reference is None or reference["status"] != "ok":
+            continue
+        if record["status"] != "ok":
+            regressions.append({**record, "metric": "status"})
+            continue
+        for metric in ["wall_seconds", "peak_rss_mb"]:
+            if record[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "stitcher": record["stitcher"],
+                        "dataset": record["dataset"],
+                        "scale": record["scale"],
+                        "metric": metric,
+                        "baseline": reference[metric],
+                        "current": record[metric],
+                    }
+                )
+    return regressions
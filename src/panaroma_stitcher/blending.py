@@ -0,0 +1,158 @@
+"""Seams on downscaled overlaps and feather or multi-band blending for the lightweight stitchers"""
+
+from dataclasses import dataclass, field
+from typing import Any, Optional, Tuple
+
+import logging
+import math
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+# Choices of the seam finder and blender with the names of the detailed stitcher
+SEAM_FINDERS = ["dp_color", "dp_colorgrad", "gc_color", "gc_colorgrad", "voronoi", "no"]
+BLENDERS = ["multiband", "feather", "no"]
+
+
+def foreground_mask(image: npt.NDArray[Any], thresh: int = 1) -> npt.NDArray[np.uint8]:
+    """Return the mask of the pixels that are brighter than thresh like the hard paste of the sequential stitcher"""
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return np.asarray(cv2.threshold(grey, thresh, 255, cv2.THRESH_BINARY)[1])
+
+
+def overlap_band(
+    first: npt.NDArray[np.uint8], second: npt.NDArray[np.uint8], margin: int = 0
+) -> Optional[Tuple[int, int, int, int]]:
+    """Return the (left, top, right, bottom) box of the overlap of two masks widened by margin or None"""
+    rows = np.flatnonzero(np.any(first & second, axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(
+        np.any(first[rows[0] : rows[-1] + 1] & second[rows[0] : rows[-1] + 1], axis=0)
+    )
+    height, width = first.shape[:2]
+    return (
+        max(int(cols[0]) - margin, 0),
+        max(int(rows[0]) - margin, 0),
+        min(int(cols[-1]) + 1 + margin, width),
+        min(int(rows[-1]) + 1 + margin, height),
+    )
+
+
+def _seam_finder(name: str) -> Any:
+    """Create the opencv seam finder of a name"""
+    if name == "dp_color":
+        return cv2.detail.DpSeamFinder("COLOR")
+    if name == "dp_colorgrad":
+        return cv2.detail.DpSeamFinder("COLOR_GRAD")
+    if name == "gc_color":
+        return cv2.detail.GraphCutSeamFinder("COST_COLOR")
+    if name == "gc_colorgrad":
+        return cv2.detail.GraphCutSeamFinder("COST_COLOR_GRAD")
+    if name == "voronoi":
+        return cv2.detail.SeamFinder.createDefault(cv2.detail.SeamFinder_VORONOI_SEAM)
+    return cv2.detail.SeamFinder.createDefault(cv2.detail.SeamFinder_NO)
+
+
+@dataclass
+class SeamBlender:
+    """Paste warped frames over a canvas with a seam and blending only in the band around their overlap.
+
+    The seam is found on the band downscaled by seam_scale and its masks are upscaled to the band, as the detailed
+    stitcher does with its low resolution. The blend width is blend_strength percent of the size of the overlap and
+    the band reaches that far beyond it, so the pixels outside the band are pasted as they are.
+    """
+
+    blender: str = field(default="multiband")
+    seam_finder: str = field(default="dp_color")
+    seam_scale: float = field(default=0.25)
+    blend_strength: float = field(default=5.0)
+
+    def __post_init__(self) -> None:
+        """Check the seam finder and blender names"""
+        if self.blender not in BLENDERS:
+            raise ValueError(f"The blender {self.blender} is not one of {BLENDERS}")
+        if self.seam_finder not in SEAM_FINDERS:
+            raise ValueError(
+                f"The seam finder {self.seam_finder} is not one of {SEAM_FINDERS}"
+            )
+
+    def _create_blender(self, blend_width: float) -> Any:
+        """Create the opencv blender of a blend width in pixels"""
+        if self.blender == "multiband" and blend_width >= 4:
+            blender = cv2.detail.MultiBandBlender()
+            blender.setNumBands(int(math.log2(blend_width) - 1))
+            return blender
+        if self.blender == "feather" and blend_width >= 1:
+            return cv2.detail.FeatherBlender(1 / blend_width)
+        return cv2.detail.Blender.createDefault(cv2.detail.Blender_NO)
+
+    def _seam_masks(
+        self, images: Tuple[npt.NDArray[Any], ...], masks: Tuple[npt.NDArray[Any], ...]
+    ) -> Tuple[npt.NDArray[Any], ...]:
+        """Find the seam of two images at a low resolution and return their masks at the full resolution"""
+        height, width = masks[0].shape[:2]
+        size = (
+            max(int(width * self.seam_scale), 1),
+            max(int(height * self.seam_scale), 1),
+        )
+        small_images = [
+            cv2.resize(image, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+            for image in images
+        ]
+        small_masks = [
+            cv2.UMat(cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST))  # type: ignore[call-overload]
+            for mask in masks
+        ]
+        seams = _seam_finder(self.seam_finder).find(
+            small_images, [(0, 0)] * len(images), small_masks
+        )
+        return tuple(
+            cv2.bitwise_and(
+                cv2.resize(
+                    cv2.dilate(cv2.UMat.get(seam), None),  # type: ignore[call-overload]
+                    (width, height),
+                    interpolation=cv2.INTER_LINEAR_EXACT,
+                ),
+                mask,
+            )
+            for seam, mask in zip(seams, masks)
+        )
+
+    def blend(  # pylint: disable=R0914
+        self, frame: npt.NDArray[Any], canvas: npt.NDArray[Any]
+    ) -> npt.NDArray[Any]:
+        """Return the canvas with a warped BGR frame of the same size pasted over it, black pixels being empty"""
+        frame_mask, canvas_mask = foreground_mask(frame), foreground_mask(canvas)
+        result = np.where(frame_mask[..., None] > 0, frame, canvas)
+        overlap = overlap_band(frame_mask, canvas_mask)
+        if overlap is None:
+            return np.asarray(result)
+        blend_width = (
+            math.sqrt((overlap[2] - overlap[0]) * (overlap[3] - overlap[1]))
+            * self.blend_strength
+            / 100
+        )
+        left, top, right, bottom = (
+            overlap_band(frame_mask, canvas_mask, math.ceil(blend_width)) or overlap
+        )
+        band = (slice(top, bottom), slice(left, right))
+        images = (canvas[band], frame[band])
+        seams = self._seam_masks(images, (canvas_mask[band], frame_mask[band]))
+        blender = self._create_blender(blend_width)
+        blender.prepare((0, 0, right - left, bottom - top))
+        for image, seam in zip(images, seams):
+            blender.feed(image.astype(np.int16), seam, (0, 0))
+        # pylint: disable-next=unpacking-non-sequence
+        blended, blended_mask = blender.blend(None, None)
+        result[band] = np.where(
+            blended_mask[..., None] > 0, cv2.convertScaleAbs(blended), result[band]
+        )
+        logger.debug(
+            "Blended the band %s with a blend width of %.1fpx.",
+            (left, top, right, bottom),
+            blend_width,
+        )
+        return np.asarray(result)
@@ -0,0 +1,181 @@
+"""Content-addressed cache of stitching results"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Fields that do not change the result or that are already covered by the hashes of the loaded images
+IGNORED_FIELDS = [
+    "image_dir",
+    "image_data",
+    "device",
+    "cache",
+    "compiled_kernels",
+    "memory_budget_mb",
+    "execution",
+    "tile_format",
+    "checkpoint_dir",
+    "checkpoint_interval",
+]
+
+
+@dataclass
+class ResultCache:  # pylint: disable=too-many-instance-attributes
+    """Cache of stitched results on disk with size-based LRU eviction and an optional in-process memory tier"""
+
+    cache_dir: Path
+    max_bytes: int = field(default=1024**3)
+    memory_items: int = field(default=0)
+    hits: int = field(init=False, default=0)
+    memory_hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    evictions: int = field(init=False, default=0)
+    memory: "OrderedDict[str, npt.NDArray[Any]]" = field(
+        init=False, default_factory=OrderedDict
+    )
+    lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def __post_init__(self) -> None:
+        """Create the cache directory"""
+        self.cache_dir = Path(self.cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(stitcher: Any) -> str:
+        """Hash the loaded images together with the stitcher class, its settings and its extra cache key parts"""
+        digest = hashlib.sha256(type(stitcher).__qualname__.encode())
+        settings = {
+            item.name: getattr(stitcher, item.name)
+            for item in fields(stitcher)
+            if item.init and item.name not in IGNORED_FIELDS
+        }
+        settings.update(stitcher.cache_key_parts())
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        for image in stitcher.images:
+            array = np.ascontiguousarray(
+                image if isinstance(image, np.ndarray) else image.detach().cpu().numpy()
+            )
+            digest.update(f"{array.shape}{array.dtype}".encode())
+            digest.update(hashlib.sha256(array.data).digest())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        """Path of a cached result"""
+        return self.cache_dir / f"{key}.npy"
+
+    def _remember(self, key: str, result: npt.NDArray[Any]) -> None:
+        """Keep a result in the memory tier"""
+        if self.memory_items <= 0:
+            return
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[npt.NDArray[Any]]:
+        """Return a cached result or None"""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self.memory[key]
+        path = self._path(key)
+        try:
+            result: npt.NDArray[Any] = np.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        self._remember(key, result)
+        return result
+
+    def put(self, key: str, result: npt.NDArray[Any]) -> None:
+        """Store a result and evict the least recently used results above the size limit"""
+        temp_path = self.cache_dir / f"{key}.{threading.get_ident()}.tmp.npy"
+        np.save(temp_path, result)
+        os.replace(temp_path, self._path(key))
+        self._remember(key, result)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used results until the cache fits in max_bytes"""
+        entries = sorted(
+            (path.stat().st_mtime, path.stat().st_size, path)
+            for path in self.cache_dir.glob("*.npy")
+            if not path.name.endswith(".tmp.npy")
+        )
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            with self.lock:
+                self.evictions += 1
+                self.memory.pop(path.stem, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics and the size of the cache"""
+        sizes = [
+            path.stat().st_size
+            for path in self.cache_dir.glob("*.npy")
+            if not path.name.endswith(".tmp.npy")
+        ]
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "entries": len(sizes),
+                "bytes": sum(sizes),
+            }
+
+
+def cached_result(method: F) -> F:
+    """Serve the stitcher method from the cache of the stitcher if it has one, and store its new results.
+
+    The returned result is cropped and the canvas before the framer is not cached, so a call that saves the result
+    without the framer always stitches.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        key = self.cache.key(self)
+        result_path = args[0] if args else kwargs.get("result_path", "")
+        framer = args[1] if len(args) > 1 else kwargs.get("framer", True)
+        result = None if result_path != "" and not framer else self.cache.get(key)
+        if result is None:
+            result = method(self, *args, **kwargs)
+            if result is not None:
+                self.cache.put(key, np.asarray(result))
+            return result
+        logger.info("The stitching result is loaded from the cache.")
+        if result_path != "":
+            self.save_result(result, result_path, False)
+        return result
+
+    return wrapper  # type: ignore[return-value]
@@ -0,0 +1,151 @@
+"""Checkpoints of long sequential stitches that a restarted run resumes from"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+import logging
+import os
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+
+def pack_keypoints(keypoints: Sequence[Any]) -> npt.NDArray[np.float64]:
+    """Pack opencv keypoints into rows of x, y, size, angle, response, octave and class id without loss"""
+    return np.array(
+        [
+            [*point.pt, point.size, point.angle, point.response, point.octave]
+            + [point.class_id]
+            for point in keypoints
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 7)
+
+
+def unpack_keypoints(rows: npt.NDArray[np.float64]) -> Tuple[Any, ...]:
+    """Create the opencv keypoints of packed rows"""
+    return tuple(
+        cv2.KeyPoint(
+            float(row[0]),
+            float(row[1]),
+            float(row[2]),
+            float(row[3]),
+            float(row[4]),
+            int(row[5]),
+            int(row[6]),
+        )
+        for row in rows
+    )
+
+
+@dataclass
+class StitchCheckpoint:
+    """Directory with the progress of a sequential stitch after its last checkpointed frame.
+
+    Every checkpoint writes the canvas and the features of its frame to new files, and then atomically replaces the
+    state (the frame, the homography chain, the name of the canvas file and the key of the images and settings). The
+    files of the previous checkpoint are only removed after that, so the state always names a canvas of its own frame
+    and no frame is pasted or blended twice after a crash.
+    """
+
+    directory: Path
+    key: str
+
+    def __post_init__(self) -> None:
+        """Create the checkpoint directory"""
+        self.directory = Path(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def state_path(self) -> Path:
+        """Path of the frame, chain, canvas file name and key of the last checkpoint"""
+        return self.directory / "state.npz"
+
+    def _canvas_path(self, frame: int) -> Path:
+        """Path of the canvas after a frame"""
+        return self.directory / f"canvas_{frame}.npy"
+
+    def _features_path(self, frame: int) -> Path:
+        """Path of the features of a frame"""
+        return self.directory / f"features_{frame}.npz"
+
+    def save(
+        self,
+        frame: int,
+        chain: List[npt.NDArray[Any]],
+        features: Tuple[Any, Optional[npt.NDArray[Any]]],
+        canvas: npt.NDArray[Any],
+    ) -> None:
+        """Save the progress after a frame was pasted into the canvas"""
+        mapped = np.lib.format.open_memmap(  # type: ignore[no-untyped-call]
+            self._canvas_path(frame), mode="w+", dtype=canvas.dtype, shape=canvas.shape
+        )
+        mapped[...] = canvas
+        mapped.flush()
+        del mapped
+        arrays = {"keypoints": pack_keypoints(features[0])}
+        if features[1] is not None:
+            arrays["descriptors"] = features[1]
+        np.savez(self._features_path(frame), **arrays)
+        temp_path = self.directory / "state.tmp.npz"
+        np.savez(
+            temp_path,
+            frame=frame,
+            chain=np.array(chain),
+            canvas=self._canvas_path(frame).name,
+            key=self.key,
+        )
+        os.replace(temp_path, self.state_path)
+        current = [self._canvas_path(frame), self._features_path(frame)]
+        for path in self._frame_files():
+            if path not in current:
+                path.unlink()
+        logger.info("Checkpoint saved after frame %s to %s", frame, self.directory)
+
+    def load(
+        self,
+    ) -> Optional[
+        Tuple[
+            int,
+            List[npt.NDArray[Any]],
+            Tuple[Any, Optional[npt.NDArray[Any]]],
+            npt.NDArray[Any],
+        ]
+    ]:
+        """Return the frame, chain, features of the frame and canvas of the last checkpoint of the same stitch or None"""
+        if not self.state_path.exists():
+            return None
+        with np.load(self.state_path) as state:
+            if str(state["key"]) != self.key:
+                logger.warning(
+                    "The checkpoint in %s is of other images or settings and is ignored.",
+                    self.directory,
+                )
+                return None
+            frame = int(state["frame"])
+            chain = list(state["chain"])
+            canvas_path = self.directory / str(state["canvas"])
+        with np.load(self._features_path(frame)) as arrays:
+            features = (
+                unpack_keypoints(arrays["keypoints"]),
+                arrays["descriptors"] if "descriptors" in arrays else None,
+            )
+        canvas = np.array(np.load(canvas_path, mmap_mode="r"))
+        return frame, chain, features, canvas
+
+    def _frame_files(self) -> List[Path]:
+        """Canvas and feature files of all the checkpointed frames"""
+        return list(self.directory.glob("canvas_*.npy")) + list(
+            self.directory.glob("features_*.npz")
+        )
+
+    def clear(self) -> None:
+        """Remove the files of the checkpoint after the stitch is finished, and its directory once it is empty"""
+        paths = [self.state_path, self.directory / "state.tmp.npz"]
+        for path in paths + self._frame_files():
+            path.unlink(missing_ok=True)
+        if not any(self.directory.iterdir()):
+            self.directory.rmdir()
@@ -1,17 +1,58 @@
 """This a detailed stitcher based on stitching library"""
 
 from dataclasses import dataclass, field
-from typing import Any, Mapping
+from typing import Any, Dict, Mapping, List, Optional, Set, Tuple
+import json
 import logging
 import cv2
+import numpy as np
+import numpy.typing as npt
 from stitching import Stitcher
+from stitching.cropper import Rectangle
+from stitching.images import Images
+from stitching.subsetter import Subsetter
+from .presets import PRESETS
+from .profiling import profile_methods
+from .pair_pruning import candidate_pairs, global_signatures, matching_mask
+from .geo_index import ground_positions, read_poses, spatial_pairs
+from .cache import cached_result
 from .utility import ImageLoader
 
 logger = logging.getLogger(__name__)
 
+# Span names of the stages of the stitching library, the final resolution stages are lazy and timed per image
+STAGES = {
+    "resize_medium_resolution": "resize",
+    "find_features": "detection",
+    "match_features": "matching",
+    "estimate_camera_parameters": "camera_estimation",
+    "refine_camera_parameters": "bundle_adjustment",
+    "warp_low_resolution": "warping",
+    "estimate_exposure_errors": "exposure",
+    "find_seam_masks": "seam_finding",
+    "resize_final_resolution": "resize",
+    "warp_final_resolution": "warping",
+    "compensate_exposure_errors": "exposure",
+    "blend_images": "blending",
+    "create_final_panorama": "blending",
+}
+
+
+class _MaskedStitcher(Stitcher):  # type: ignore[misc]
+    """Stitcher of the stitching library that only matches the image pairs of a matching mask"""
+
+    def __init__(self, mask: Optional[npt.NDArray[np.uint8]], **kwargs: Any) -> None:
+        self.matching_mask = mask
+        super().__init__(**kwargs)
+
+    def match_features(self, features: Any) -> Any:
+        if self.matching_mask is None:
+            return super().match_features(features)
+        return self.matcher.match_features(features, self.matching_mask)
+
 
 @dataclass
-class DetailedStitcher(ImageLoader):
+class DetailedStitcher(ImageLoader):  # pylint: disable=too-many-instance-attributes
     """Detailed stitcher class"""
 
     feature_number: int = field(default=500)
@@ -20,13 +61,21 @@ class DetailedStitcher(ImageLoader):
     confidence_threshold: float = field(default=0.5)
     camera_estimator: str = field(default="homography")
     camera_adjustor: str = field(default="ray")
+    preset: Optional[str] = field(default=None)
+    overrides: Dict[str, Any] = field(default_factory=dict)
+    candidate_neighbours: Optional[int] = field(default=None)
+    geo_pairs: bool = field(default=False)
 
     def __post_init__(self) -> None:
         """Check if the matcher is defined or not and other post-processing requirements"""
+        if self.preset is not None and self.preset not in PRESETS:
+            raise ValueError(
+                f"The preset {self.preset} is not defined. Use one of {list(PRESETS)}"
+            )
         self.opencv_load_images()
 
     def _create_config(self) -> Mapping[str, Any]:
-        return {
+        config = {
             "nfeatures": self.feature_number,
             "detector": self.detector_method,
             "matcher_type": self.matcher_type,
@@ -35,14 +84,191 @@ class DetailedStitcher(ImageLoader):
             "estimator": self.camera_estimator,
             "adjuster": self.camera_adjustor,
         }
+        if self.preset is not None:
+            config.update(PRESETS[self.preset])
+        config.update(self.overrides)
+        return config
 
+    def _matching_mask(self) -> Optional[npt.NDArray[np.uint8]]:
+        """Mask of the candidate image pairs from global signatures and GPS positions or None to match all pairs"""
+        if self.candidate_neighbours is None and not self.geo_pairs:
+            return None
+        pairs: Set[Tuple[int, int]] = set()
+        if self.candidate_neighbours is not None:
+            pairs |= candidate_pairs(
+                global_signatures(self.images), self.candidate_neighbours
+            )
+        if self.geo_pairs:
+            pairs |= spatial_pairs(ground_positions(read_poses(self._sources())))
+        logger.info(
+            "Matching %s candidate pairs out of %s pairs.",
+            len(pairs),
+            len(self.images) * (len(self.images) - 1) // 2,
+        )
+        return matching_mask(pairs, len(self.images))
+
+    def _create_stitcher(self) -> Stitcher:
+        """Create the stitcher of the stitching library"""
+        image_stitcher = _MaskedStitcher(self._matching_mask(), **self._create_config())
+        profile_methods(image_stitcher, STAGES)
+        return image_stitcher
+
+    def _create_images(self, image_stitcher: Stitcher) -> Images:
+        """Wrap the loaded images with the resolutions of the stitching library"""
+        return Images.of(
+            self.images,
+            image_stitcher.medium_megapix,
+            image_stitcher.low_megapix,
+            image_stitcher.final_megapix,
+        )
+
+    @cached_result
     def stitcher(self, result_path: str = "", framer: bool = True) -> Any:
         """Stitcher based on stitching library"""
-        image_stitcher = Stitcher(**self._create_config())
+        image_stitcher = self._create_stitcher()
         stitched_image = image_stitcher.stitch(self.images)
         logger.info("Stitching images was successful.")
+        return self._finalize(stitched_image, result_path, framer)
+
+    def _finalize(self, stitched_image: Any, result_path: str, framer: bool) -> Any:
+        """Save the stitched image if requested and return it without black areas"""
         if result_path != "":
             self.save_result(
                 cv2.cvtColor(stitched_image, cv2.COLOR_BGR2RGB), result_path, framer
             )
         return self.remove_black_areas(cv2.cvtColor(stitched_image, cv2.COLOR_BGR2RGB))
+
+    def _estimate_rig(self, image_stitcher: Stitcher) -> Tuple[List[int], Any, Any]:
+        """Run the registration and seam estimation stages of the stitching library"""
+        image_stitcher.images = self._create_images(image_stitcher)
+        imgs = image_stitcher.resize_medium_resolution()
+        features = image_stitcher.find_features(imgs)
+        matches = image_stitcher.match_features(features)
+        indices = image_stitcher.subsetter.subset(
+            image_stitcher.images.names, features, matches
+        )
+        imgs = Subsetter.subset_list(imgs, indices)
+        features = Subsetter.subset_list(features, indices)
+        matches = Subsetter.subset_matches(matches, indices)
+        image_stitcher.images.subset(indices)
+        cameras = image_stitcher.estimate_camera_parameters(features, matches)
+        cameras = image_stitcher.refine_camera_parameters(features, matches, cameras)
+        cameras = image_stitcher.perform_wave_correction(cameras)
+        image_stitcher.estimate_scale(cameras)
+
+        imgs = image_stitcher.resize_low_resolution(imgs)
+        imgs, masks, corners, sizes = image_stitcher.warp_low_resolution(imgs, cameras)
+        image_stitcher.prepare_cropper(imgs, masks, corners, sizes)
+        imgs, masks, corners, sizes = image_stitcher.crop_low_resolution(
+            imgs, masks, corners, sizes
+        )
+        image_stitcher.estimate_exposure_errors(corners, imgs, masks)
+        return indices, cameras, image_stitcher.find_seam_masks(imgs, corners, masks)
+
+    def calibrate(self, calibration_path: str) -> None:
+        """Estimate cameras, seams and exposure gains once and save them for a fixed camera rig"""
+        image_stitcher = self._create_stitcher()
+        indices, cameras, seam_masks = self._estimate_rig(image_stitcher)
+        calibration = {
+            "config": np.array(json.dumps(self._create_config())),
+            "indices": np.asarray(indices, dtype=np.int64),
+            "image_sizes": np.asarray(
+                [Images.get_image_size(img) for img in self.images], dtype=np.int64
+            ),
+            "warper_scale": np.asarray(image_stitcher.warper.scale),
+            "camera_intrinsics": np.asarray(
+                [[cam.focal, cam.aspect, cam.ppx, cam.ppy] for cam in cameras]
+            ),
+            "camera_rotations": np.asarray([cam.R for cam in cameras]),
+            "camera_translations": np.asarray([cam.t for cam in cameras]),
+        }
+        if image_stitcher.cropper.do_crop:
+            calibration["overlapping_rectangles"] = np.asarray(
+                image_stitcher.cropper.overlapping_rectangles, dtype=np.int64
+            )
+            calibration["intersection_rectangles"] = np.asarray(
+                image_stitcher.cropper.intersection_rectangles, dtype=np.int64
+            )
+        for idx, seam_mask in enumerate(seam_masks):
+            calibration[f"seam_mask_{idx}"] = cv2.UMat.get(seam_mask)
+        for idx, gain in enumerate(
+            image_stitcher.compensator.compensator.getMatGains()
+        ):
+            calibration[f"gain_{idx}"] = np.asarray(gain)
+        with open(calibration_path, "wb") as calibration_file:
+            np.savez(calibration_file, **calibration)
+        logger.info(
+            "Rig calibration of %s images saved to %s", len(indices), calibration_path
+        )
+
+    def _restore_rig(self, calibration_path: str) -> Tuple[Stitcher, Any, Any]:
+        """Restore a stitching library stitcher with the state of a saved rig calibration"""
+        with np.load(calibration_path) as calibration:
+            data = dict(calibration)
+        image_sizes = [tuple(size) for size in data["image_sizes"].tolist()]
+        if [Images.get_image_size(img) for img in self.images] != image_sizes:
+            raise ValueError(
+                "Image sizes do not match the sizes used for the rig calibration."
+            )
+        image_stitcher = Stitcher(**json.loads(str(data["config"])))
+        profile_methods(image_stitcher, STAGES)
+        image_stitcher.images = self._create_images(image_stitcher)
+        image_stitcher.images.subset(data["indices"].tolist())
+        image_stitcher.warper.scale = float(data["warper_scale"])
+        if image_stitcher.cropper.do_crop:
+            image_stitcher.cropper.overlapping_rectangles = [
+                Rectangle(*rect) for rect in data["overlapping_rectangles"].tolist()
+            ]
+            image_stitcher.cropper.intersection_rectangles = [
+                Rectangle(*rect) for rect in data["intersection_rectangles"].tolist()
+            ]
+        gains = [data[f"gain_{idx}"] for idx in range(self._count_keys(data, "gain_"))]
+        if gains:
+            image_stitcher.compensator.compensator.setMatGains(gains)
+        seam_masks = [
+            cv2.UMat(data[f"seam_mask_{idx}"])
+            for idx in range(self._count_keys(data, "seam_mask_"))
+        ]
+        return image_stitcher, self._load_cameras(data), seam_masks
+
+    def compose(
+        self, calibration_path: str, result_path: str = "", framer: bool = True
+    ) -> Any:
+        """Compose the loaded images with a saved rig calibration without any feature work"""
+        image_stitcher, cameras, seam_masks = self._restore_rig(calibration_path)
+        imgs = image_stitcher.resize_final_resolution()
+        imgs, masks, corners, sizes = image_stitcher.warp_final_resolution(
+            imgs, cameras
+        )
+        imgs, masks, corners, sizes = image_stitcher.crop_final_resolution(
+            imgs, masks, corners, sizes
+        )
+        image_stitcher.set_masks(masks)
+        imgs = image_stitcher.compensate_exposure_errors(corners, imgs)
+        seam_masks = image_stitcher.resize_seam_masks(seam_masks)
+        image_stitcher.initialize_composition(corners, sizes)
+        image_stitcher.blend_images(imgs, seam_masks, corners)
+        stitched_image = image_stitcher.create_final_panorama()
+        logger.info("Composing images with the rig calibration was successful.")
+        return self._finalize(stitched_image, result_path, framer)
+
+    @staticmethod
+    def _count_keys(data: Mapping[str, Any], prefix: str) -> int:
+        """Count the indexed entries with the given prefix in a calibration file"""
+        return len([key for key in data if key.startswith(prefix)])
+
+    @staticmethod
+    def _load_cameras(data: Mapping[str, Any]) -> List[Any]:
+        """Rebuild the opencv camera parameters from a calibration file"""
+        cameras = []
+        for intrinsics, rotation, translation in zip(
+            data["camera_intrinsics"],
+            data["camera_rotations"],
+            data["camera_translations"],
+        ):
+            camera = cv2.detail.CameraParams()
+            camera.focal, camera.aspect, camera.ppx, camera.ppy = intrinsics.tolist()
+            camera.R = rotation
+            camera.t = translation
+            cameras.append(camera)
+        return cameras
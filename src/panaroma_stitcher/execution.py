@@ -0,0 +1,113 @@
+"""Split of the CPUs between worker pools and the thread pools of opencv, torch and numba"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import logging
+import math
+import os
+import sys
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Thread pools of the native libraries that read their size from the environment when they are first imported
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+]
+
+
+def cpu_affinity() -> List[int]:
+    """CPUs the process is allowed to run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cgroup_cpus(path: str = "/sys/fs/cgroup/cpu.max") -> Optional[int]:
+    """CPU quota of the container as a number of CPUs or None without a quota"""
+    try:
+        with open(path, "r", encoding="utf-8") as quota_file:
+            quota, period = quota_file.read().split()[:2]
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return max(math.ceil(int(quota) / int(period)), 1)
+
+
+def available_cpus() -> int:
+    """Number of CPUs of the affinity mask limited by the container quota"""
+    cpus = len(cpu_affinity())
+    quota = cgroup_cpus()
+    return min(cpus, quota) if quota else cpus
+
+
+@dataclass
+class ExecutionConfig:
+    """Split the available CPUs between the workers of a pool (outer) and the library threads of every worker (inner).
+
+    Without threads, every worker gets an equal share of the CPUs. apply() sizes the opencv, torch and numba thread
+    pools of the current process and must be called in every worker process.
+    """
+
+    workers: int = field(default=1)
+    threads: Optional[int] = field(default=None)
+    interop_threads: Optional[int] = field(default=None)
+
+    def threads_per_worker(self) -> int:
+        """Inner threads of every worker"""
+        if self.threads is not None:
+            return max(self.threads, 1)
+        return max(available_cpus() // max(self.workers, 1), 1)
+
+    def apply(self) -> Dict[str, Any]:
+        """Size the thread pools of the libraries in this process and return the effective thread counts"""
+        threads = self.threads_per_worker()
+        if self.workers * threads > available_cpus():
+            logger.warning(
+                "%s workers with %s threads oversubscribe %s CPUs.",
+                self.workers,
+                threads,
+                available_cpus(),
+            )
+        for variable in THREAD_VARIABLES:
+            # numba reloads its environment when it compiles and refuses another size once its threads are launched
+            if variable != "NUMBA_NUM_THREADS" or "numba" not in sys.modules:
+                os.environ[variable] = str(threads)
+        cv2.setNumThreads(threads)
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(self.interop_threads or threads)
+            except RuntimeError:
+                # torch only accepts the interop threads before its first parallel work
+                logger.debug("The torch interop threads are already fixed.")
+        if "numba" in sys.modules:
+            numba = sys.modules["numba"]
+            numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+        report = self.report()
+        logger.info("Execution resources: %s", report)
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        """Effective thread counts of the libraries together with the CPU affinity and quota of the process"""
+        report: Dict[str, Any] = {
+            **asdict(self),
+            "threads_per_worker": self.threads_per_worker(),
+            "cpu_count": os.cpu_count(),
+            "cpu_affinity": cpu_affinity(),
+            "cgroup_cpus": cgroup_cpus(),
+            "opencv_threads": cv2.getNumThreads(),
+        }
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            report["torch_threads"] = torch.get_num_threads()
+            report["torch_interop_threads"] = torch.get_num_interop_threads()
+        if "numba" in sys.modules:
+            report["numba_threads"] = sys.modules["numba"].get_num_threads()
+        return report
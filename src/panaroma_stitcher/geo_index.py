@@ -0,0 +1,241 @@
+"""Camera positions from EXIF GPS and DJI XMP metadata for ordering aerial frames and pruning their matching pairs"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import io
+import logging
+import re
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6378137.0
+GPS_IFD = 0x8825
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+GPS_ALTITUDE_REF, GPS_ALTITUDE, GPS_IMG_DIRECTION = 5, 6, 17
+
+# The XMP packet of the drone metadata is stored in the first segments of the file
+XMP_HEAD_BYTES = 256 * 1024
+XMP_VALUE = re.compile(
+    rb"(RelativeAltitude|GimbalYawDegree|FlightYawDegree|GimbalPitchDegree)"
+    rb"(?:=\"|>)\s*([-+]?[0-9]*\.?[0-9]+)"
+)
+
+
+@dataclass
+class CameraPose:
+    """GPS position in degrees and orientation in degrees (yaw clockwise from north, pitch -90 at nadir) of a frame"""
+
+    latitude: float
+    longitude: float
+    altitude: Optional[float] = field(default=None)
+    relative_altitude: Optional[float] = field(default=None)
+    yaw: Optional[float] = field(default=None)
+    pitch: Optional[float] = field(default=None)
+
+
+def _degrees(dms: Sequence[Any], ref: str) -> float:
+    """Convert EXIF degrees, minutes and seconds to signed degrees"""
+    degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    return -degrees if ref in ["S", "W"] else degrees
+
+
+def _xmp_values(head: bytes) -> Dict[str, float]:
+    """Read the drone orientation and height above the take-off point from the XMP packet"""
+    return {name.decode(): float(value) for name, value in XMP_VALUE.findall(head)}
+
+
+def read_pose(source: Any) -> Optional[CameraPose]:
+    """Read the camera pose of an image path or encoded bytes from its headers without decoding the pixels"""
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as image_file:
+            head = image_file.read(XMP_HEAD_BYTES)
+        opened = Image.open(source)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        head = bytes(source[:XMP_HEAD_BYTES])
+        opened = Image.open(io.BytesIO(source))
+    else:
+        return None
+    with opened as image:
+        gps = image.getexif().get_ifd(GPS_IFD)
+    if GPS_LATITUDE not in gps or GPS_LONGITUDE not in gps:
+        return None
+    xmp = _xmp_values(head)
+    altitude = gps.get(GPS_ALTITUDE)
+    if altitude is not None:
+        altitude = (
+            -float(altitude) if gps.get(GPS_ALTITUDE_REF) == 1 else float(altitude)
+        )
+    yaw = xmp.get("GimbalYawDegree", xmp.get("FlightYawDegree"))
+    if yaw is None and GPS_IMG_DIRECTION in gps:
+        yaw = float(gps[GPS_IMG_DIRECTION])
+    return CameraPose(
+        _degrees(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF, "N")),
+        _degrees(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF, "E")),
+        altitude,
+        xmp.get("RelativeAltitude"),
+        yaw,
+        xmp.get("GimbalPitchDegree"),
+    )
+
+
+def read_poses(sources: Sequence[Any], workers: int = 8) -> List[Optional[CameraPose]]:
+    """Read the camera poses of many images on a thread pool since reading the headers is bound by the file system"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_pose, sources))
+
+
+def ground_positions(poses: Sequence[Optional[CameraPose]]) -> npt.NDArray[np.float64]:
+    """Return the (east, north) metres of the ground point at the image centres around their mean, NaN without GPS.
+
+    For oblique frames with a gimbal pitch, yaw and height, the position moves from the camera towards the view
+    direction by up to three times the height.
+    """
+    positions = np.full((len(poses), 2), np.nan)
+    located = [(idx, pose) for idx, pose in enumerate(poses) if pose is not None]
+    if not located:
+        return positions
+    latitude = np.mean([pose.latitude for _, pose in located])
+    longitude = np.mean([pose.longitude for _, pose in located])
+    for idx, pose in located:
+        positions[idx] = (
+            np.radians(pose.longitude - longitude)
+            * EARTH_RADIUS
+            * np.cos(np.radians(latitude)),
+            np.radians(pose.latitude - latitude) * EARTH_RADIUS,
+        )
+        if None not in (pose.yaw, pose.pitch, pose.relative_altitude):
+            height = abs(float(pose.relative_altitude))  # type: ignore[arg-type]
+            tilt = np.radians(90 + float(pose.pitch))  # type: ignore[arg-type]
+            offset = min(height * np.tan(np.clip(tilt, 0, np.radians(89))), 3 * height)
+            yaw = np.radians(float(pose.yaw))  # type: ignore[arg-type]
+            positions[idx] += offset * np.array([np.sin(yaw), np.cos(yaw)])
+    return positions
+
+
+@dataclass
+class GridIndex:
+    """Uniform grid over 2D positions whose radius queries only visit the cells around the query point"""
+
+    positions: npt.NDArray[np.float64]
+    cell: float
+    buckets: Dict[Tuple[int, int], List[int]] = field(
+        init=False, default_factory=dict, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        """Put every valid position into the bucket of its cell"""
+        for idx, position in enumerate(self.positions):
+            if not np.isnan(position).any():
+                self.buckets.setdefault(self._cell_of(position), []).append(idx)
+
+    def _cell_of(self, position: npt.NDArray[np.float64]) -> Tuple[int, int]:
+        """Cell of a position"""
+        return int(position[0] // self.cell), int(position[1] // self.cell)
+
+    def query(self, position: npt.NDArray[np.float64], radius: float) -> List[int]:
+        """Return the indexes of the positions within radius of a position"""
+        col, row = self._cell_of(position)
+        reach = int(np.ceil(radius / self.cell))
+        found = []
+        for cell_col in range(col - reach, col + reach + 1):
+            for cell_row in range(row - reach, row + reach + 1):
+                for idx in self.buckets.get((cell_col, cell_row), []):
+                    if np.hypot(*(self.positions[idx] - position)) <= radius:
+                        found.append(idx)
+        return found
+
+    def nearest(self, idx: int, exclude: Optional[Set[int]] = None) -> Optional[int]:
+        """Return the closest other position that is not excluded by searching in growing radii"""
+        exclude = exclude or set()
+        valid = sum(len(bucket) for bucket in self.buckets.values())
+        if len(exclude) + (idx not in exclude) >= valid:
+            return None
+        radius = self.cell
+        while True:
+            candidates = [
+                other
+                for other in self.query(self.positions[idx], radius)
+                if other != idx and other not in exclude
+            ]
+            if candidates:
+                return min(
+                    candidates,
+                    key=lambda other: float(
+                        np.hypot(*(self.positions[other] - self.positions[idx]))
+                    ),
+                )
+            radius *= 2
+
+
+def create_index(positions: npt.NDArray[np.float64]) -> GridIndex:
+    """Create a grid index with about one position per cell"""
+    valid = positions[~np.isnan(positions).any(axis=1)]
+    if len(valid) < 2:
+        return GridIndex(positions, 1.0)
+    extent = np.ptp(valid, axis=0)
+    # Frames along a single flight line have no area
+    cell = max(np.sqrt(extent[0] * extent[1] / len(valid)), extent.max() / len(valid))
+    return GridIndex(positions, max(float(cell), 1e-3))
+
+
+def spatial_pairs(
+    positions: npt.NDArray[np.float64],
+    radius: Optional[float] = None,
+    factor: float = 2.5,
+) -> Set[Tuple[int, int]]:
+    """Return the (i, j) pairs with i < j of the frames within radius of each other.
+
+    The default radius is factor times the median distance between nearest neighbours, which is the spacing of the
+    survey. Every frame is also paired with its nearest neighbour, and frames without a position with all frames.
+    """
+    index = create_index(positions)
+    located = [
+        idx for idx in range(len(positions)) if not np.isnan(positions[idx]).any()
+    ]
+    nearest = {idx: index.nearest(idx) for idx in located}
+    pairs = {
+        (min(idx, other), max(idx, other))
+        for idx, other in nearest.items()
+        if other is not None
+    }
+    if radius is None and pairs:
+        radius = factor * float(
+            np.median([np.hypot(*(positions[i] - positions[j])) for i, j in pairs])
+        )
+    for idx in located:
+        for other in index.query(positions[idx], radius or 0.0):
+            if other != idx:
+                pairs.add((min(idx, other), max(idx, other)))
+    unlocated = set(range(len(positions))) - set(located)
+    for idx in unlocated:
+        pairs |= {
+            (min(idx, other), max(idx, other))
+            for other in range(len(positions))
+            if other != idx
+        }
+    return pairs
+
+
+def geo_order(positions: npt.NDArray[np.float64]) -> List[int]:
+    """Order the frames along a path that always moves to the closest unvisited frame, starting from the first frame.
+
+    This follows the flight lines of a survey so that consecutive frames overlap. Frames without a position keep
+    their order at the end.
+    """
+    index = create_index(positions)
+    unlocated = [idx for idx in range(len(positions)) if np.isnan(positions[idx]).any()]
+    order: List[int] = []
+    visited: Set[int] = set()
+    current = next((idx for idx in range(len(positions)) if idx not in unlocated), None)
+    while current is not None:
+        order.append(current)
+        visited.add(current)
+        current = index.nearest(current, visited)
+    return order + unlocated
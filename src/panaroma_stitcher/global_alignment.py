@@ -0,0 +1,402 @@
+"""Global refinement of the homographies of all frames over sequential and loop-closure pairs with a sparse solver"""
+
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+import logging
+import time
+import numpy as np
+import numpy.typing as npt
+
+from .geo_index import create_index
+
+logger = logging.getLogger(__name__)
+
+# A constraint is (i, j, points of frame i, points of frame j) of the same scene points
+Constraint = Tuple[int, int, npt.NDArray[Any], npt.NDArray[Any]]
+
+
+def frame_centres(
+    homographies: Sequence[npt.NDArray[Any]], shapes: Sequence[Tuple[int, ...]]
+) -> npt.NDArray[np.float64]:
+    """Return the centres of the frames projected into the first frame"""
+    centres = np.array([[shape[1] / 2, shape[0] / 2, 1.0] for shape in shapes]).reshape(
+        -1, 3
+    )
+    projected = np.einsum("nab,nb->na", np.asarray(homographies), centres)
+    return np.asarray(projected[:, :2] / projected[:, 2:])
+
+
+def loop_candidates(
+    homographies: Sequence[npt.NDArray[Any]],
+    shapes: Sequence[Tuple[int, ...]],
+    neighbours: int = 2,
+    min_gap: int = 2,
+) -> List[Tuple[int, int]]:
+    """Return the (i, j) pairs with j - i >= min_gap whose frames overlap in the chained estimate.
+
+    Every frame gets at most its neighbours closest frames within one frame size, so the number of pairs grows linearly
+    with the number of frames. The frames are found with a grid index of their projected centres.
+    """
+    centres = frame_centres(homographies, shapes)
+    index = create_index(centres)
+    radius = float(np.mean([max(shape[:2]) for shape in shapes]))
+    pairs: Set[Tuple[int, int]] = set()
+    for idx, centre in enumerate(centres):
+        others = np.array(
+            [
+                other
+                for other in index.query(centre, radius)
+                if abs(other - idx) >= min_gap
+            ],
+            dtype=int,
+        )
+        distances = np.linalg.norm(centres[others] - centre, axis=1)
+        others = others[np.argsort(distances, kind="stable")[:neighbours]]
+        pairs |= {(min(idx, int(other)), max(idx, int(other))) for other in others}
+    return sorted(pairs)
+
+
+def _normalizers(
+    shapes: Sequence[Tuple[int, ...]],
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Return the transforms of every frame to coordinates around 0 of about unit size and the pixels per unit"""
+    transforms = np.array(
+        [
+            [
+                [2 / max(shape[:2]), 0, -shape[1] / max(shape[:2])],
+                [0, 2 / max(shape[:2]), -shape[0] / max(shape[:2])],
+                [0, 0, 1],
+            ]
+            for shape in shapes
+        ]
+    )
+    return transforms, np.array([max(shape[:2]) / 2 for shape in shapes], float)
+
+
+def _parameter_jacobian(points: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Return the derivatives of H @ points by the 8 parameters of H for homogeneous points"""
+    jacobian = np.zeros((len(points), 3, 8))
+    jacobian[:, 0, 0:3] = points
+    jacobian[:, 1, 3:6] = points
+    jacobian[:, 2, 6:8] = points[:, :2]
+    return jacobian
+
+
+def _homographies(params: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Return the homographies of rows of 8 parameters"""
+    return np.asarray(
+        np.concatenate([params, np.ones((len(params), 1))], axis=1).reshape((-1, 3, 3))
+    )
+
+
+class _System:  # pylint: disable=too-many-instance-attributes
+    """Correspondences of all constraints in the normalized coordinates of their frames, in both directions.
+
+    Every point of a frame is transferred through the mosaic into the other frame and compared there, so the residuals
+    are in pixels of the frames and do not change with the coordinates of the mosaic.
+    """
+
+    def __init__(
+        self,
+        constraints: Sequence[Constraint],
+        transforms: npt.NDArray[np.float64],
+        scales: npt.NDArray[np.float64],
+    ) -> None:
+        """Stack the points of all the constraints with the indexes of their frames and pairs"""
+        self.pair_i = np.array([i for i, _, _, _ in constraints], dtype=int)
+        self.pair_j = np.array([j for _, j, _, _ in constraints], dtype=int)
+        counts = [len(points) for _, _, points, _ in constraints]
+        pair = np.repeat(np.arange(len(constraints)), counts)
+        self.pair = np.concatenate([pair, pair])
+        self.frame_i, self.frame_j = self.pair_i[self.pair], self.pair_j[self.pair]
+        self.forward = np.arange(len(self.pair)) < len(pair)
+        self.source = np.where(self.forward, self.frame_i, self.frame_j)
+        self.target = np.where(self.forward, self.frame_j, self.frame_i)
+        points_i = [points for _, _, points, _ in constraints]
+        points_j = [points for _, _, _, points in constraints]
+        self.source_points = self._normalize(
+            points_i + points_j, transforms[self.source]
+        )
+        self.target_points = self._normalize(
+            points_j + points_i, transforms[self.target]
+        )
+        self.scales = scales[self.target]
+
+    @staticmethod
+    def _normalize(
+        points: Sequence[npt.NDArray[Any]], transforms: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        """Apply the normalizing transform of the frame of every point"""
+        stacked = np.concatenate([np.reshape(part, (-1, 2)) for part in points])
+        normalized = transforms[:, :2, :2] @ stacked[..., None]
+        return np.asarray(normalized[..., 0] + transforms[:, :2, 2], np.float64)
+
+    def residuals(
+        self, params: npt.NDArray[np.float64]
+    ) -> Tuple[
+        npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]
+    ]:
+        """Return the pixel offsets of the transferred points and their Jacobians by the frames of their pairs"""
+        homographies = _homographies(params)
+        inverses = np.linalg.inv(homographies)[self.target]
+        source = np.concatenate(
+            [self.source_points, np.ones((len(self.source_points), 1))], axis=1
+        )
+        mosaic = np.einsum("mab,mb->ma", homographies[self.source], source)
+        transferred = np.einsum("mab,mb->ma", inverses, mosaic)
+        depth = transferred[:, 2:]
+        offsets = (transferred[:, :2] / depth - self.target_points) * self.scales[
+            :, None
+        ]
+        projection = np.zeros((len(depth), 2, 3))
+        projection[:, 0, 0] = projection[:, 1, 1] = 1 / depth[:, 0]
+        projection[:, :, 2] = -transferred[:, :2] / depth**2
+        projection = projection * self.scales[:, None, None] @ inverses
+        jacobian_source = projection @ _parameter_jacobian(source)
+        jacobian_target = -projection @ _parameter_jacobian(transferred)
+        forward = self.forward[:, None, None]
+        return (
+            offsets,
+            np.where(forward, jacobian_source, jacobian_target),
+            np.where(forward, jacobian_target, jacobian_source),
+        )
+
+    def summary(self, params: npt.NDArray[np.float64]) -> Dict[str, float]:
+        """Return the RMS and max residuals in pixels, overall and of the loop-closure pairs"""
+        errors = np.linalg.norm(self.residuals(params)[0], axis=1)
+        loop = np.abs(self.frame_j - self.frame_i) > 1
+        return {
+            "rms_px": float(np.sqrt(np.mean(errors**2))) if len(errors) else 0.0,
+            "max_px": float(errors.max()) if len(errors) else 0.0,
+            "loop_rms_px": (
+                float(np.sqrt(np.mean(errors[loop] ** 2))) if loop.any() else 0.0
+            ),
+        }
+
+
+def _huber(distances: npt.NDArray[np.float64], delta: float) -> float:
+    """Return the Huber cost of distances, quadratic up to delta and linear after it"""
+    return float(
+        np.sum(
+            np.where(distances <= delta, distances**2, 2 * delta * distances - delta**2)
+        )
+    )
+
+
+def _scatter(
+    index: npt.NDArray[Any], values: npt.NDArray[np.float64], count: int
+) -> npt.NDArray[np.float64]:
+    """Return the sums of the rows of values with the same index, of any trailing shape"""
+    sums = np.zeros((count, *values.shape[1:]))
+    if len(index) == 0:
+        return sums
+    order = np.argsort(index, kind="stable")
+    present, starts = np.unique(index[order], return_index=True)
+    sums[present] = np.add.reduceat(values[order], starts, axis=0)
+    return sums
+
+
+def _spatial_groups(
+    centres: npt.NDArray[np.float64], max_groups: int
+) -> npt.NDArray[np.int_]:
+    """Return the group of every frame in a grid of at most max_groups cells with about as many frames each"""
+    count = len(centres)
+    strips = max(1, int(np.sqrt(min(count, max_groups))))
+    cells = max(1, min(count, max_groups) // strips)
+    groups = np.zeros(count, dtype=int)
+    by_x = np.argsort(centres[:, 0], kind="stable")
+    for strip, members in enumerate(np.array_split(by_x, strips)):
+        by_y = members[np.argsort(centres[members, 1], kind="stable")]
+        for cell, cell_members in enumerate(np.array_split(by_y, cells)):
+            groups[cell_members] = strip * cells + cell
+    return np.asarray(np.unique(groups, return_inverse=True)[1], int)
+
+
+class _Preconditioner:  # pylint: disable=too-few-public-methods
+    """Block Jacobi preconditioner with an exact solve over groups of nearby frames.
+
+    The conjugate gradient alone needs many iterations for the smooth bends of the whole mosaic, and the updates that
+    are equal within every group of frames that are close in the mosaic remove them with one dense solve.
+    """
+
+    def __init__(
+        self,
+        diagonal: npt.NDArray[np.float64],
+        off_diagonal: npt.NDArray[np.float64],
+        pairs: Tuple[npt.NDArray[Any], npt.NDArray[Any]],
+        groups: npt.NDArray[Any],
+    ) -> None:
+        """Invert the diagonal blocks and the system restricted to the groups"""
+        self.inverses = np.linalg.inv(diagonal)
+        self.groups = groups
+        self.size = int(groups.max()) + 1
+        group_i, group_j = groups[pairs[0]], groups[pairs[1]]
+        cells = self.size * self.size
+        coarse = _scatter(groups * (self.size + 1), diagonal, cells)
+        coarse += _scatter(group_i * self.size + group_j, off_diagonal, cells)
+        coarse += _scatter(
+            group_j * self.size + group_i, off_diagonal.transpose(0, 2, 1), cells
+        )
+        self.coarse_inverse = np.linalg.inv(
+            coarse.reshape((self.size, self.size, 8, 8))
+            .transpose(0, 2, 1, 3)
+            .reshape((self.size * 8, self.size * 8))
+        )
+
+    def solve(self, rhs: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Apply the block Jacobi and the group solve to a right-hand side"""
+        restricted = _scatter(self.groups, rhs, self.size).ravel()
+        coarse = (self.coarse_inverse @ restricted).reshape(self.size, 8)
+        return np.asarray(
+            np.einsum("nab,nb->na", self.inverses, rhs) + coarse[self.groups]
+        )
+
+
+def _solve_blocks(  # pylint: disable=R0913, R0914, R0917
+    diagonal: npt.NDArray[np.float64],
+    off_diagonal: npt.NDArray[np.float64],
+    pairs: Tuple[npt.NDArray[Any], npt.NDArray[Any]],
+    rhs: npt.NDArray[np.float64],
+    groups: npt.NDArray[Any],
+    max_iterations: int = 100,
+    tolerance: float = 1e-6,
+) -> Tuple[npt.NDArray[np.float64], int]:
+    """Solve a block-sparse symmetric positive definite system with the preconditioned conjugate gradient.
+
+    The matrix has the 8x8 diagonal blocks of the frames and the off-diagonal block (i, j) of every pair.
+    """
+    count = len(diagonal)
+
+    def multiply(vector: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        product = np.einsum("nab,nb->na", diagonal, vector)
+        product += _scatter(
+            pairs[0], np.einsum("pab,pb->pa", off_diagonal, vector[pairs[1]]), count
+        )
+        product += _scatter(
+            pairs[1], np.einsum("pba,pb->pa", off_diagonal, vector[pairs[0]]), count
+        )
+        return np.asarray(product)
+
+    preconditioner = _Preconditioner(diagonal, off_diagonal, pairs, groups)
+    solution = np.zeros_like(rhs)
+    residual = rhs.copy()
+    preconditioned = preconditioner.solve(residual)
+    direction = preconditioned.copy()
+    product = float(np.sum(residual * preconditioned))
+    threshold = tolerance * max(float(np.sum(rhs * rhs)), 1e-300)
+    for iteration in range(max_iterations):
+        if float(np.sum(residual * residual)) <= threshold:
+            return solution, iteration
+        mapped = multiply(direction)
+        step = product / float(np.sum(direction * mapped))
+        solution += step * direction
+        residual -= step * mapped
+        preconditioned = preconditioner.solve(residual)
+        previous, product = product, float(np.sum(residual * preconditioned))
+        direction = preconditioned + product / previous * direction
+    return solution, max_iterations
+
+
+def refine(  # pylint: disable=R0914
+    homographies: Sequence[npt.NDArray[Any]],
+    constraints: Sequence[Constraint],
+    shapes: Sequence[Tuple[int, ...]],
+    iterations: int = 20,
+    huber_px: float = 2.0,
+    max_groups: int = 128,
+) -> Tuple[List[npt.NDArray[np.float64]], Dict[str, Any]]:
+    """Refine the homographies of all frames into the first frame by minimizing the distances of all correspondences.
+
+    Every constraint transfers the points of each of its frames into the other one, and the first frame is fixed.
+    Levenberg-Marquardt steps are solved inexactly with the block-sparse conjugate gradient, so every step costs time
+    linear in the number of frames and constraints. Its coarse correction solves over at most max_groups groups of
+    nearby frames. Correspondences further than huber_px apart are down-weighted.
+    Return the refined homographies and a report with the residuals before and after.
+    """
+    start = time.perf_counter()
+    count = len(homographies)
+    transforms, scales = _normalizers(shapes)
+    mosaic = np.diag([1 / scales[0], 1 / scales[0], 1.0])
+    normalized = mosaic @ np.asarray(homographies) @ np.linalg.inv(transforms)
+    params = (normalized / normalized[:, 2:, 2:]).reshape(count, 9)[:, :8]
+    system = _System(constraints, transforms, scales)
+    report: Dict[str, Any] = {
+        "frames": count,
+        "pairs": len(constraints),
+        "loop_pairs": int(np.sum(np.abs(system.pair_j - system.pair_i) > 1)),
+        "points": len(system.pair) // 2,
+        "before": system.summary(params),
+    }
+    groups = _spatial_groups(frame_centres(homographies, shapes), max_groups)
+
+    def total_cost(candidate: npt.NDArray[np.float64]) -> float:
+        return _huber(np.linalg.norm(system.residuals(candidate)[0], axis=1), huber_px)
+
+    damping, steps, solver_iterations = 1e-4, 0, 0
+    for steps in range(1, iterations + 1):
+        residuals, jacobian_i, jacobian_j = system.residuals(params)
+        weights = np.minimum(
+            1.0, huber_px / np.maximum(np.linalg.norm(residuals, axis=1), 1e-12)
+        )
+        cost = _huber(np.linalg.norm(residuals, axis=1), huber_px)
+        diagonal = np.zeros((count, 8, 8))
+        gradient = np.zeros((count, 8))
+        for frames, jacobian in [
+            (system.frame_i, jacobian_i),
+            (system.frame_j, jacobian_j),
+        ]:
+            weighted = jacobian.transpose(0, 2, 1) * weights[:, None, None]
+            diagonal += _scatter(frames, weighted @ jacobian, count)
+            gradient += _scatter(
+                frames, (weighted @ residuals[..., None])[..., 0], count
+            )
+        off_diagonal = _scatter(
+            system.pair,
+            jacobian_i.transpose(0, 2, 1) * weights[:, None, None] @ jacobian_j,
+            len(constraints),
+        )
+        # The first frame is fixed, and unconstrained parameters are kept by the damping
+        diagonal[0], gradient[0] = np.eye(8), 0
+        off_diagonal[(system.pair_i == 0) | (system.pair_j == 0)] = 0
+        while True:
+            damped = diagonal + damping * (
+                np.eye(8) * (np.einsum("naa->na", diagonal)[:, :, None] + 1e-9)
+            )
+            update, used = _solve_blocks(
+                damped,
+                off_diagonal,
+                (system.pair_i, system.pair_j),
+                -gradient,
+                groups,
+            )
+            solver_iterations += used
+            # The coarse correction and the inexact solve also move the first frame
+            update[0] = 0
+            candidate = params + update
+            candidate_cost = total_cost(candidate)
+            if candidate_cost <= cost or damping > 1e8:
+                break
+            damping *= 10
+        if candidate_cost > cost:
+            break
+        params, damping = candidate, max(damping / 10, 1e-8)
+        if cost - candidate_cost <= 1e-4 * cost:
+            break
+    refined = np.linalg.inv(mosaic) @ _homographies(params) @ transforms
+    refined /= refined[:, 2:, 2:]
+    report.update(
+        after=system.summary(params),
+        iterations=steps,
+        solver_iterations=solver_iterations,
+        seconds=time.perf_counter() - start,
+    )
+    logger.info(
+        "Global alignment of %s frames over %s pairs (%s loop closures): RMS residual %.2fpx -> %.2fpx in %.2fs",
+        count,
+        report["pairs"],
+        report["loop_pairs"],
+        report["before"]["rms_px"],
+        report["after"]["rms_px"],
+        report["seconds"],
+    )
+    return list(refined), report
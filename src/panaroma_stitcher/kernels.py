@@ -0,0 +1,122 @@
+"""Numba-compiled kernels for compositing and masking of BGR frames.
+
+The kernels are compiled on their first call and cached on disk. Import this module lazily since it imports numba.
+"""
+
+from typing import Any, Optional, Tuple
+
+import logging
+import numba
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+# Fixed-point weights of opencv for BGR2GRAY (14 bits). The thresholded masks are identical to
+# cvtColor + threshold for the thresholds below 5 that are used by the stitchers.
+GRAY_WEIGHTS = (1868, 9617, 4899)
+GRAY_SHIFT = 14
+
+
+@numba.njit(parallel=True, cache=True)  # type: ignore[misc]
+def _paste_kernel(  # pylint: disable=R0913, R0917
+    frame: Any,
+    canvas: Any,
+    thresh: int,
+    top: int,
+    bottom: int,
+    left: int,
+    right: int,
+) -> None:
+    """Copy the pixels of the frame that are brighter than thresh into the canvas in one pass over the ROI"""
+    for row in numba.prange(top, bottom):  # pylint: disable=not-an-iterable
+        for col in range(left, right):
+            gray = (
+                frame[row, col, 0] * GRAY_WEIGHTS[0]
+                + frame[row, col, 1] * GRAY_WEIGHTS[1]
+                + frame[row, col, 2] * GRAY_WEIGHTS[2]
+                + (1 << (GRAY_SHIFT - 1))
+            ) >> GRAY_SHIFT
+            if gray > thresh:
+                canvas[row, col, 0] = frame[row, col, 0]
+                canvas[row, col, 1] = frame[row, col, 1]
+                canvas[row, col, 2] = frame[row, col, 2]
+
+
+@numba.njit(parallel=True, cache=True)  # type: ignore[misc]
+def _mask_kernel(image: Any, mask: Any, border: int, thresh: int) -> None:
+    """Write 255 for the pixels brighter than thresh into a mask with a border"""
+    for row in numba.prange(image.shape[0]):  # pylint: disable=not-an-iterable
+        for col in range(image.shape[1]):
+            gray = (
+                image[row, col, 0] * GRAY_WEIGHTS[0]
+                + image[row, col, 1] * GRAY_WEIGHTS[1]
+                + image[row, col, 2] * GRAY_WEIGHTS[2]
+                + (1 << (GRAY_SHIFT - 1))
+            ) >> GRAY_SHIFT
+            mask[row + border, col + border] = 255 if gray > thresh else 0
+
+
+def supported(*images: Any) -> bool:
+    """Whether the kernels can process the images (contiguous 8-bit BGR arrays)"""
+    return all(
+        isinstance(image, np.ndarray)
+        and image.dtype == np.uint8
+        and image.ndim == 3
+        and image.shape[2] == 3
+        and image.flags.c_contiguous
+        for image in images
+    )
+
+
+def paste_nonblack(
+    frame: npt.NDArray[np.uint8],
+    canvas: npt.NDArray[np.uint8],
+    thresh: int = 1,
+    roi: Optional[Tuple[int, int, int, int]] = None,
+) -> npt.NDArray[np.uint8]:
+    """Paste the non-black pixels of a warped frame into the canvas in place.
+
+    This fuses the gray conversion, threshold, masks and addition of the opencv chain. roi is (top, bottom, left, right)
+    and only needs to cover the non-black pixels of the frame.
+    """
+    top, bottom, left, right = roi or (0, canvas.shape[0], 0, canvas.shape[1])
+    _paste_kernel(frame, canvas, thresh, top, bottom, left, right)
+    return canvas
+
+
+def nonblack_mask(
+    image: npt.NDArray[np.uint8], border: int = 0, thresh: int = 0
+) -> npt.NDArray[np.uint8]:
+    """Return the 255/0 mask of the pixels brighter than thresh with a black border around it"""
+    mask = np.zeros(
+        (image.shape[0] + 2 * border, image.shape[1] + 2 * border), dtype=np.uint8
+    )
+    _mask_kernel(image, mask, border, thresh)
+    return mask
+
+
+def frame_roi(
+    homography: npt.NDArray[Any],
+    image_shape: Tuple[int, ...],
+    canvas_shape: Tuple[int, ...],
+) -> Optional[Tuple[int, int, int, int]]:
+    """Return the (top, bottom, left, right) box of a warped image in the canvas, or None if it cannot be bounded"""
+    height, width = image_shape[:2]
+    # One extra pixel around the image covers the pixels interpolated with the black border
+    corners = np.array(
+        [[-1, -1, 1], [width, -1, 1], [width, height, 1], [-1, height, 1]],
+        dtype=np.float64,
+    )
+    projected = corners @ np.asarray(homography, dtype=np.float64).T
+    if np.any(projected[:, 2] <= 1e-9):
+        return None
+    points = projected[:, :2] / projected[:, 2:]
+    left, top = np.floor(points.min(axis=0)).astype(int) - 1
+    right, bottom = np.ceil(points.max(axis=0)).astype(int) + 2
+    return (
+        int(np.clip(top, 0, canvas_shape[0])),
+        int(np.clip(bottom, 0, canvas_shape[0])),
+        int(np.clip(left, 0, canvas_shape[1])),
+        int(np.clip(right, 0, canvas_shape[1])),
+    )
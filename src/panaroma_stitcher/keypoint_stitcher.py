@@ -1,28 +1,46 @@
 """This is a stitcher with sift descriptor and homography transformation"""
 
 from dataclasses import dataclass, field
-from typing import Any, Sequence, Optional
+from typing import Any, Sequence, Optional, Tuple
 import logging
 import cv2
 import imutils
 import numpy as np
 import numpy.typing as npt
 
-from .utility import ImageLoader
+from .blending import SeamBlender
+from .matching import MatchingEngine
+from .profiling import span
+from .cache import cached_result
+from .tiling import detect_and_compute_tiled
+from .utility import ImageLoader, padded_foreground_mask
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
 class KeypointStitcher(ImageLoader):
-    """This is a pair-wise stitcher based on descriptor and ransac from opencv"""
+    """This is a pair-wise stitcher based on descriptor and ransac from opencv.
+
+    With a blender other than "no", every image is pasted with a seam of seam_finder and blended in the band around its
+    overlap with the stitched image instead of being cut at the boundary of the warped image.
+    """
 
     feature_detector: str = field(default="sift")
     number_feature: int = field(default=20)
     matcher_type: str = field(default="bf")
+    tile_grid: Optional[Tuple[int, int]] = field(default=None)
+    tile_overlap: int = field(default=32)
+    flann_checks: int = field(default=50)
+    blender: str = field(default="no")
+    seam_finder: str = field(default="dp_color")
+    matching: MatchingEngine = field(init=False, repr=False)
+    seam_blender: SeamBlender = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
         """Check if the matcher is defined or not and other post-processing requirements"""
+        self.matching = MatchingEngine(self.matcher_type, checks=self.flann_checks)
+        self.seam_blender = SeamBlender(self.blender, self.seam_finder)
         self.opencv_load_images()
 
     def detect_and_describe(self) -> Any:
@@ -35,51 +53,72 @@ class KeypointStitcher(ImageLoader):
             self.number_feature, contrastThreshold=0.02, edgeThreshold=7, sigma=1.0
         )
 
+    def detect_features(
+        self, image: npt.NDArray[Any]
+    ) -> Tuple[Tuple[Any, ...], Optional[npt.NDArray[Any]]]:
+        """Detect and describe the keypoints of an image at once or in tiles with a feature budget per tile"""
+        if self.tile_grid is None:
+            return self.detect_and_describe().detectAndCompute(image, None)  # type: ignore[no-any-return]
+        budget = -(-self.number_feature // (self.tile_grid[0] * self.tile_grid[1]))
+        return detect_and_compute_tiled(
+            self.detect_and_describe,
+            image,
+            self.tile_grid,
+            self.tile_overlap,
+            budget,
+            self.execution.threads_per_worker() if self.execution else None,
+        )
+
     def matcher(self) -> Any:
         """Define matcher from opencv"""
-        if self.matcher_type == "bf":
-            if self.feature_detector == "sift":
-                bruteforce = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
-            else:
-                bruteforce = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            return bruteforce
-        return cv2.FlannBasedMatcher({"algorithm": 0, "trees": 20}, {"checks": 150})
+        return self.matching.create(binary=self.feature_detector != "sift")
 
     def _stitcher_helper(
         self, image_right: npt.NDArray[np.float32], image_left: npt.NDArray[np.float32]
     ) -> npt.NDArray[Any]:
         """Define the helper for stitching images"""
-        descriptor = self.detect_and_describe()
-        img_right_key, img_right_desc = descriptor.detectAndCompute(image_right, None)
-        img_left_key, img_left_desc = descriptor.detectAndCompute(image_left, None)
-        matcher = self.matcher()
-        matches = matcher.match(img_right_desc, img_left_desc)
-        right_points = np.asarray(
-            [img_right_key[match.queryIdx].pt for match in matches]
-        ).reshape(-1, 1, 2)
-        left_points = np.asarray(
-            [img_left_key[match.trainIdx].pt for match in matches]
-        ).reshape(-1, 1, 2)
-        homography, _ = cv2.findHomography(right_points, left_points, cv2.RANSAC, 5.0)
-        result = cv2.warpPerspective(
-            image_right, homography, (image_left.shape[1] * 2, image_left.shape[0] * 2)
-        )
-        crds = self._boundary_cleaner_crds(result)
-        result = self._boundary_cleaner(result, crds, image_left)
+        with span("detection") as stage:
+            stage.add_pixels([image_right, image_left])
+            img_right_key, img_right_desc = self.detect_features(image_right)
+            img_left_key, img_left_desc = self.detect_features(image_left)
+        with span("matching"):
+            matches = self.matching.match(img_right_desc, img_left_desc)
+        with span("ransac"):
+            right_points = np.asarray(
+                [img_right_key[match.queryIdx].pt for match in matches]
+            ).reshape(-1, 1, 2)
+            left_points = np.asarray(
+                [img_left_key[match.trainIdx].pt for match in matches]
+            ).reshape(-1, 1, 2)
+            homography, _ = cv2.findHomography(
+                right_points, left_points, cv2.RANSAC, 5.0
+            )
+        with span("warping") as stage:
+            result = cv2.warpPerspective(
+                image_right,
+                homography,
+                (image_left.shape[1] * 2, image_left.shape[0] * 2),
+            )
+            stage.add_pixels([result])
+        with span("blending") as stage:
+            stage.add_pixels([result])
+            if self.blender != "no":
+                canvas = np.zeros_like(result)
+                canvas[: image_left.shape[0], : image_left.shape[1]] = image_left
+                return self.seam_blender.blend(result, canvas)
+            crds = self._boundary_cleaner_crds(result, self.compiled_kernels)
+            result = self._boundary_cleaner(result, crds, image_left)
         return result
 
     @staticmethod
-    def _boundary_cleaner_crds(result_image: npt.NDArray[Any]) -> Sequence[int]:
+    def _boundary_cleaner_crds(
+        result_image: npt.NDArray[Any], compiled: bool = False
+    ) -> Sequence[int]:
         """Select boundaries of stitched images without black area caused by warping images"""
-        image_boarder = cv2.copyMakeBorder(
-            result_image, 2, 2, 2, 2, cv2.BORDER_CONSTANT, (0, 0, 0)
-        )  # type: ignore
-        gray_boarder = cv2.cvtColor(image_boarder, cv2.COLOR_BGR2GRAY)
-        thresholded = cv2.threshold(gray_boarder, 0, 255, cv2.THRESH_BINARY)[1]
-        cnts = cv2.findContours(
-            thresholded.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        thresholded = padded_foreground_mask(result_image, compiled)
+        cnts = imutils.grab_contours(
+            cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         )
-        cnts = imutils.grab_contours(cnts)
         c = max(cnts, key=cv2.contourArea)
         mask = np.zeros(thresholded.shape, dtype="uint8")
         (x, y, w, h) = cv2.boundingRect(c)
@@ -104,12 +143,15 @@ class KeypointStitcher(ImageLoader):
     ) -> npt.NDArray[Any]:
         """Remove black boundaries of stitched images caused by warping images based on input crds"""
         if left_image is not None:
-            temp = result_image.copy()
-            result_image[0 : left_image.shape[0], 0 : left_image.shape[1]] = left_image
-            result_image[crds[1] :, crds[0] :] = temp[crds[1] :, crds[0] :]
+            # Paste the left image in place except where it overlaps the corner [crds[1]:, crds[0]:] kept from the result
+            height, width = left_image.shape[:2]
+            top, left = min(crds[1], height), min(crds[0], width)
+            result_image[:top, :width] = left_image[:top]
+            result_image[top:height, :left] = left_image[top:, :left]
             return result_image
         return result_image[crds[1] : crds[1] + crds[3], crds[0] : crds[0] + crds[2]]
 
+    @cached_result
     def stitcher(self, result_path: str = "", framer: bool = True) -> Optional[Any]:
         """Stitch all the images together"""
         if len(self.images) == 0:
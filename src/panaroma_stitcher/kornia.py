@@ -1,7 +1,7 @@
 """Kornia stitcher"""
 
 from dataclasses import dataclass, field
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 import logging
 
@@ -9,6 +9,8 @@ import torch
 import kornia as krn
 import kornia.feature as krnfeat
 from kornia.contrib import ImageStitcher
+from .profiling import profile_methods, span
+from .cache import cached_result
 from .utility import ImageLoader
 
 logger = logging.getLogger(__name__)
@@ -19,6 +21,7 @@ class KorniaStitcher(ImageLoader):
     """Kornia stitcher based on LoFTR"""
 
     matcher: Optional[Any] = field(init=False, default=None)
+    matcher_settings: Dict[str, Any] = field(init=False, default_factory=dict)
 
     def __post_init__(self) -> None:
         """Check if the matcher is defined or not and other post-processing requirements"""
@@ -29,6 +32,7 @@ class KorniaStitcher(ImageLoader):
 
     def loftr_matcher(self, model: str = "outdoor") -> None:
         """define a feature matcher"""
+        self.matcher_settings = {"matcher": "loftr", "model": model}
         if self.device == "cuda":
             self.matcher = krnfeat.LoFTR(pretrained=model).cuda()
         else:
@@ -38,6 +42,12 @@ class KorniaStitcher(ImageLoader):
         self, number_of_features: int = 100, match_mode: str = "snn", thr: float = 0.8
     ) -> None:
         """Local feature matcher of Kornia. mathc_mode: snn, nn, mnn, smnn"""
+        self.matcher_settings = {
+            "matcher": "local",
+            "number_of_features": number_of_features,
+            "match_mode": match_mode,
+            "thr": thr,
+        }
         self.matcher = krnfeat.LocalFeatureMatcher(
             krnfeat.GFTTAffNetHardNet(number_of_features),
             krnfeat.DescriptorMatcher(match_mode, thr),
@@ -47,17 +57,38 @@ class KorniaStitcher(ImageLoader):
         self, number_of_features: int = 100, match_mode: str = "snn", thr: float = 0.8
     ) -> None:
         """KeyNet matcher"""
+        self.matcher_settings = {
+            "matcher": "keynet",
+            "number_of_features": number_of_features,
+            "match_mode": match_mode,
+            "thr": thr,
+        }
         self.matcher = krnfeat.LocalFeatureMatcher(
             krnfeat.KeyNetAffNetHardNet(number_of_features),
             krnfeat.DescriptorMatcher(match_mode, thr),
         )
 
+    def cache_key_parts(self) -> Dict[str, Any]:
+        """The matcher and its settings, as they are set after construction"""
+        return self.matcher_settings
+
+    @cached_result
     def stitcher(self, result_path: str = "") -> Any:
         """Stitch images with feature matcher"""
         if not self.matcher:
             raise ValueError("Kornia matcher is not defined. Use one of loftr_matcher")
         image_stitcher = ImageStitcher(self.matcher, estimator="ransac")
-        with torch.no_grad():
+        profile_methods(
+            image_stitcher,
+            {
+                "on_matcher": "matching",
+                "estimate_transform": "ransac",
+                "blend_image": "blending",
+                "postprocess": "crop",
+            },
+        )
+        with torch.no_grad(), span("stitching") as stage:
+            stage.add_pixels(self.images)
             result = image_stitcher(*self.images)
         if result_path != "":
             self.save_result(krn.tensor_to_image(result), result_path, False)  # type: ignore
@@ -1,22 +1,46 @@
+# pylint: disable=too-many-lines
 """Run the main code for panorama stitcher"""
 
-from typing import Tuple, Any
+from dataclasses import asdict
+from typing import Tuple, Any, Optional
 from pathlib import Path
+import json
 import logging
+import threading
 import click
+import cv2
 
 from panaroma_stitcher import __version__
+from panaroma_stitcher import profiling
 from panaroma_stitcher.logging import config_logger
-from panaroma_stitcher.kornia import KorniaStitcher
-from panaroma_stitcher.opencv_simple import SimpleStitcher
-from panaroma_stitcher.keypoint_stitcher import KeypointStitcher
-from panaroma_stitcher.detailed_stitcher import DetailedStitcher
-from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.batch import read_jobs, run_batch
+from panaroma_stitcher.benchmark import STITCHERS, compare, run_kernels, run_suite
+from panaroma_stitcher.cache import ResultCache
+from panaroma_stitcher.execution import ExecutionConfig
+from panaroma_stitcher.memory_budget import MemoryBudgetError
+from panaroma_stitcher.presets import PRESETS
 
 logger = logging.getLogger(__name__)
 
 
-@click.group()
+class StitcherGroup(click.Group):
+    """Command group that reports a stitcher over the memory budget as an error message instead of a traceback"""
+
+    def invoke(self, ctx: click.Context) -> Any:
+        try:
+            return super().invoke(ctx)
+        except MemoryBudgetError as error:
+            raise click.ClickException(str(error)) from error
+
+
+def _data_path(ctx: Any) -> Path:
+    """Data directory of the commands that load images"""
+    if ctx.obj["data_path"] is None:
+        raise click.UsageError("Missing option '-d' / '--data_path'.", ctx)
+    return Path(ctx.obj["data_path"])
+
+
+@click.group(cls=StitcherGroup)
 @click.version_option(version=__version__)
 @click.option(
     "-v",
@@ -28,9 +52,8 @@ logger = logging.getLogger(__name__)
 @click.option(
     "-d",
     "--data_path",
-    required=True,
     type=click.Path(exists=True),
-    help="Path to data directory.",
+    help="Path to data directory. Required by the commands that load images.",
 )
 @click.option(
     "-s",
@@ -45,14 +68,84 @@ logger = logging.getLogger(__name__)
     default=True,
     help="It crops the final image to remove the black background",
 )
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Choice(list(profiling.SINKS), case_sensitive=False),
+    help="Record the time of every stage as log lines, a JSON trace or a chrome trace.",
+)
+@click.option(
+    "--profile_path",
+    type=click.Path(),
+    default="./profile.json",
+    help="Path of the JSON or chrome trace file.",
+)
+@click.option(
+    "--profile_memory",
+    is_flag=True,
+    default=False,
+    help="Also record the tracemalloc peak of every stage.",
+)
+@click.option(
+    "--cache_dir",
+    type=click.Path(),
+    default=None,
+    help="Directory of the result cache. Identical stitching requests are served from it.",
+)
+@click.option(
+    "--cache_size_mb",
+    type=int,
+    default=1024,
+    help="Size limit of the result cache in MB.",
+)
+@click.option(
+    "--compiled_kernels",
+    is_flag=True,
+    default=False,
+    help="Composite and mask the images with the numba kernels instead of opencv call chains.",
+)
+@click.option(
+    "--memory_budget",
+    type=float,
+    default=None,
+    help="Peak memory in MB. The registration, compose and output scales are lowered to fit it.",
+)
+@click.option(
+    "--threads",
+    type=int,
+    default=None,
+    help="opencv/torch threads of every worker. By default, the CPUs are split equally between the workers.",
+)
+@click.option(
+    "--geo_order",
+    is_flag=True,
+    default=False,
+    help="Order the images along their GPS positions instead of their file names.",
+)
+@click.option(
+    "--tile_format",
+    default="jpg",
+    type=click.Choice(["jpg", "webp", "png"], case_sensitive=False),
+    help="Format of the tiles when the result path ends with .dzi.",
+)
 @click.pass_context
-def panaroma_stitcher_cli(
+def panaroma_stitcher_cli(  # pylint: disable=R0913, R0914, R0917
     ctx: Any,
     verbose: int,
     resize_shape: Tuple[int],
-    data_path: Path,
+    data_path: Optional[Path],
     result_path: Path,
     cleaner: bool,
+    profile: str,
+    profile_path: str,
+    profile_memory: bool,
+    cache_dir: str,
+    cache_size_mb: int,
+    compiled_kernels: bool,
+    memory_budget: float,
+    threads: int,
+    geo_order: bool,
+    tile_format: str,
 ) -> None:
     """This rep can stitch multi panorama images"""
     if verbose == 1:
@@ -73,6 +166,18 @@ def panaroma_stitcher_cli(
     ctx.obj["data_path"] = data_path
     ctx.obj["result_path"] = result_path
     ctx.obj["cleaner"] = cleaner
+    ctx.obj["compiled_kernels"] = compiled_kernels
+    ctx.obj["memory_budget"] = memory_budget
+    ctx.obj["threads"] = threads
+    ctx.obj["execution"] = ExecutionConfig(threads=threads)
+    ctx.obj["geo_order"] = geo_order
+    ctx.obj["tile_format"] = tile_format
+    ctx.obj["cache"] = (
+        ResultCache(Path(cache_dir), cache_size_mb * 1024**2) if cache_dir else None
+    )
+    if profile:
+        profiling.enable(profile, profile_path, profile_memory)
+        ctx.call_on_close(profiling.disable)
 
 
 @panaroma_stitcher_cli.command()
@@ -108,8 +213,18 @@ def kornia(
     ctx: Any, method: str, loftr_model: str, features: int, thr: float, matcher: str
 ) -> None:
     """This is cli for kornia stitcher techniques"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.kornia import KorniaStitcher
+
     stitcher = KorniaStitcher(
-        image_dir=Path(ctx.obj["data_path"]), resize_shape=ctx.obj["resize_shape"]
+        image_dir=_data_path(ctx),
+        resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
     )
     if method == "loftr":
         stitcher.loftr_matcher(model=loftr_model)
@@ -129,13 +244,46 @@ def kornia(
     type=click.Choice(["scan", "panorama"], case_sensitive=False),
     help="Stitcher type for opencv stitching method.",
 )
+@click.option(
+    "--registration_resol",
+    type=float,
+    help="Resolution of the registration step in megapixels.",
+)
+@click.option(
+    "--seam_resol",
+    type=float,
+    help="Resolution of the seam estimation step in megapixels.",
+)
+@click.option(
+    "--compositing_resol",
+    type=float,
+    help="Resolution of the compositing step in megapixels (-1 keeps the original size).",
+)
 @click.pass_context
-def opencv_simple(ctx: Any, stitcher_type: str) -> None:
+def opencv_simple(
+    ctx: Any,
+    stitcher_type: str,
+    registration_resol: float,
+    seam_resol: float,
+    compositing_resol: float,
+) -> None:
     """This is cli for opencv simple stitcher"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.opencv_simple import SimpleStitcher
+
     stitcher = SimpleStitcher(
-        image_dir=Path(ctx.obj["data_path"]),
+        image_dir=_data_path(ctx),
         resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
         stitcher_type=stitcher_type,
+        registration_resol=registration_resol,
+        seam_estimation_resol=seam_resol,
+        compositing_resol=compositing_resol,
     )
     _ = stitcher.stitcher(ctx.obj["result_path"], ctx.obj["cleaner"])
 
@@ -159,17 +307,64 @@ def opencv_simple(ctx: Any, stitcher_type: str) -> None:
     type=int,
     help="Number of features in detector methods.",
 )
+@click.option(
+    "--tile_grid",
+    type=(int, int),
+    default=None,
+    help="Detect the features in rows x cols overlapping tiles in parallel with a feature budget per tile.",
+)
+@click.option(
+    "--flann_checks",
+    type=int,
+    default=50,
+    help="Number of checks of the flann index. More checks are slower with a higher recall.",
+)
+@click.option(
+    "--blender",
+    type=click.Choice(["multiband", "feather", "no"], case_sensitive=False),
+    default="no",
+    help="Blend every image in the band around its overlap instead of pasting it over the others.",
+)
+@click.option(
+    "--seam_finder",
+    type=click.Choice(
+        ["dp_color", "dp_colorgrad", "gc_color", "gc_colorgrad", "voronoi", "no"],
+        case_sensitive=False,
+    ),
+    default="dp_color",
+    help="Seam finder of the blender, run on the downscaled overlap band.",
+)
 @click.pass_context
-def keypoint_stitcher(
-    ctx: Any, matching_method: str, detector_method: str, number_feature: int
+def keypoint_stitcher(  # pylint: disable=R0913, R0917
+    ctx: Any,
+    matching_method: str,
+    detector_method: str,
+    number_feature: int,
+    tile_grid: Tuple[int, int],
+    flann_checks: int,
+    blender: str,
+    seam_finder: str,
 ) -> None:
     """This is cli for keypoint matching stitcher techniques"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.keypoint_stitcher import KeypointStitcher
+
     stitcher = KeypointStitcher(
-        image_dir=Path(ctx.obj["data_path"]),
+        image_dir=_data_path(ctx),
         resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
         feature_detector=detector_method,
         matcher_type=matching_method,
         number_feature=number_feature,
+        tile_grid=tile_grid,
+        flann_checks=flann_checks,
+        blender=blender,
+        seam_finder=seam_finder,
     )
     _ = stitcher.stitcher(ctx.obj["result_path"], ctx.obj["cleaner"])
 
@@ -209,8 +404,58 @@ def keypoint_stitcher(
     type=click.Choice(["ray", "reproj", "affine", "no"], case_sensitive=False),
     help="Choose camera adjustor.",
 )
+@click.option(
+    "--preset",
+    type=click.Choice(list(PRESETS), case_sensitive=False),
+    help="Performance preset for resolutions, matching range, seam finder and blender.",
+)
+@click.option(
+    "--medium_megapix", type=float, help="Registration resolution in megapixels."
+)
+@click.option(
+    "--low_megapix", type=float, help="Seam estimation resolution in megapixels."
+)
+@click.option(
+    "--final_megapix",
+    type=float,
+    help="Compositing resolution in megapixels (-1 keeps the original size).",
+)
+@click.option(
+    "--range_width",
+    type=int,
+    help="Match each image only with this number of neighbours (-1 matches all pairs).",
+)
+@click.option(
+    "--seam_finder",
+    type=click.Choice(
+        ["dp_color", "dp_colorgrad", "gc_color", "gc_colorgrad", "voronoi", "no"],
+        case_sensitive=False,
+    ),
+    help="Choose seam finder.",
+)
+@click.option(
+    "--blender",
+    type=click.Choice(["multiband", "feather", "no"], case_sensitive=False),
+    help="Choose blender type.",
+)
+@click.option(
+    "--candidate_k",
+    type=int,
+    help="Only match each image with its k most similar images based on global signatures.",
+)
+@click.option(
+    "--geo_pairs",
+    is_flag=True,
+    default=False,
+    help="Only match each image with its spatial neighbours based on the GPS positions of the EXIF data.",
+)
+@click.option(
+    "--rig_calibration",
+    type=click.Path(),
+    help="Rig calibration file. It is created if missing and reused to compose images otherwise.",
+)
 @click.pass_context
-def detailed_stitcher(  # pylint: disable=R0913, R0917
+def detailed_stitcher(  # pylint: disable=R0913, R0914, R0917
     ctx: Any,
     detect_method: str,
     match_type: str,
@@ -219,11 +464,38 @@ def detailed_stitcher(  # pylint: disable=R0913, R0917
     conf_thr: float,
     cam_est: str,
     cam_adj: str,
+    preset: str,
+    medium_megapix: float,
+    low_megapix: float,
+    final_megapix: float,
+    range_width: int,
+    seam_finder: str,
+    blender: str,
+    candidate_k: int,
+    geo_pairs: bool,
+    rig_calibration: str,
 ) -> None:
     """This is cli for detailed stitcher techniques from stitching library"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.detailed_stitcher import DetailedStitcher
+
+    overrides = {
+        "medium_megapix": medium_megapix,
+        "low_megapix": low_megapix,
+        "final_megapix": final_megapix,
+        "range_width": range_width,
+        "finder": seam_finder,
+        "blender_type": blender,
+    }
     stitcher = DetailedStitcher(
-        image_dir=Path(ctx.obj["data_path"]),
+        image_dir=_data_path(ctx),
         resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
         feature_number=num_feat,
         device=device,
         detector_method=detect_method,
@@ -231,7 +503,18 @@ def detailed_stitcher(  # pylint: disable=R0913, R0917
         confidence_threshold=conf_thr,
         camera_adjustor=cam_adj,
         camera_estimator=cam_est,
+        preset=preset,
+        overrides={key: val for key, val in overrides.items() if val is not None},
+        candidate_neighbours=candidate_k,
+        geo_pairs=geo_pairs,
     )
+    if rig_calibration:
+        if not Path(rig_calibration).exists():
+            stitcher.calibrate(rig_calibration)
+        _ = stitcher.compose(
+            rig_calibration, ctx.obj["result_path"], ctx.obj["cleaner"]
+        )
+        return
     _ = stitcher.stitcher(ctx.obj["result_path"], ctx.obj["cleaner"])
 
 
@@ -255,21 +538,555 @@ def detailed_stitcher(  # pylint: disable=R0913, R0917
     help="Number of features in detector methods.",
 )
 @click.option("--final_shape", type=(int, int), help="Final result image shape.")
+@click.option(
+    "--tile_grid",
+    type=(int, int),
+    default=None,
+    help="Detect the features in rows x cols overlapping tiles in parallel with a feature budget per tile.",
+)
+@click.option(
+    "--flann_checks",
+    type=int,
+    default=50,
+    help="Number of checks of the flann index. More checks are slower with a higher recall.",
+)
+@click.option(
+    "--checkpoint_dir",
+    type=click.Path(),
+    default=None,
+    help="Directory of the checkpoints. A restarted stitch of the same images resumes from the last one.",
+)
+@click.option(
+    "--checkpoint_interval",
+    type=int,
+    default=50,
+    help="Number of frames between the checkpoints.",
+)
+@click.option(
+    "--global_alignment",
+    is_flag=True,
+    help="Refine the homographies of all frames together over the consecutive and loop-closure pairs.",
+)
+@click.option(
+    "--loop_neighbours",
+    type=int,
+    default=2,
+    help="Number of loop-closure pairs of every frame in the global alignment.",
+)
+@click.option(
+    "--blender",
+    type=click.Choice(["multiband", "feather", "no"], case_sensitive=False),
+    default="no",
+    help="Blend every image in the band around its overlap instead of pasting it over the others.",
+)
+@click.option(
+    "--seam_finder",
+    type=click.Choice(
+        ["dp_color", "dp_colorgrad", "gc_color", "gc_colorgrad", "voronoi", "no"],
+        case_sensitive=False,
+    ),
+    default="dp_color",
+    help="Seam finder of the blender, run on the downscaled overlap band.",
+)
 @click.pass_context
-def sequential_stitcher(
+def sequential_stitcher(  # pylint: disable=R0913, R0914, R0917
     ctx: Any,
     matching_method: str,
     detector_method: str,
     number_feature: int,
     final_shape: Tuple[int, int],
+    tile_grid: Tuple[int, int],
+    flann_checks: int,
+    checkpoint_dir: str,
+    checkpoint_interval: int,
+    global_alignment: bool,
+    loop_neighbours: int,
+    blender: str,
+    seam_finder: str,
 ) -> None:
     """This is cli for sequential stitcher techniques"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+
     stitcher = SequentialStitcher(
-        image_dir=Path(ctx.obj["data_path"]),
+        image_dir=_data_path(ctx),
         resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
         feature_detector=detector_method,
         matcher_type=matching_method,
         number_feature=number_feature,
         final_size=final_shape,
+        tile_grid=tile_grid,
+        flann_checks=flann_checks,
+        checkpoint_dir=Path(checkpoint_dir) if checkpoint_dir else None,
+        checkpoint_interval=checkpoint_interval,
+        global_alignment=global_alignment,
+        loop_neighbours=loop_neighbours,
+        blender=blender,
+        seam_finder=seam_finder,
+    )
+    _ = stitcher.stitcher(ctx.obj["result_path"], ctx.obj["cleaner"])
+    if stitcher.alignment_report is not None:
+        click.echo(json.dumps(stitcher.alignment_report, indent=2))
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--window",
+    type=int,
+    default=3,
+    help="Number of recent frames that every new frame is matched against.",
+)
+@click.option(
+    "--preview_path",
+    type=click.Path(),
+    default=None,
+    help="Path of the downscaled preview that is written after every frame.",
+)
+@click.pass_context
+def online(ctx: Any, window: int, preview_path: str) -> None:
+    """This is cli for adding the images one at a time to a live mosaic"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.online import MosaicSession
+    from panaroma_stitcher.utility import ImageLoader
+
+    loader = ImageLoader(
+        image_dir=_data_path(ctx),
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
+    )
+    session = MosaicSession(window=window)
+    for path in loader._list_images():  # pylint: disable=protected-access
+        frame = cv2.imread(str(path))
+        if ctx.obj["resize_shape"]:
+            frame = cv2.resize(frame, ctx.obj["resize_shape"])
+        click.echo(json.dumps(session.add_frame(frame)))
+        preview = session.preview()
+        if preview_path and preview is not None:
+            cv2.imwrite(preview_path, preview)
+    mosaic = session.mosaic()
+    if mosaic is not None:
+        loader.save_result(
+            cv2.cvtColor(mosaic, cv2.COLOR_BGR2RGB),
+            ctx.obj["result_path"],
+            ctx.obj["cleaner"],
+        )
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--backends",
+    multiple=True,
+    type=click.Choice(STITCHERS, case_sensitive=False),
+    default=None,
+    help="Backends to try in this order (simple, sequential, detailed and keypoint by default).",
+)
+@click.option(
+    "--time_budget",
+    type=float,
+    default=120.0,
+    help="Wall-clock seconds for all the attempts. The running attempt is stopped when it runs out.",
+)
+@click.option(
+    "--min_matches",
+    type=int,
+    default=30,
+    help="Matches of every consecutive pair needed by the sequential and keypoint stitchers.",
+)
+@click.option(
+    "--min_inlier_ratio",
+    type=float,
+    default=0.25,
+    help="RANSAC inlier ratio of every consecutive pair needed by the sequential and keypoint stitchers.",
+)
+@click.pass_context
+def auto(  # pylint: disable=R0913, R0917
+    ctx: Any,
+    backends: Tuple[str],
+    time_budget: float,
+    min_matches: int,
+    min_inlier_ratio: float,
+) -> None:
+    """This is cli for stitching with the cheapest backend that works within a time budget"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.auto_stitcher import BACKENDS, AutoStitcher
+
+    stitcher = AutoStitcher(
+        image_dir=_data_path(ctx),
+        resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
+        backends=list(backends) or BACKENDS,
+        time_budget=time_budget,
+        min_matches=min_matches,
+        min_inlier_ratio=min_inlier_ratio,
     )
     _ = stitcher.stitcher(ctx.obj["result_path"], ctx.obj["cleaner"])
+    for attempt in stitcher.attempts:
+        click.echo(json.dumps(attempt))
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--neighbours",
+    "-k",
+    type=int,
+    multiple=True,
+    default=[2, 4, 8],
+    help="Number of candidate neighbours per image to evaluate.",
+)
+@click.option(
+    "--detect_method",
+    default="sift",
+    type=click.Choice(["sift", "orb", "brisk", "akaze"], case_sensitive=False),
+    help="Choose keypoint detection method.",
+)
+@click.pass_context
+def pair_pruning(ctx: Any, neighbours: Tuple[int], detect_method: str) -> None:
+    """This is cli for the recall and speed report of candidate pair pruning"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.pair_pruning import recall_report
+    from panaroma_stitcher.utility import ImageLoader
+
+    loader = ImageLoader(
+        image_dir=_data_path(ctx), resize_shape=ctx.obj["resize_shape"]
+    )
+    loader.opencv_load_images()
+    for row in recall_report(loader.images, neighbours, detect_method):
+        click.echo(json.dumps(row))
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--checks",
+    "-c",
+    type=int,
+    multiple=True,
+    default=[16, 64, 256],
+    help="Number of FLANN checks to evaluate.",
+)
+@click.option(
+    "--detect_method",
+    default="sift",
+    type=click.Choice(["sift", "orb", "brisk"], case_sensitive=False),
+    help="Choose keypoint detection method.",
+)
+@click.pass_context
+def matching_bench(ctx: Any, checks: Tuple[int], detect_method: str) -> None:
+    """This is cli for the recall and speed of FLANN matching compared to brute force"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.matching import matching_report
+    from panaroma_stitcher.utility import ImageLoader
+
+    loader = ImageLoader(
+        image_dir=_data_path(ctx), resize_shape=ctx.obj["resize_shape"]
+    )
+    loader.opencv_load_images()
+    for row in matching_report(loader.images, checks, detect_method):
+        click.echo(json.dumps(row))
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--count",
+    "-n",
+    type=int,
+    multiple=True,
+    default=[10],
+    help="Number of views. Every count is written to its own frames_<count> directory.",
+)
+@click.option(
+    "--view_shape",
+    type=(int, int),
+    default=(480, 640),
+    help="Height and width of the views.",
+)
+@click.option("--overlap", type=float, default=0.5, help="Overlap of neighbour views.")
+@click.option(
+    "--perturbation",
+    type=float,
+    default=0.03,
+    help="Random corner shift of the views relative to the view size.",
+)
+@click.option("--rows", type=int, default=1, help="Number of rows of the view grid.")
+@click.option(
+    "--source",
+    type=click.Path(exists=True),
+    help="Large image to cut the views from. A synthetic texture is used otherwise.",
+)
+@click.option("--seed", type=int, default=0, help="Seed of the random generator.")
+@click.option(
+    "--output_dir",
+    type=click.Path(),
+    default="./synthetic_data",
+    help="Directory of the synthetic datasets.",
+)
+def synthesize(  # pylint: disable=R0913, R0917
+    count: Tuple[int],
+    view_shape: Tuple[int, int],
+    overlap: float,
+    perturbation: float,
+    rows: int,
+    source: str,
+    seed: int,
+    output_dir: str,
+) -> None:
+    """This is cli for generating synthetic datasets with ground-truth transforms"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.synthetic import write_dataset
+
+    source_image = cv2.imread(source) if source else None
+    for number in count:
+        dataset = write_dataset(
+            Path(output_dir) / f"frames_{number:04d}",
+            number,
+            view_shape,
+            overlap,
+            perturbation,
+            rows,
+            source_image,
+            seed,
+        )
+        click.echo(str(dataset))
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--lut_dir",
+    required=True,
+    type=click.Path(),
+    help="Directory of the remap tables. They are created if missing or for other frame sizes and reused otherwise.",
+)
+@click.option(
+    "--number_feature",
+    default=500,
+    type=int,
+    help="Number of features to estimate the rig homographies.",
+)
+@click.option("--workers", default=1, type=int, help="Number of row-band threads.")
+@click.pass_context
+def remap(ctx: Any, lut_dir: str, number_feature: int, workers: int) -> None:
+    """This is cli for composing fixed rigs with precomputed remap tables"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.remap_compositor import RemapCompositor
+    from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+
+    stitcher = SequentialStitcher(
+        image_dir=_data_path(ctx),
+        resize_shape=ctx.obj["resize_shape"],
+        cache=ctx.obj["cache"],
+        compiled_kernels=ctx.obj["compiled_kernels"],
+        memory_budget_mb=ctx.obj["memory_budget"],
+        execution=ctx.obj["execution"],
+        geo_order=ctx.obj["geo_order"],
+        tile_format=ctx.obj["tile_format"],
+        number_feature=number_feature,
+    )
+    ExecutionConfig(workers, ctx.obj["threads"]).apply()
+    frame_sizes = [(img.shape[1], img.shape[0]) for img in stitcher.images]
+    compositor = None
+    if (Path(lut_dir) / "meta.json").exists():
+        compositor = RemapCompositor(Path(lut_dir), workers=workers)
+        if compositor.frame_sizes != frame_sizes:
+            logger.warning(
+                "The remap tables in %s are for frames of sizes %s, rebuilding them.",
+                lut_dir,
+                compositor.frame_sizes,
+            )
+            compositor = None
+    if compositor is None:
+        compositor = RemapCompositor.build(
+            stitcher.homographies(), frame_sizes, Path(lut_dir), workers=workers
+        )
+    result = compositor.compose(stitcher.images)
+    stitcher.save_result(
+        cv2.cvtColor(result, cv2.COLOR_BGR2RGB),
+        ctx.obj["result_path"],
+        ctx.obj["cleaner"],
+    )
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--stitchers",
+    multiple=True,
+    default=STITCHERS,
+    type=click.Choice(STITCHERS, case_sensitive=False),
+    help="Stitchers to benchmark.",
+)
+@click.option(
+    "--scales",
+    multiple=True,
+    default=[0.5, 1.0],
+    type=float,
+    help="Scales of the original image size used as resize_shape.",
+)
+@click.option(
+    "--output",
+    type=click.Path(),
+    default="./benchmark.json",
+    help="Path to save the benchmark results.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    help="Saved benchmark results to compare with.",
+)
+@click.option(
+    "--tolerance",
+    default=0.2,
+    type=float,
+    help="Allowed relative growth of wall time and peak RSS before flagging a regression.",
+)
+@click.option(
+    "--kernels",
+    is_flag=True,
+    default=False,
+    help="Also benchmark the compiled kernels against the opencv call chains.",
+)
+@click.pass_context
+def bench(  # pylint: disable=R0913, R0917
+    ctx: Any,
+    stitchers: Tuple[str],
+    scales: Tuple[float],
+    output: str,
+    baseline: str,
+    tolerance: float,
+    kernels: bool,
+) -> None:
+    """This is cli for benchmarking the stitchers over every image directory of the data path"""
+    results = run_suite(_data_path(ctx), stitchers, scales)
+    if kernels:
+        results["kernels"] = run_kernels()
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    logger.info("Benchmark results saved to %s", output)
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), tolerance)
+        for regression in regressions:
+            click.echo(json.dumps(regression))
+        if regressions:
+            ctx.exit(1)
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--method",
+    default="simple",
+    type=click.Choice(STITCHERS, case_sensitive=False),
+    help="Stitcher of all the jobs.",
+)
+@click.option(
+    "--options",
+    default="{}",
+    type=str,
+    help="Stitcher options as JSON, e.g. '{\"number_feature\": 500}'.",
+)
+@click.option("--workers", default=1, type=int, help="Number of worker processes.")
+@click.option(
+    "--output_dir",
+    type=click.Path(),
+    default="./batch_results",
+    help="Directory of the stitched images.",
+)
+@click.option(
+    "--manifest",
+    type=click.Path(),
+    help="Manifest of the job status and timing. Finished jobs in it are skipped.",
+)
+@click.pass_context
+def batch(  # pylint: disable=R0913, R0917
+    ctx: Any, method: str, options: str, workers: int, output_dir: str, manifest: str
+) -> None:
+    """This is cli for stitching every image directory of the data path or of a manifest file"""
+    manifest_path = Path(manifest) if manifest else Path(output_dir) / "manifest.jsonl"
+    records = run_batch(
+        read_jobs(_data_path(ctx), Path(output_dir)),
+        manifest_path,
+        method,
+        json.loads(options),
+        ctx.obj["resize_shape"],
+        ctx.obj["cleaner"],
+        workers,
+        ctx.obj["threads"],
+    )
+    failed = [record for record in records if record["status"] != "ok"]
+    click.echo(f"{len(records) - len(failed)} jobs finished and {len(failed)} failed.")
+
+
+@panaroma_stitcher_cli.command()
+@click.option("--host", default="127.0.0.1", type=str, help="Host of the service.")
+@click.option("--port", default=8000, type=int, help="Port of the service.")
+@click.option("--workers", default=2, type=int, help="Number of stitching workers.")
+@click.option(
+    "--queue_size",
+    default=8,
+    type=int,
+    help="Number of waiting requests before new requests are rejected with 503.",
+)
+@click.pass_context
+def serve(  # pylint: disable=R0913, R0917
+    ctx: Any, host: str, port: int, workers: int, queue_size: int
+) -> None:
+    """This is cli for the local HTTP stitching service"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.service import StitchingService
+
+    service = StitchingService(host, port, workers, queue_size, ctx.obj["threads"])
+    service.start()
+    click.echo(f"Serving on http://{host}:{service.port} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        service.stop()
+
+
+@panaroma_stitcher_cli.command()
+@click.option(
+    "--workers",
+    default=1,
+    type=int,
+    help="Number of workers to split the CPUs between.",
+)
+@click.pass_context
+def resources(ctx: Any, workers: int) -> None:
+    """This is cli for the effective thread counts and CPU affinity of a number of workers"""
+    click.echo(json.dumps(ExecutionConfig(workers, ctx.obj["threads"]).apply()))
+
+
+@panaroma_stitcher_cli.command()
+@click.pass_context
+def geo_index(ctx: Any) -> None:
+    """This is cli for the GPS poses of the images in their spatial order and the number of neighbouring pairs"""
+    # pylint: disable=import-outside-toplevel
+    from panaroma_stitcher.geo_index import (
+        geo_order,
+        ground_positions,
+        read_poses,
+        spatial_pairs,
+    )
+    from panaroma_stitcher.utility import ImageLoader
+
+    loader = ImageLoader(image_dir=_data_path(ctx))
+    paths = loader._list_images()  # pylint: disable=protected-access
+    poses = read_poses(paths)
+    positions = ground_positions(poses)
+    for idx in geo_order(positions):
+        pose = poses[idx]
+        click.echo(
+            json.dumps({"file": paths[idx].name, **(asdict(pose) if pose else {})})
+        )
+    pairs = spatial_pairs(positions)
+    click.echo(
+        f"{len(pairs)} neighbouring pairs out of {len(paths) * (len(paths) - 1) // 2} pairs."
+    )
@@ -0,0 +1,166 @@
+"""Descriptor matching with brute force or trained approximate nearest neighbour indexes"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import logging
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+@dataclass
+class MatchingEngine:  # pylint: disable=too-many-instance-attributes
+    """Match descriptors with a cross-checked brute force matcher or a FLANN index.
+
+    FLANN uses randomized KD-trees for float descriptors (SIFT) and LSH for binary descriptors (ORB, BRISK). The
+    features and the trained index of every image are kept by their key and reused by all the pairs of the image
+    until they are evicted. More trees/tables and checks increase the recall at the cost of speed.
+    """
+
+    matcher_type: str = field(default="flann")
+    trees: int = field(default=5)
+    checks: int = field(default=50)
+    table_number: int = field(default=6)
+    key_size: int = field(default=12)
+    multi_probe_level: int = field(default=1)
+    features: Dict[Hashable, Tuple[Any, Any]] = field(
+        init=False, default_factory=dict, repr=False
+    )
+    indexes: Dict[Hashable, Any] = field(init=False, default_factory=dict, repr=False)
+
+    def create(self, binary: bool) -> Any:
+        """Create the opencv matcher for binary or float descriptors"""
+        if self.matcher_type == "bf":
+            return cv2.BFMatcher(
+                cv2.NORM_HAMMING if binary else cv2.NORM_L2, crossCheck=True
+            )
+        index_params: Dict[str, Any]
+        if binary:
+            index_params = {
+                "algorithm": FLANN_INDEX_LSH,
+                "table_number": self.table_number,
+                "key_size": self.key_size,
+                "multi_probe_level": self.multi_probe_level,
+            }
+        else:
+            index_params = {"algorithm": FLANN_INDEX_KDTREE, "trees": self.trees}
+        return cv2.FlannBasedMatcher(index_params, {"checks": self.checks})
+
+    def describe(
+        self,
+        key: Optional[Hashable],
+        image: npt.NDArray[Any],
+        detect: Callable[[npt.NDArray[Any]], Tuple[Any, Any]],
+    ) -> Tuple[Any, Any]:
+        """Return the keypoints and descriptors of an image and keep them by its key"""
+        if key is None:
+            return detect(image)
+        if key not in self.features:
+            self.features[key] = detect(image)
+        return self.features[key]
+
+    def _index(self, key: Optional[Hashable], train: npt.NDArray[Any]) -> Any:
+        """Return the FLANN matcher trained on the train descriptors and keep it by its key"""
+        if key is not None and key in self.indexes:
+            return self.indexes[key]
+        matcher = self.create(train.dtype == np.uint8)
+        matcher.add([train])
+        matcher.train()
+        if key is not None:
+            self.indexes[key] = matcher
+        return matcher
+
+    def match(
+        self,
+        query: Optional[npt.NDArray[Any]],
+        train: Optional[npt.NDArray[Any]],
+        train_key: Optional[Hashable] = None,
+    ) -> Sequence[Any]:
+        """Match every query descriptor to its nearest train descriptor"""
+        if query is None or train is None:
+            return []
+        # FLANN only searches contiguous descriptors
+        query, train = np.ascontiguousarray(query), np.ascontiguousarray(train)
+        if self.matcher_type == "bf":
+            return self.create(train.dtype == np.uint8).match(query, train)  # type: ignore[no-any-return]
+        return self._index(train_key, train).match(query)  # type: ignore[no-any-return]
+
+    def evict(self, key: Hashable) -> None:
+        """Forget the kept features and index of an image that is not matched anymore"""
+        self.features.pop(key, None)
+        self.indexes.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget the kept features and indexes"""
+        self.features.clear()
+        self.indexes.clear()
+
+
+def compare_to_brute_force(
+    engine: MatchingEngine,
+    query: npt.NDArray[Any],
+    train: npt.NDArray[Any],
+    repeats: int = 3,
+) -> Dict[str, Any]:
+    """Return the matching time of an engine and brute force, and the recall of the exact nearest neighbours"""
+    binary = train.dtype == np.uint8
+    exact = cv2.BFMatcher(cv2.NORM_HAMMING if binary else cv2.NORM_L2)
+    times: Dict[str, List[float]] = {"brute_force": [], "engine": []}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        expected = exact.match(query, train)
+        times["brute_force"].append(time.perf_counter() - start)
+        engine.clear()
+        start = time.perf_counter()
+        matches = engine.match(query, train, "train")
+        times["engine"].append(time.perf_counter() - start)
+    nearest = {match.queryIdx: match.trainIdx for match in expected}
+    found = sum(nearest.get(match.queryIdx) == match.trainIdx for match in matches)
+    record = {
+        "brute_force_seconds": float(np.median(times["brute_force"])),
+        "engine_seconds": float(np.median(times["engine"])),
+        "recall": found / max(len(expected), 1),
+        "matches": len(matches),
+    }
+    logger.info("Matching benchmark of %s: %s", engine, record)
+    return record
+
+
+def matching_report(
+    images: Sequence[npt.NDArray[Any]],
+    checks: Sequence[int],
+    detect_method: str = "sift",
+    number_feature: int = 2000,
+) -> List[Dict[str, Any]]:
+    """Compare FLANN with several checks values to brute force over the consecutive image pairs"""
+    detector: Any
+    if detect_method == "orb":
+        detector = cv2.ORB.create(number_feature)
+    elif detect_method == "brisk":
+        detector = cv2.BRISK.create()
+    else:
+        detector = cv2.SIFT.create(number_feature)
+    descriptors = [detector.detectAndCompute(image, None)[1] for image in images]
+    rows = []
+    for value in checks:
+        records = [
+            compare_to_brute_force(MatchingEngine(checks=value), query, train)
+            for train, query in zip(descriptors[:-1], descriptors[1:])
+        ]
+        rows.append(
+            {
+                "checks": value,
+                **{
+                    key: float(np.mean([record[key] for record in records]))
+                    for key in ["brute_force_seconds", "engine_seconds", "recall"]
+                },
+            }
+        )
+    return rows
@@ -0,0 +1,308 @@
+"""Peak memory estimates of the stitchers and the per-stage scales that fit a memory budget.
+
+The estimates only read the image headers, so a stitcher can refuse a dataset before decoding any image. The bytes per
+pixel below are rough upper bounds of the opencv, stitching and kornia pipelines measured on 8-bit BGR frames.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import io
+import logging
+import numpy as np
+
+from .presets import PRESETS
+
+logger = logging.getLogger(__name__)
+
+MB = 1024**2
+
+# Linear scales that are tried from the full resolution down
+SCALES = (1.0, 0.75, 0.5, 0.35, 0.25, 0.18, 0.125, 0.09, 0.0625)
+
+# Memory of the interpreter with opencv and numpy, and with torch and the LoFTR weights
+BASE_MB = 200.0
+KORNIA_BASE_MB = 700.0
+
+# Scale spaces of the detectors per pixel of the detected image (SIFT doubles the image in its first octave)
+DETECTION_BYTES = {"sift": 240.0, "akaze": 130.0, "brisk": 12.0, "orb": 8.0}
+
+# Canvas and weights of the blenders per pixel of the panorama (multiband keeps 16-bit laplacian pyramids)
+BLENDER_BYTES = {"multiband": 40.0, "feather": 12.0, "no": 4.0}
+
+# Fraction of every additional frame that extends the panorama (frames overlap by at least 30%)
+CANVAS_COVERAGE = 0.7
+
+# Default registration resolution of opencv and the stitching library in megapixels
+REGISTRATION_MEGAPIX = 0.6
+
+
+class MemoryBudgetError(RuntimeError):
+    """The stitcher cannot fit the memory budget at any scale"""
+
+
+@dataclass
+class MemoryPlan:
+    """Linear per-stage scales of a stitcher relative to the full resolution frames and its peak memory estimate"""
+
+    load: float
+    registration: float
+    compose: float
+    output: float
+    stages_mb: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def peak_mb(self) -> float:
+        """Estimated peak memory of the process in MB"""
+        return sum(self.stages_mb.values())
+
+
+def frame_shapes(sources: Sequence[Any]) -> List[Tuple[int, int]]:
+    """Return the (height, width) of image paths, encoded bytes, numpy arrays or torch tensors without decoding"""
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    shapes = []
+    for source in sources:
+        if isinstance(source, (str, Path)):
+            with Image.open(source) as image:
+                shapes.append((image.height, image.width))
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            with Image.open(io.BytesIO(source)) as image:
+                shapes.append((image.height, image.width))
+        elif isinstance(source, np.ndarray):
+            shapes.append((int(source.shape[0]), int(source.shape[1])))
+        else:
+            shapes.append((int(source.shape[-2]), int(source.shape[-1])))
+    return shapes
+
+
+def canvas_pixels(areas: Sequence[float]) -> float:
+    """Projected panorama area of frames with the given areas"""
+    if not areas:
+        return 0.0
+    return max(areas) + CANVAS_COVERAGE * (sum(areas) - max(areas))
+
+
+def _detection_bytes(detector: str) -> float:
+    """Bytes per pixel of a detector, and SIFT for unknown detectors"""
+    return DETECTION_BYTES.get(detector, DETECTION_BYTES["sift"])
+
+
+def _keypoint_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """The keypoint stitcher warps every frame on a canvas twice the size of the panorama so far"""
+    areas = [area * plan.load**2 for area in areas]
+    left = areas[0] * 4.0 ** max(len(areas) - 2, 0)
+    return {
+        "images": 3 * sum(areas),
+        "registration": _detection_bytes(stitcher.feature_detector) * left,
+        "compose": 15 * 4 * left,
+    }
+
+
+def _sequential_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """The sequential stitcher pastes every warped frame on a canvas of final_size"""
+    areas = [area * plan.load**2 for area in areas]
+    canvas = stitcher.final_size[0] * stitcher.final_size[1] * plan.output**2
+    return {
+        "images": 3 * sum(areas),
+        "registration": _detection_bytes(stitcher.feature_detector) * max(areas),
+        "compose": 18 * canvas,
+    }
+
+
+def _opencv_stages(
+    detector: str, blender: str, keep_warped: bool, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """opencv and the stitching library register at a low resolution and blend the warped frames into the panorama"""
+    registration = [area * plan.registration**2 for area in areas]
+    composed = [area * plan.compose**2 for area in areas]
+    return {
+        "images": 3 * sum(area * plan.load**2 for area in areas),
+        "registration": _detection_bytes(detector) * max(registration)
+        + 3 * sum(registration),
+        "compose": BLENDER_BYTES.get(blender, BLENDER_BYTES["multiband"])
+        * canvas_pixels(composed)
+        + 7 * (sum(composed) if keep_warped else max(composed)),
+    }
+
+
+def _simple_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """opencv Stitcher with ORB features warps and blends one frame at a time"""
+    del stitcher
+    return _opencv_stages("orb", "multiband", False, plan, areas)
+
+
+def _detailed_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """The stitching library keeps all the warped frames until they are blended"""
+    blender = _detailed_config(stitcher).get("blender_type", "multiband")
+    return _opencv_stages(stitcher.detector_method, blender, True, plan, areas)
+
+
+def _kornia_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """Kornia keeps float RGB tensors and matches every frame with LoFTR against the panorama so far"""
+    del stitcher
+    areas = [area * plan.load**2 for area in areas]
+    canvas = canvas_pixels(areas)
+    return {
+        "images": 12 * sum(areas),
+        "registration": 300 * (canvas + max(areas)),
+        "compose": 48 * canvas,
+    }
+
+
+def _loader_stages(
+    stitcher: Any, plan: MemoryPlan, areas: List[float]
+) -> Dict[str, float]:
+    """A plain image loader only keeps the frames"""
+    del stitcher
+    return {
+        "images": 3 * sum(area * plan.load**2 for area in areas),
+        "registration": 0.0,
+        "compose": 0.0,
+    }
+
+
+STAGES: Dict[str, Callable[[Any, MemoryPlan, List[float]], Dict[str, float]]] = {
+    "KeypointStitcher": _keypoint_stages,
+    "SequentialStitcher": _sequential_stages,
+    "SimpleStitcher": _simple_stages,
+    "DetailedStitcher": _detailed_stages,
+    "KorniaStitcher": _kornia_stages,
+}
+
+
+def _detailed_config(stitcher: Any) -> Dict[str, Any]:
+    """Settings of the detailed stitcher from its preset and overrides"""
+    return {**PRESETS.get(stitcher.preset or "", {}), **stitcher.overrides}
+
+
+def _megapix_scale(megapix: Optional[float], area: float) -> float:
+    """Linear scale of a frame resized to megapix, where None or a negative value keeps the full resolution"""
+    if megapix is None or megapix < 0:
+        return 1.0
+    return min(1.0, float(np.sqrt(megapix * 1e6 / area)))
+
+
+def _opencv_ceilings(stitcher: Any, area: float) -> Tuple[float, float]:
+    """Registration and compose scales that are configured on an opencv based stitcher"""
+    if type(stitcher).__name__ == "DetailedStitcher":
+        config = _detailed_config(stitcher)
+        registration = config.get("medium_megapix", REGISTRATION_MEGAPIX)
+        compose = config.get("final_megapix", -1)
+    else:
+        registration = stitcher.registration_resol or REGISTRATION_MEGAPIX
+        compose = stitcher.compositing_resol
+    return _megapix_scale(registration, area), _megapix_scale(compose, area)
+
+
+def candidate_plans(
+    stitcher: Any, shapes: Sequence[Tuple[int, int]]
+) -> List[MemoryPlan]:
+    """Per-stage scales from the best quality down.
+
+    The opencv based stitchers first lower the compose scale and then load smaller frames, and the other stitchers
+    load smaller frames for all their stages. A compose resolution below all the scales is kept as the only one.
+    """
+    largest = max(height * width for height, width in shapes)
+    if type(stitcher).__name__ not in ["SimpleStitcher", "DetailedStitcher"]:
+        return [MemoryPlan(scale, scale, scale, scale) for scale in SCALES]
+    registration, compose = _opencv_ceilings(stitcher, largest)
+    plans = [
+        MemoryPlan(1.0, min(registration, scale), scale, scale)
+        for scale in [scale for scale in SCALES if scale <= compose] or [compose]
+    ]
+    plans.extend(
+        MemoryPlan(scale, min(registration, scale), scale, scale)
+        for scale in SCALES
+        if scale < plans[-1].compose
+    )
+    return plans
+
+
+def estimate(
+    stitcher: Any, shapes: Sequence[Tuple[int, int]], plan: MemoryPlan
+) -> MemoryPlan:
+    """Fill in the peak memory estimate of every stage of a plan in MB"""
+    stages = STAGES.get(type(stitcher).__name__, _loader_stages)(
+        stitcher, plan, [float(height * width) for height, width in shapes]
+    )
+    base = KORNIA_BASE_MB if type(stitcher).__name__ == "KorniaStitcher" else BASE_MB
+    # The registration and composition memory is released before the next stage starts
+    plan.stages_mb = {
+        "base": base,
+        "images": stages["images"] / MB,
+        "working": max(stages["registration"], stages["compose"]) / MB,
+    }
+    return plan
+
+
+def fit_budget(
+    stitcher: Any, shapes: Sequence[Tuple[int, int]], budget_mb: float
+) -> MemoryPlan:
+    """Return the plan with the highest scales whose estimated peak memory fits the budget"""
+    if not shapes:
+        return MemoryPlan(1.0, 1.0, 1.0, 1.0)
+    plans = [
+        estimate(stitcher, shapes, plan) for plan in candidate_plans(stitcher, shapes)
+    ]
+    for plan in plans:
+        if plan.peak_mb <= budget_mb:
+            logger.info(
+                "Memory budget of %.0f MB fits with an estimated peak of %.0f MB at %s.",
+                budget_mb,
+                plan.peak_mb,
+                plan,
+            )
+            return plan
+    height, width = shapes[0]
+    raise MemoryBudgetError(
+        f"{type(stitcher).__name__} needs an estimated {plans[0].peak_mb:.0f} MB for {len(shapes)} frames of "
+        f"{width}x{height} and still {plans[-1].peak_mb:.0f} MB at the smallest scale {plans[-1].output}, "
+        f"which is over the memory budget of {budget_mb:.0f} MB."
+    )
+
+
+def plan_settings(
+    stitcher: Any, shapes: Sequence[Tuple[int, int]], plan: MemoryPlan
+) -> Dict[str, Any]:
+    """Return the stitcher fields that apply the scales of a plan"""
+    settings: Dict[str, Any] = {}
+    if plan.load < 1.0:
+        settings["scale"] = plan.load * (stitcher.scale or 1.0)
+    name = type(stitcher).__name__
+    largest = max(height * width for height, width in shapes)
+    if name == "SequentialStitcher" and plan.output < 1.0:
+        settings["final_size"] = (
+            max(int(stitcher.final_size[0] * plan.output), 1),
+            max(int(stitcher.final_size[1] * plan.output), 1),
+        )
+    if name in ["SimpleStitcher", "DetailedStitcher"]:
+        registration, compose = _opencv_ceilings(stitcher, largest)
+        megapix = {
+            "registration": plan.registration**2 * largest / 1e6,
+            "compose": plan.compose**2 * largest / 1e6,
+        }
+        if name == "SimpleStitcher":
+            if plan.registration < registration:
+                settings["registration_resol"] = megapix["registration"]
+            if plan.compose < compose:
+                settings["compositing_resol"] = megapix["compose"]
+        else:
+            overrides = dict(stitcher.overrides)
+            if plan.registration < registration:
+                overrides["medium_megapix"] = megapix["registration"]
+            if plan.compose < compose:
+                overrides["final_megapix"] = megapix["compose"]
+            settings["overrides"] = overrides
+    return settings
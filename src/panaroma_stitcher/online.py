@@ -0,0 +1,265 @@
+"""Online mosaicking that appends frames one at a time to a live panorama"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import logging
+import math
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from .matching import MatchingEngine
+from .profiling import span
+from .sequential_stitcher import SequentialStitcher
+from .utility import to_opencv_image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MosaicSession:  # pylint: disable=too-many-instance-attributes
+    """Live mosaic in the coordinates of its first frame that frames are added to one at a time.
+
+    Every frame is matched only against the last window registered frames and warped only into its own bounding box,
+    so its cost does not depend on the size of the mosaic. The canvas grows by growth times its size on the side that
+    a frame leaves, which copies every pixel a constant number of times on average. A preview downscaled by
+    preview_factor is updated with every frame.
+    """
+
+    feature_detector: str = field(default="sift")
+    number_feature: int = field(default=500)
+    matcher_type: str = field(default="bf")
+    window: int = field(default=3)
+    min_inliers: int = field(default=15)
+    growth: float = field(default=2.0)
+    preview_factor: int = field(default=4)
+    matching: MatchingEngine = field(init=False, repr=False)
+    canvas: npt.NDArray[Any] = field(
+        init=False, default_factory=lambda: np.zeros((0, 0, 3), np.uint8), repr=False
+    )
+    preview_canvas: npt.NDArray[Any] = field(
+        init=False, default_factory=lambda: np.zeros((0, 0, 3), np.uint8), repr=False
+    )
+    origin: Tuple[int, int] = field(init=False, default=(0, 0))
+    extent: Optional[List[int]] = field(init=False, default=None)
+    homographies: List[Optional[npt.NDArray[Any]]] = field(
+        init=False, default_factory=list, repr=False
+    )
+    recent: Deque[Tuple[int, npt.NDArray[Any]]] = field(init=False, repr=False)
+    growths: int = field(init=False, default=0)
+
+    def __post_init__(self) -> None:
+        """Create the matcher and the window of recent frames"""
+        self.matching = MatchingEngine(self.matcher_type)
+        self.recent = deque(maxlen=self.window)
+
+    def detect_and_describe(self) -> Any:
+        """Return the descriptors and key points of an image"""
+        if self.feature_detector == "brisk":
+            return cv2.BRISK.create()
+        if self.feature_detector == "orb":
+            return cv2.ORB.create(self.number_feature, edgeThreshold=7)
+        return cv2.SIFT.create(
+            self.number_feature, contrastThreshold=0.01, edgeThreshold=7, sigma=0.8
+        )
+
+    def detect_features(
+        self, image: npt.NDArray[Any]
+    ) -> Tuple[Tuple[Any, ...], Optional[npt.NDArray[Any]]]:
+        """Detect and describe the keypoints of a frame"""
+        return self.detect_and_describe().detectAndCompute(image, None)  # type: ignore[no-any-return]
+
+    def _register(
+        self, idx: int, frame: npt.NDArray[Any]
+    ) -> Tuple[Optional[npt.NDArray[Any]], Optional[int], int]:
+        """Return the homography of a frame into the mosaic, the recent frame it was matched to and the inliers"""
+        with span("detection") as stage:
+            stage.add_pixels([frame])
+            keypoints, descriptors = self.matching.describe(
+                idx, frame, self.detect_features
+            )
+        if not self.recent:
+            return np.eye(3), None, 0
+        best: Tuple[Optional[npt.NDArray[Any]], Optional[int], int] = (None, None, 0)
+        for ref, ref_homography in reversed(self.recent):
+            ref_keypoints, ref_descriptors = self.matching.features[ref]
+            with span("matching"):
+                matches = self.matching.match(descriptors, ref_descriptors, ref)
+            if len(matches) < 4:
+                continue
+            with span("ransac"):
+                homography, mask = cv2.findHomography(
+                    np.asarray([keypoints[m.queryIdx].pt for m in matches]),
+                    np.asarray([ref_keypoints[m.trainIdx].pt for m in matches]),
+                    cv2.RANSAC,
+                    5.0,
+                )
+            if homography is None or np.linalg.det(homography[:2, :2]) <= 0:
+                continue
+            if int(mask.sum()) > best[2]:
+                best = (np.dot(ref_homography, homography), ref, int(mask.sum()))
+        if best[2] < self.min_inliers:
+            return None, best[1], best[2]
+        return best
+
+    def _frame_box(
+        self, homography: npt.NDArray[Any], shape: Tuple[int, ...]
+    ) -> Tuple[int, int, int, int]:
+        """Return the (left, top, right, bottom) box of a warped frame in the mosaic aligned to the preview blocks"""
+        height, width = shape[:2]
+        corners = cv2.perspectiveTransform(
+            np.array([[[0, 0]], [[width, 0]], [[width, height]], [[0, height]]], float),
+            homography,
+        )[:, 0]
+        factor = self.preview_factor
+        left, top = (np.floor(corners.min(axis=0) / factor) * factor).astype(int)
+        right, bottom = (np.ceil(corners.max(axis=0) / factor) * factor).astype(int)
+        return int(left), int(top), int(right), int(bottom)
+
+    def _grow(self, box: Tuple[int, int, int, int]) -> None:
+        """Grow the canvas so that it contains a box of the mosaic, by at least growth times its size per side"""
+        height, width = self.canvas.shape[:2]
+        left, top = box[0] + self.origin[0], box[1] + self.origin[1]
+        right, bottom = box[2] + self.origin[0], box[3] + self.origin[1]
+        needed = [max(-left, 0), max(-top, 0), max(right - width, 0)]
+        needed.append(max(bottom - height, 0))
+        if not any(needed):
+            return
+        factor = self.preview_factor
+        pads = [
+            (
+                0
+                if not need
+                else math.ceil(max(need, (self.growth - 1) * size) / factor) * factor
+            )
+            for need, size in zip(needed, [width, height, width, height])
+        ]
+        with span("growth") as stage:
+            canvas = np.zeros(
+                (height + pads[1] + pads[3], width + pads[0] + pads[2], 3), np.uint8
+            )
+            canvas[pads[1] : pads[1] + height, pads[0] : pads[0] + width] = self.canvas
+            preview = np.zeros(
+                (canvas.shape[0] // factor, canvas.shape[1] // factor, 3), np.uint8
+            )
+            preview[
+                pads[1] // factor : (pads[1] + height) // factor,
+                pads[0] // factor : (pads[0] + width) // factor,
+            ] = self.preview_canvas
+            stage.add_pixels([canvas])
+        self.canvas, self.preview_canvas = canvas, preview
+        self.origin = (self.origin[0] + pads[0], self.origin[1] + pads[1])
+        self.growths += 1
+        logger.debug("The canvas grew to %s.", canvas.shape[:2])
+
+    def _paste(
+        self, frame: npt.NDArray[Any], homography: npt.NDArray[Any]
+    ) -> Tuple[int, int, int, int]:
+        """Warp a frame into its box of the canvas, paste it over the canvas and update the preview of the box"""
+        box = self._frame_box(homography, frame.shape)
+        if self.extent is None:
+            size = (box[3] - box[1], box[2] - box[0])
+            self.canvas = np.zeros((*size, 3), np.uint8)
+            self.preview_canvas = np.zeros(
+                (size[0] // self.preview_factor, size[1] // self.preview_factor, 3),
+                np.uint8,
+            )
+            self.origin = (-box[0], -box[1])
+        self._grow(box)
+        left, top = box[0] + self.origin[0], box[1] + self.origin[1]
+        right, bottom = box[2] + self.origin[0], box[3] + self.origin[1]
+        shift = np.array([[1.0, 0, -box[0]], [0, 1.0, -box[1]], [0, 0, 1.0]])
+        with span("warping") as stage:
+            warped = cv2.warpPerspective(
+                frame, shift @ homography, (right - left, bottom - top)
+            )
+            stage.add_pixels([warped])
+        with span("blending") as stage:
+            stage.add_pixels([warped])
+            self.canvas[top:bottom, left:right] = SequentialStitcher.stitch_cleaner(
+                warped, self.canvas[top:bottom, left:right]
+            )
+            factor = self.preview_factor
+            self.preview_canvas[
+                top // factor : bottom // factor, left // factor : right // factor
+            ] = cv2.resize(
+                self.canvas[top:bottom, left:right],
+                ((right - left) // factor, (bottom - top) // factor),
+                interpolation=cv2.INTER_AREA,
+            )
+        return left, top, right, bottom
+
+    def add_frame(self, image: Any) -> Dict[str, Any]:
+        """Register a BGR frame (or any image source of the loaders) against the recent frames and paste it.
+
+        Return the record of the frame. A frame that does not register is left out of the mosaic and of the window.
+        """
+        start = time.perf_counter()
+        idx = len(self.homographies)
+        frame = to_opencv_image(image)
+        homography, reference, inliers = self._register(idx, frame)
+        self.homographies.append(homography)
+        if homography is None:
+            self.matching.features.pop(idx, None)
+            logger.warning(
+                "Frame %s is not added with %s inliers to the recent frames.",
+                idx,
+                inliers,
+            )
+        else:
+            box = self._paste(frame, homography)
+            evicted = self.recent[0][0] if len(self.recent) == self.window else None
+            self.recent.append((idx, homography))
+            if evicted is not None:
+                self.matching.evict(evicted)
+            self._extend(box)
+        record = {
+            "frame": idx,
+            "added": homography is not None,
+            "reference": reference,
+            "inliers": inliers,
+            "canvas": self.canvas.shape[:2],
+            "seconds": time.perf_counter() - start,
+        }
+        logger.info("Online frame: %s", record)
+        return record
+
+    def _extend(self, box: Tuple[int, int, int, int]) -> None:
+        """Extend the canvas box of the pasted frames with a new box"""
+        box_mosaic = [
+            box[0] - self.origin[0],
+            box[1] - self.origin[1],
+            box[2] - self.origin[0],
+            box[3] - self.origin[1],
+        ]
+        if self.extent is None:
+            self.extent = box_mosaic
+        else:
+            self.extent = [
+                min(self.extent[0], box_mosaic[0]),
+                min(self.extent[1], box_mosaic[1]),
+                max(self.extent[2], box_mosaic[2]),
+                max(self.extent[3], box_mosaic[3]),
+            ]
+
+    def _crop(self, image: npt.NDArray[Any], factor: int) -> Optional[npt.NDArray[Any]]:
+        """Crop an image of the canvas at a downscale factor to the box of the pasted frames"""
+        if self.extent is None:
+            return None
+        left, top = self.extent[0] + self.origin[0], self.extent[1] + self.origin[1]
+        right, bottom = (
+            self.extent[2] + self.origin[0],
+            self.extent[3] + self.origin[1],
+        )
+        return image[top // factor : bottom // factor, left // factor : right // factor]
+
+    def mosaic(self) -> Optional[npt.NDArray[Any]]:
+        """Return the BGR mosaic of the frames so far without the unused canvas"""
+        return self._crop(self.canvas, 1)
+
+    def preview(self) -> Optional[npt.NDArray[Any]]:
+        """Return the BGR mosaic downscaled by preview_factor without resizing the whole canvas"""
+        return self._crop(self.preview_canvas, self.preview_factor)
@@ -1,11 +1,12 @@
 """This is a simple stitcher approach with opencv"""
 
 from dataclasses import dataclass, field
-from typing import Any, Optional
+from typing import Any, List, Optional
 from enum import Enum
 import logging
 import cv2
-import torch
+from .profiling import span
+from .cache import cached_result
 from .utility import ImageLoader
 
 logger = logging.getLogger(__name__)
@@ -16,12 +17,14 @@ class SimpleStitcher(ImageLoader):
     """Simple stitcher approach with opencv"""
 
     stitcher_type: str = field(default="panorama")
+    registration_resol: Optional[float] = field(default=None)
+    seam_estimation_resol: Optional[float] = field(default=None)
+    compositing_resol: Optional[float] = field(default=None)
+    image_stitcher: Optional[Any] = field(init=False, default=None)
 
     def __post_init__(self) -> None:
         """Check if the matcher is defined or not and other post-processing requirements"""
-        if self.device == "cuda" and not torch.cuda.is_available():
-            logger.info("%s is not available", self.device)
-            self.device = "cpu"
+        super().__post_init__()
         self.opencv_load_images()
 
     @staticmethod
@@ -38,8 +41,8 @@ class SimpleStitcher(ImageLoader):
             status_number
         ).name  # type: ignore
 
-    def stitcher(self, result_path: str = "", framer: bool = True) -> Optional[Any]:
-        """Stitch images with feature matcher"""
+    def _create_stitcher(self) -> Optional[Any]:
+        """Create the opencv stitcher with the selected resolutions in megapixels"""
         if self.stitcher_type == "panorama":
             image_stitcher = cv2.Stitcher.create(cv2.Stitcher_PANORAMA)
         elif self.stitcher_type == "scan":
@@ -50,7 +53,53 @@ class SimpleStitcher(ImageLoader):
                 self.stitcher_type,
             )
             return None
-        stitch_status, stitched_image = image_stitcher.stitch(self.images)
+        if self.registration_resol is not None:
+            image_stitcher.setRegistrationResol(self.registration_resol)
+        if self.seam_estimation_resol is not None:
+            image_stitcher.setSeamEstimationResol(self.seam_estimation_resol)
+        if self.compositing_resol is not None:
+            image_stitcher.setCompositingResol(self.compositing_resol)
+        return image_stitcher
+
+    def estimate(self) -> bool:
+        """Estimate the transforms of the loaded images and keep the opencv stitcher for compose"""
+        self.image_stitcher = self._create_stitcher()
+        if self.image_stitcher is None:
+            return False
+        with span("estimation") as stage:
+            stage.add_pixels(self.images)
+            stitch_status = self.image_stitcher.estimateTransform(self.images)
+        if stitch_status != 0:
+            logger.warning(
+                "Estimating transforms FAILED with status: %s",
+                self.stitching_status(stitch_status),
+            )
+            self.image_stitcher = None
+            return False
+        logger.info("Estimating transforms was successful.")
+        return True
+
+    def compose(
+        self,
+        images: Optional[List[Any]] = None,
+        result_path: str = "",
+        framer: bool = True,
+    ) -> Optional[Any]:
+        """Compose images of the same scene with the transforms of the last estimate call"""
+        if self.image_stitcher is None:
+            raise ValueError("Transforms are not estimated. Call estimate first.")
+        if images is not None and len(self.image_stitcher.component()) != len(images):
+            raise ValueError(
+                "Composing new images needs all the images to be in the estimated panorama."
+            )
+        with span("composition") as stage:
+            if images is None:
+                stitch_status, stitched_image = self.image_stitcher.composePanorama()
+            else:
+                stitch_status, stitched_image = self.image_stitcher.composePanorama(
+                    images
+                )
+            stage.add_pixels([stitched_image] if stitch_status == 0 else [])
         if stitch_status == 0:
             logger.info("Stitching images was successful.")
             if result_path != "":
@@ -66,3 +115,10 @@ class SimpleStitcher(ImageLoader):
             self.stitching_status(stitch_status),
         )
         return None
+
+    @cached_result
+    def stitcher(self, result_path: str = "", framer: bool = True) -> Optional[Any]:
+        """Stitch images with feature matcher"""
+        if not self.estimate():
+            return None
+        return self.compose(result_path=result_path, framer=framer)
@@ -0,0 +1,139 @@
+"""Candidate image pairs for unordered image sets based on cheap global signatures"""
+
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+import logging
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+from stitching.feature_detector import FeatureDetector
+from stitching.feature_matcher import FeatureMatcher
+from stitching.images import Images
+
+logger = logging.getLogger(__name__)
+
+
+def global_signatures(
+    images: Sequence[npt.NDArray[Any]], thumbnail_size: int = 16, bins: int = 8
+) -> npt.NDArray[np.float32]:
+    """Return one L2-normalized signature per image from a gray thumbnail and a hue/saturation histogram"""
+    signatures = []
+    for image in images:
+        thumbnail = cv2.resize(
+            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
+            (thumbnail_size, thumbnail_size),
+            interpolation=cv2.INTER_AREA,
+        ).astype(np.float32)
+        thumbnail -= thumbnail.mean()
+        thumbnail /= np.linalg.norm(thumbnail) + 1e-6
+        small = cv2.resize(image, (64, 64), interpolation=cv2.INTER_AREA)
+        histogram = cv2.calcHist(
+            [cv2.cvtColor(small, cv2.COLOR_BGR2HSV)],
+            [0, 1],
+            None,
+            [bins, bins],
+            [0, 180, 0, 256],
+        ).ravel()
+        histogram = np.sqrt(histogram / (histogram.sum() + 1e-6))
+        signature = np.concatenate([thumbnail.ravel(), histogram])
+        signatures.append(signature / (np.linalg.norm(signature) + 1e-6))
+    return np.asarray(signatures, dtype=np.float32)
+
+
+def _spanning_tree_pairs(similarity: npt.NDArray[np.float32]) -> Set[Tuple[int, int]]:
+    """Return the pairs of the maximum spanning tree of the similarity matrix (Prim's algorithm)"""
+    image_number = len(similarity)
+    in_tree = np.zeros(image_number, dtype=bool)
+    in_tree[0] = True
+    best_similarity = similarity[0].copy()
+    best_parent = np.zeros(image_number, dtype=np.int64)
+    pairs = set()
+    for _ in range(image_number - 1):
+        candidates = np.where(in_tree, -np.inf, best_similarity)
+        idx = int(np.argmax(candidates))
+        parent = int(best_parent[idx])
+        pairs.add((min(idx, parent), max(idx, parent)))
+        in_tree[idx] = True
+        closer = similarity[idx] > best_similarity
+        best_similarity[closer] = similarity[idx][closer]
+        best_parent[closer] = idx
+    return pairs
+
+
+def candidate_pairs(
+    signatures: npt.NDArray[np.float32], neighbours: int, connected: bool = True
+) -> Set[Tuple[int, int]]:
+    """Return the (i, j) pairs with i < j of the symmetric k-nearest-neighbour graph of the signatures.
+
+    If connected is set, the pairs of the maximum spanning tree are added so that no image is isolated.
+    """
+    similarity = signatures @ signatures.T
+    np.fill_diagonal(similarity, -np.inf)
+    neighbours = min(neighbours, len(signatures) - 1)
+    pairs = set()
+    for idx, row in enumerate(similarity):
+        for other in np.argsort(-row)[:neighbours]:
+            pairs.add((min(idx, int(other)), max(idx, int(other))))
+    if connected and len(signatures) > 1:
+        pairs |= _spanning_tree_pairs(similarity)
+    return pairs
+
+
+def matching_mask(
+    pairs: Set[Tuple[int, int]], image_number: int
+) -> npt.NDArray[np.uint8]:
+    """Convert candidate pairs to the matching mask of the opencv feature matchers"""
+    mask = np.zeros((image_number, image_number), dtype=np.uint8)
+    for idx, other in pairs:
+        mask[idx, other] = 1
+        mask[other, idx] = 1
+    return mask
+
+
+def recall_report(  # pylint: disable=R0914
+    images: Sequence[npt.NDArray[Any]],
+    neighbours: Sequence[int],
+    detector: str = "sift",
+    confidence_threshold: float = 0.5,
+) -> List[Dict[str, Any]]:
+    """Compare pruned matching with all-pairs matching in terms of pair recall and matching time"""
+    medium_images = list(Images.of(list(images)).resize(Images.Resolution.MEDIUM))
+    features = FeatureDetector(detector).detect(medium_images)
+    matcher = FeatureMatcher()
+    start = time.perf_counter()
+    all_matches = matcher.match_features(features)
+    full_time = time.perf_counter() - start
+    true_pairs = {
+        (match.src_img_idx, match.dst_img_idx)
+        for match in all_matches
+        if match.src_img_idx < match.dst_img_idx
+        and match.confidence > confidence_threshold
+    }
+    start = time.perf_counter()
+    signatures = global_signatures(images)
+    signature_time = time.perf_counter() - start
+    report = [
+        {
+            "neighbours": -1,
+            "pairs": len(images) * (len(images) - 1) // 2,
+            "recall": 1.0,
+            "matching_seconds": full_time,
+        }
+    ]
+    for neighbour in neighbours:
+        start = time.perf_counter()
+        pairs = candidate_pairs(signatures, neighbour)
+        matcher.match_features(features, matching_mask(pairs, len(images)))
+        report.append(
+            {
+                "neighbours": neighbour,
+                "pairs": len(pairs),
+                "recall": (
+                    len(true_pairs & pairs) / len(true_pairs) if true_pairs else 1.0
+                ),
+                "matching_seconds": time.perf_counter() - start + signature_time,
+            }
+        )
+        logger.info("Pair pruning report: %s", report[-1])
+    return report
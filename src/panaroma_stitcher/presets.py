@@ -0,0 +1,32 @@
+"""Performance presets of the detailed stitcher without importing the stitching library"""
+
+from typing import Any, Dict
+
+# Resolutions are in megapixels and range_width limits matching to the given number of neighbouring images (-1 matches all pairs).
+# The presets match all pairs, since a range only suits images in the file order of the scene
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "fast": {
+        "medium_megapix": 0.3,
+        "low_megapix": 0.05,
+        "final_megapix": 0.5,
+        "range_width": -1,
+        "finder": "voronoi",
+        "blender_type": "feather",
+    },
+    "balanced": {
+        "medium_megapix": 0.6,
+        "low_megapix": 0.1,
+        "final_megapix": 1.0,
+        "range_width": -1,
+        "finder": "dp_color",
+        "blender_type": "multiband",
+    },
+    "quality": {
+        "medium_megapix": 1.0,
+        "low_megapix": 0.2,
+        "final_megapix": -1,
+        "range_width": -1,
+        "finder": "gc_colorgrad",
+        "blender_type": "multiband",
+    },
+}
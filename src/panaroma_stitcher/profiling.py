@@ -0,0 +1,265 @@
+"""Named spans for per-stage timing and memory of the stitchers"""
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import types
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LogSink:
+    """Write every span as a structured log line"""
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        """Log one span record"""
+        logger.info("span %s", json.dumps(record))
+
+    def close(self) -> None:
+        """Nothing to flush for log lines"""
+
+
+class JsonSink:
+    """Collect the spans and write them as a JSON list when profiling is disabled"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records: List[Dict[str, Any]] = []
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        """Keep one span record"""
+        self.records.append(record)
+
+    def _content(self) -> Any:
+        """Content of the trace file"""
+        return self.records
+
+    def close(self) -> None:
+        """Write the trace file"""
+        with open(self.path, "w", encoding="utf-8") as trace_file:
+            json.dump(self._content(), trace_file, indent=2)
+        logger.info("Profile of %s spans saved to %s", len(self.records), self.path)
+
+
+class ChromeTraceSink(JsonSink):
+    """Write the spans in the chrome trace event format (chrome://tracing or perfetto)"""
+
+    def _content(self) -> Any:
+        """Complete events of the chrome trace format in microseconds"""
+        return {
+            "traceEvents": [
+                {
+                    "name": record["name"],
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["wall_seconds"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": record["thread"],
+                    "args": {
+                        key: value
+                        for key, value in record.items()
+                        if key not in ["name", "start", "wall_seconds", "thread"]
+                    },
+                }
+                for record in self.records
+            ]
+        }
+
+
+SINKS: Dict[str, Callable[[str], Any]] = {
+    "log": lambda path: LogSink(),
+    "json": JsonSink,
+    "chrome": ChromeTraceSink,
+}
+
+
+class _Profiler:
+    """Active profiling state with its sink"""
+
+    def __init__(self, sink: Any, memory: bool, owns_tracing: bool) -> None:
+        self.sink = sink
+        self.memory = memory
+        self.owns_tracing = owns_tracing
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def stack(self) -> List["_Span"]:
+        """Open spans of the current thread"""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack  # type: ignore[no-any-return]
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        """Pass a finished span to the sink"""
+        with self.lock:
+            self.sink.emit(record)
+
+
+class _NullSpan:
+    """Span used when profiling is disabled"""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        return None
+
+    def add_pixels(self, images: Sequence[Any]) -> None:
+        """Pixels are not counted when profiling is disabled"""
+
+
+class _Span:
+    """Measure wall time, CPU time, processed pixels and optionally the tracemalloc peak of a block"""
+
+    def __init__(self, profiler: _Profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.pixels = 0
+        self.peak = 0
+        self.wall_start = 0.0
+        self.cpu_start = 0.0
+
+    def add_pixels(self, images: Sequence[Any]) -> None:
+        """Add the pixels of opencv (HxWxC) images or torch (BxCxHxW) tensors to the span"""
+        for image in images:
+            if isinstance(image, np.ndarray):
+                self.pixels += int(image.shape[0] * image.shape[1])
+            else:
+                self.pixels += int(image.shape[-2] * image.shape[-1])
+
+    def __enter__(self) -> "_Span":
+        stack = self.profiler.stack()
+        if self.profiler.memory:
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        stack = self.profiler.stack()
+        stack.pop()
+        record = {
+            "name": self.name,
+            "parent": stack[-1].name if stack else None,
+            "start": self.wall_start - self.profiler.origin,
+            "wall_seconds": wall_end - self.wall_start,
+            "cpu_seconds": cpu_end - self.cpu_start,
+            "pixels": self.pixels,
+            "thread": threading.get_ident(),
+        }
+        if self.profiler.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            record["peak_memory_mb"] = self.peak / 1024**2
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+        self.profiler.emit(record)
+
+
+_NULL_SPAN = _NullSpan()
+_PROFILER: Optional[_Profiler] = None
+
+
+def enable(
+    sink: Union[str, Any] = "log", path: str = "./profile.json", memory: bool = False
+) -> None:
+    """Enable profiling with a sink name (log, json, chrome) or any object with emit and close methods"""
+    global _PROFILER  # pylint: disable=global-statement
+    disable()
+    if isinstance(sink, str):
+        sink = SINKS[sink](path)
+    owns_tracing = memory and not tracemalloc.is_tracing()
+    if owns_tracing:
+        tracemalloc.start()
+    _PROFILER = _Profiler(sink, memory, owns_tracing)
+
+
+def disable() -> None:
+    """Disable profiling, stop the memory tracing it started and flush the sink"""
+    global _PROFILER  # pylint: disable=global-statement
+    if _PROFILER is None:
+        return
+    profiler, _PROFILER = _PROFILER, None
+    if profiler.owns_tracing:
+        tracemalloc.stop()
+    profiler.sink.close()
+
+
+def is_enabled() -> bool:
+    """Whether profiling is enabled"""
+    return _PROFILER is not None
+
+
+def span(name: str) -> Union[_Span, _NullSpan]:
+    """Return a context manager that measures a named stage, or a shared no-op span if profiling is disabled"""
+    if _PROFILER is None:
+        return _NULL_SPAN
+    return _Span(_PROFILER, name)
+
+
+def _spanned_items(items: Iterator[Any], name: str) -> Iterator[Any]:
+    """Produce every item of a lazy generator in a span, where it is consumed"""
+    while True:
+        with span(name):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        yield item
+
+
+def _spanned(method: Any, name: str) -> Any:
+    """Wrap a callable in a span, and the generators it returns alone or in a tuple in spans of their items"""
+
+    @functools.wraps(method)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name):
+            result = method(*args, **kwargs)
+        if isinstance(result, types.GeneratorType):
+            return _spanned_items(result, name)
+        if isinstance(result, tuple):
+            return tuple(
+                (
+                    _spanned_items(item, name)
+                    if isinstance(item, types.GeneratorType)
+                    else item
+                )
+                for item in result
+            )
+        return result
+
+    return wrapper
+
+
+def profile_methods(obj: Any, names: Mapping[str, str]) -> None:
+    """Wrap methods of an object from another library in spans, e.g. the stages of the stitching library.
+
+    The lazy stages of the final resolution return generators, so their items are timed when they are consumed.
+    """
+    if _PROFILER is None:
+        return
+    for method_name, span_name in names.items():
+        setattr(obj, method_name, _spanned(getattr(obj, method_name), span_name))
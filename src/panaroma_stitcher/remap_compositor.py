@@ -0,0 +1,260 @@
+"""Real-time compositor for fixed rigs based on precomputed remap tables"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import json
+import logging
+import tempfile
+import time
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160)}
+
+
+@dataclass
+class RemapCompositor:
+    """Compose frame sets of a fixed rig with fixed-point remap tables and blend weights"""
+
+    lut_dir: Path
+    workers: int = field(default=1)
+    band_height: int = field(default=128)
+    canvas_size: Tuple[int, int] = field(init=False)
+    frame_sizes: List[Tuple[int, int]] = field(init=False)
+    luts: List[Dict[str, Any]] = field(init=False)
+
+    def __post_init__(self) -> None:
+        """Memory-map the remap tables and blend weights from the lut directory"""
+        with open(self.lut_dir / "meta.json", "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        self.canvas_size = (meta["canvas_size"][0], meta["canvas_size"][1])
+        self.frame_sizes = [(size[0], size[1]) for size in meta["frame_sizes"]]
+        self.luts = [
+            {
+                "roi": roi,
+                "map1": np.load(self.lut_dir / f"frame_{idx}_map1.npy", mmap_mode="r"),
+                "map2": np.load(self.lut_dir / f"frame_{idx}_map2.npy", mmap_mode="r"),
+                "weight": np.load(
+                    self.lut_dir / f"frame_{idx}_weight.npy", mmap_mode="r"
+                ),
+            }
+            for idx, roi in enumerate(meta["rois"])
+        ]
+        logger.info(
+            "Loaded remap tables of %s frames with canvas size %s",
+            len(self.luts),
+            self.canvas_size,
+        )
+
+    @staticmethod
+    def _canvas_layout(
+        homographies: Sequence[npt.NDArray[Any]],
+        frame_sizes: Sequence[Tuple[int, int]],
+        canvas_size: Optional[Tuple[int, int]],
+    ) -> Tuple[List[npt.NDArray[np.float64]], Tuple[int, int]]:
+        """Return the frame to canvas homographies and the canvas size as (width, height)"""
+        corners = [
+            cv2.perspectiveTransform(
+                np.array(
+                    [[[0, 0], [width, 0], [width, height], [0, height]]],
+                    dtype=np.float64,
+                ),
+                np.asarray(homography, dtype=np.float64),
+            )[0]
+            for homography, (width, height) in zip(homographies, frame_sizes)
+        ]
+        if canvas_size is not None:
+            return [np.asarray(h, dtype=np.float64) for h in homographies], canvas_size
+        all_corners = np.concatenate(corners)
+        x_min, y_min = np.floor(all_corners.min(axis=0))
+        x_max, y_max = np.ceil(all_corners.max(axis=0))
+        offset = np.array([[1.0, 0.0, -x_min], [0.0, 1.0, -y_min], [0.0, 0.0, 1.0]])
+        return [np.dot(offset, h) for h in homographies], (
+            int(x_max - x_min),
+            int(y_max - y_min),
+        )
+
+    @staticmethod
+    def _frame_roi(
+        homography: npt.NDArray[np.float64],
+        frame_size: Tuple[int, int],
+        canvas_size: Tuple[int, int],
+    ) -> List[int]:
+        """Bounding box (x, y, w, h) of a warped frame clipped to the canvas"""
+        width, height = frame_size
+        corners = cv2.perspectiveTransform(
+            np.array(
+                [[[0, 0], [width, 0], [width, height], [0, height]]], dtype=np.float64
+            ),
+            homography,
+        )[0]
+        x_0, y_0 = np.clip(np.floor(corners.min(axis=0)), 0, canvas_size).astype(int)
+        x_1, y_1 = np.clip(np.ceil(corners.max(axis=0)), 0, canvas_size).astype(int)
+        return [int(x_0), int(y_0), int(x_1 - x_0), int(y_1 - y_0)]
+
+    @classmethod
+    def build(  # pylint: disable=R0913, R0914, R0917
+        cls,
+        homographies: Sequence[npt.NDArray[Any]],
+        frame_sizes: Sequence[Tuple[int, int]],
+        lut_dir: Path,
+        canvas_size: Optional[Tuple[int, int]] = None,
+        workers: int = 1,
+    ) -> "RemapCompositor":
+        """Precompute the fixed-point remap tables and feathering weights of a rig.
+
+        homographies map every frame into a common canvas and frame_sizes are (width, height)
+        of the frames. If canvas_size is not given, the canvas covers all the warped frames.
+        """
+        lut_dir.mkdir(parents=True, exist_ok=True)
+        homographies, canvas_size = cls._canvas_layout(
+            homographies, frame_sizes, canvas_size
+        )
+        rois = [
+            cls._frame_roi(homography, frame_size, canvas_size)
+            for homography, frame_size in zip(homographies, frame_sizes)
+        ]
+        total_weight = np.zeros((canvas_size[1], canvas_size[0]), dtype=np.float32)
+        feathers = []
+        for homography, frame_size, (x_0, y_0, width, height) in zip(
+            homographies, frame_sizes, rois
+        ):
+            grid_x, grid_y = np.meshgrid(
+                np.arange(x_0, x_0 + width, dtype=np.float64),
+                np.arange(y_0, y_0 + height, dtype=np.float64),
+            )
+            points = np.stack([grid_x, grid_y, np.ones_like(grid_x)], axis=-1)
+            source = points @ np.linalg.inv(homography).T
+            map_x = (source[..., 0] / source[..., 2]).astype(np.float32)
+            map_y = (source[..., 1] / source[..., 2]).astype(np.float32)
+            feather = np.minimum(
+                np.minimum(map_x + 0.5, frame_size[0] - 0.5 - map_x),
+                np.minimum(map_y + 0.5, frame_size[1] - 0.5 - map_y),
+            )
+            feather = np.clip(feather, 0, None).astype(np.float32)
+            total_weight[y_0 : y_0 + height, x_0 : x_0 + width] += feather
+            feathers.append((map_x, map_y, feather))
+        for idx, ((map_x, map_y, feather), (x_0, y_0, width, height)) in enumerate(
+            zip(feathers, rois)
+        ):
+            total = total_weight[y_0 : y_0 + height, x_0 : x_0 + width]
+            weight = np.divide(
+                feather, total, out=np.zeros_like(feather), where=total > 0
+            )
+            map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+            np.save(lut_dir / f"frame_{idx}_map1.npy", map1)
+            np.save(lut_dir / f"frame_{idx}_map2.npy", map2)
+            np.save(lut_dir / f"frame_{idx}_weight.npy", weight)
+        with open(lut_dir / "meta.json", "w", encoding="utf-8") as meta_file:
+            json.dump(
+                {
+                    "canvas_size": list(canvas_size),
+                    "frame_sizes": [list(size) for size in frame_sizes],
+                    "rois": rois,
+                },
+                meta_file,
+            )
+        logger.info("Remap tables of %s frames saved to %s", len(rois), lut_dir)
+        return cls(lut_dir, workers=workers)
+
+    @staticmethod
+    def _warp_rows(
+        frame: npt.NDArray[Any], lut: Dict[str, Any], rows: slice
+    ) -> npt.NDArray[Any]:
+        """Remap some rows of the frame ROI and multiply them with their blend weights"""
+        return np.multiply(
+            cv2.remap(
+                frame,
+                np.asarray(lut["map1"][rows]),
+                np.asarray(lut["map2"][rows]),
+                cv2.INTER_LINEAR,
+                borderMode=cv2.BORDER_CONSTANT,
+            ),
+            lut["weight"][rows, :, None],
+        )
+
+    def _compose_band(
+        self,
+        frames: Sequence[npt.NDArray[Any]],
+        result: npt.NDArray[Any],
+        y_range: Tuple[int, int],
+    ) -> None:
+        """Remap and blend all the frames into one row band of the result"""
+        band_start, band_end = y_range
+        accumulator = np.zeros(
+            (band_end - band_start, self.canvas_size[0], 3), dtype=np.float32
+        )
+        for frame, lut in zip(frames, self.luts):
+            x_0, y_0, width, height = lut["roi"]
+            start, end = max(band_start, y_0), min(band_end, y_0 + height)
+            if start < end:
+                accumulator[
+                    start - band_start : end - band_start, x_0 : x_0 + width
+                ] += self._warp_rows(frame, lut, slice(start - y_0, end - y_0))
+        result[band_start:band_end] = np.clip(accumulator + 0.5, 0, 255)
+
+    def compose(self, frames: Sequence[npt.NDArray[Any]]) -> npt.NDArray[Any]:
+        """Compose a frame set with remap and a weighted sum only"""
+        if len(frames) != len(self.luts):
+            raise ValueError(
+                f"The compositor expects {len(self.luts)} frames but got {len(frames)}."
+            )
+        frame_sizes = [(frame.shape[1], frame.shape[0]) for frame in frames]
+        if frame_sizes != self.frame_sizes:
+            raise ValueError(
+                f"The compositor expects frames of sizes {self.frame_sizes} but got {frame_sizes}."
+            )
+        result = np.empty((self.canvas_size[1], self.canvas_size[0], 3), dtype=np.uint8)
+        bands = [
+            (start, min(start + self.band_height, self.canvas_size[1]))
+            for start in range(0, self.canvas_size[1], self.band_height)
+        ]
+        if self.workers <= 1:
+            for band in bands:
+                self._compose_band(frames, result, band)
+            return result
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(
+                executor.map(
+                    lambda band: self._compose_band(frames, result, band), bands
+                )
+            )
+        return result
+
+
+def benchmark(
+    resolution: str = "1080p", frames: int = 3, repeats: int = 10, workers: int = 1
+) -> float:
+    """Return the throughput of the remap compositor in frame sets per second"""
+    width, height = RESOLUTIONS[resolution]
+    step = int(width * 0.8)
+    homographies = [
+        np.array([[1.0, 0.0, idx * step], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        for idx in range(frames)
+    ]
+    rng = np.random.default_rng(0)
+    frame_set = [
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(frames)
+    ]
+    with tempfile.TemporaryDirectory() as lut_dir:
+        compositor = RemapCompositor.build(
+            homographies, [(width, height)] * frames, Path(lut_dir), workers=workers
+        )
+        compositor.compose(frame_set)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compositor.compose(frame_set)
+        elapsed = time.perf_counter() - start
+    logger.info(
+        "Remap compositor throughput at %s with %s workers: %.2f fps",
+        resolution,
+        workers,
+        repeats / elapsed,
+    )
+    return repeats / elapsed
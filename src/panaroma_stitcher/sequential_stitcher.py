@@ -1,29 +1,66 @@
 """This stitches sequnces of images by finding homography transform between pairs of images"""
 
 from dataclasses import dataclass, field
-from typing import Any, Tuple, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Optional
 
 import logging
 import cv2
 import numpy as np
 import numpy.typing as npt
 
+from .matching import MatchingEngine
+from .profiling import span
+from .blending import SeamBlender
+from .cache import ResultCache, cached_result
+from .checkpoint import StitchCheckpoint
+from .global_alignment import Constraint, loop_candidates, refine
+from .tiling import detect_and_compute_tiled
 from .utility import ImageLoader
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
-class SequentialStitcher(ImageLoader):
-    """This is pair wise stitcher between sequential images"""
+class SequentialStitcher(ImageLoader):  # pylint: disable=too-many-instance-attributes
+    """This is pair wise stitcher between sequential images.
+
+    With checkpoint_dir, the progress is saved every checkpoint_interval frames and a restarted stitch of the same
+    images and settings resumes after the last checkpointed frame.
+
+    With global_alignment, every frame is also matched to its loop_neighbours closest earlier or later frames in the
+    chained estimate, and the homographies of all frames are refined together over all pairs before the frames are
+    pasted. The report of the refinement is kept in alignment_report.
+
+    With a blender other than "no", every frame is pasted with a seam of seam_finder and blended in the band around its
+    overlap with the canvas.
+    """
 
     feature_detector: str = field(default="sift")
     number_feature: int = field(default=100)
     matcher_type: str = field(default="bf")
     final_size: Tuple[int, int] = field(default_factory=lambda: (1000, 1000))
+    tile_grid: Optional[Tuple[int, int]] = field(default=None)
+    tile_overlap: int = field(default=32)
+    flann_checks: int = field(default=50)
+    checkpoint_dir: Optional[Path] = field(default=None)
+    checkpoint_interval: int = field(default=50)
+    global_alignment: bool = field(default=False)
+    loop_neighbours: int = field(default=2)
+    loop_min_inliers: int = field(default=20)
+    blender: str = field(default="no")
+    seam_finder: str = field(default="dp_color")
+    matching: MatchingEngine = field(init=False, repr=False)
+    correspondences: Dict[
+        Tuple[int, int], Tuple[npt.NDArray[Any], npt.NDArray[Any]]
+    ] = field(init=False, default_factory=dict, repr=False)
+    alignment_report: Optional[Dict[str, Any]] = field(init=False, default=None)
+    seam_blender: SeamBlender = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
         """Check post-processing requirements"""
+        self.matching = MatchingEngine(self.matcher_type, checks=self.flann_checks)
+        self.seam_blender = SeamBlender(self.blender, self.seam_finder)
         self.opencv_load_images()
 
     def detect_and_describe(self) -> Any:
@@ -36,15 +73,25 @@ class SequentialStitcher(ImageLoader):
             self.number_feature, contrastThreshold=0.01, edgeThreshold=7, sigma=0.8
         )
 
+    def detect_features(
+        self, image: npt.NDArray[Any]
+    ) -> Tuple[Tuple[Any, ...], Optional[npt.NDArray[Any]]]:
+        """Detect and describe the keypoints of an image at once or in tiles with a feature budget per tile"""
+        if self.tile_grid is None:
+            return self.detect_and_describe().detectAndCompute(image, None)  # type: ignore[no-any-return]
+        budget = -(-self.number_feature // (self.tile_grid[0] * self.tile_grid[1]))
+        return detect_and_compute_tiled(
+            self.detect_and_describe,
+            image,
+            self.tile_grid,
+            self.tile_overlap,
+            budget,
+            self.execution.threads_per_worker() if self.execution else None,
+        )
+
     def matcher(self) -> Any:
         """Matcher from opencv"""
-        if self.matcher_type == "bf":
-            if self.feature_detector == "sift":
-                bruteforce = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
-            else:
-                bruteforce = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            return bruteforce
-        return cv2.FlannBasedMatcher({"algorithm": 0, "trees": 20}, {"checks": 150})
+        return self.matching.create(binary=self.feature_detector != "sift")
 
     @staticmethod
     def stitch_cleaner(
@@ -60,32 +107,131 @@ class SequentialStitcher(ImageLoader):
         return stitched_image
 
     def _transform_finder(
-        self, image_left: npt.NDArray[np.float32], image_right: npt.NDArray[np.float32]
+        self,
+        image_left: npt.NDArray[np.float32],
+        image_right: npt.NDArray[np.float32],
+        keys: Tuple[Optional[int], Optional[int]] = (None, None),
     ) -> Any:
-        """Define the helper for stitching images and return the homography between pairs of images"""
-        descriptor = self.detect_and_describe()
-        img_left_key, img_left_desc = descriptor.detectAndCompute(image_left, None)
-        img_right_key, img_right_desc = descriptor.detectAndCompute(image_right, None)
-
-        matcher = self.matcher()
-        matches = matcher.match(img_right_desc, img_left_desc)
-        right_points = np.asarray(
-            [img_right_key[match.queryIdx].pt for match in matches]
-        ).reshape(-1, 1, 2)
-        left_points = np.asarray(
-            [img_left_key[match.trainIdx].pt for match in matches]
-        ).reshape(-1, 1, 2)
-        homography, _ = cv2.findHomography(right_points, left_points, cv2.RANSAC, 5.0)
+        """Define the helper for stitching images and return the homography between pairs of images.
+
+        The features and matching indexes of the images with keys are reused by all their pairs, and the inlier
+        correspondences of the pair are kept in correspondences.
+        """
+        with span("detection") as stage:
+            stage.add_pixels([image_left, image_right])
+            img_left_key, img_left_desc = self.matching.describe(
+                keys[0], image_left, self.detect_features
+            )
+            img_right_key, img_right_desc = self.matching.describe(
+                keys[1], image_right, self.detect_features
+            )
+
+        with span("matching"):
+            matches = self.matching.match(img_right_desc, img_left_desc, keys[0])
+        with span("ransac"):
+            right_points = np.asarray(
+                [img_right_key[match.queryIdx].pt for match in matches]
+            ).reshape(-1, 1, 2)
+            left_points = np.asarray(
+                [img_left_key[match.trainIdx].pt for match in matches]
+            ).reshape(-1, 1, 2)
+            homography, mask = cv2.findHomography(
+                right_points, left_points, cv2.RANSAC, 5.0
+            )
+        if homography is not None and keys[0] is not None and keys[1] is not None:
+            inliers = mask.ravel().astype(bool)
+            self.correspondences[(keys[0], keys[1])] = (
+                left_points[inliers, 0],
+                right_points[inliers, 0],
+            )
         return homography
 
     def _apply_transform(
         self, img: npt.NDArray[Any], homography: npt.NDArray[np.float32]
     ) -> npt.NDArray[Any]:
         """Apply homography transform on an image"""
-        return cv2.warpPerspective(
-            img, homography, (self.final_size[1], self.final_size[0])
+        with span("warping") as stage:
+            stage.add_pixels([img])
+            return cv2.warpPerspective(
+                img, homography, (self.final_size[1], self.final_size[0])
+            )
+
+    def _paste(
+        self,
+        frame: npt.NDArray[Any],
+        canvas: npt.NDArray[Any],
+        homography: npt.NDArray[Any],
+        idx: int,
+    ) -> npt.NDArray[Any]:
+        """Paste a warped frame into the canvas with the seam blender, the compiled kernel in place or stitch_cleaner"""
+        if self.blender != "no":
+            return self.seam_blender.blend(frame, canvas)
+        if self.compiled_kernels:
+            from . import kernels  # pylint: disable=import-outside-toplevel
+
+            if kernels.supported(frame, canvas):
+                roi = kernels.frame_roi(
+                    homography, self.images[idx].shape, canvas.shape
+                )
+                return kernels.paste_nonblack(frame, canvas, 1, roi)
+        return self.stitch_cleaner(frame, canvas)
+
+    def homographies(self) -> List[npt.NDArray[Any]]:
+        """Return the homographies that map every image into the coordinates of the first image"""
+        chain = [np.array([[1.0, 0.0, 0], [0.0, 1.0, 0], [0.0, 0.0, 1.0]])]
+        for idx in range(1, len(self.images)):
+            chain.append(self._chained_homography(chain[-1], idx))
+            self._evict(idx - 1)
+        if self.global_alignment:
+            return self._globally_aligned(chain)
+        return chain
+
+    def _globally_aligned(
+        self, chain: List[npt.NDArray[Any]]
+    ) -> List[npt.NDArray[Any]]:
+        """Match the loop-closure pairs of a chain and refine the homographies of all frames over all pairs"""
+        shapes = [image.shape for image in self.images]
+        constraints: List[Constraint] = [
+            (idx - 1, idx, *self.correspondences[(idx - 1, idx)])
+            for idx in range(1, len(chain))
+        ]
+        for i, j in loop_candidates(chain, shapes, self.loop_neighbours):
+            homography = self._transform_finder(self.images[i], self.images[j], (i, j))
+            if homography is None or np.linalg.det(homography[:2, :2]) <= 0:
+                continue
+            if len(self.correspondences[(i, j)][0]) >= self.loop_min_inliers:
+                constraints.append((i, j, *self.correspondences[(i, j)]))
+        refined, self.alignment_report = refine(chain, constraints, shapes)
+        return refined
+
+    def _evict(self, idx: int) -> None:
+        """Forget the features of a frame once its last pair is matched, unless the loop closures match it again"""
+        if not self.global_alignment:
+            self.matching.evict(idx)
+
+    def _chained_homography(
+        self, previous: npt.NDArray[Any], idx: int
+    ) -> npt.NDArray[Any]:
+        """Return the homography that maps an image into the first image from the homography of the previous image"""
+        homography = self._transform_finder(
+            self.images[idx - 1], self.images[idx], (idx - 1, idx)
         )
+        return np.asarray(np.dot(previous, homography))
 
+    def _resume(
+        self, checkpoint: Optional[StitchCheckpoint]
+    ) -> Tuple[int, List[npt.NDArray[Any]], npt.NDArray[Any]]:
+        """Return the next frame, the chain and the canvas of the last checkpoint or of the first frame"""
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is None:
+            chain = [np.array([[1.0, 0.0, 0], [0.0, 1.0, 0], [0.0, 0.0, 1.0]])]
+            return 1, chain, self._apply_transform(self.images[0], chain[0])
+        frame, chain, features, canvas = state
+        self.matching.features[frame] = features
+        logger.info("The stitch is resumed after frame %s.", frame)
+        return frame + 1, chain, canvas
+
+    @cached_result
     def stitcher(self, result_path: str = "", framer: bool = True) -> Optional[Any]:
         """Stitch all the images together two by two"""
         if len(self.images) == 0:
@@ -94,19 +240,29 @@ class SequentialStitcher(ImageLoader):
         if len(self.images) == 1:
             logger.warning("The directory contains only one image.")
             return None
-        first_homography = np.array([[1.0, 0.0, 0], [0.0, 1.0, 0], [0.0, 0.0, 1.0]])
-        result_prev = self._apply_transform(self.images[0], first_homography)
-        for idx in range(1, len(self.images)):
-            homography = self._transform_finder(self.images[idx - 1], self.images[idx])
-            if idx == 1:
-                temp_homography = np.dot(first_homography, homography)
-                temp_result = self._apply_transform(self.images[idx], temp_homography)
-            else:
-                temp_homography = np.linalg.multi_dot([temp_homography, homography])
-                temp_result = self._apply_transform(self.images[idx], temp_homography)
-            result_prev = self.stitch_cleaner(temp_result, result_prev)
+        checkpoint = None
+        if self.checkpoint_dir is not None:
+            checkpoint = StitchCheckpoint(self.checkpoint_dir, ResultCache.key(self))
+        start, chain, result_prev = self._resume(checkpoint)
+        if self.global_alignment and len(chain) < len(self.images):
+            chain = self.homographies()
+        for idx in range(start, len(self.images)):
+            if len(chain) == idx:
+                chain.append(self._chained_homography(chain[-1], idx))
+            temp_result = self._apply_transform(self.images[idx], chain[idx])
+            with span("blending") as stage:
+                stage.add_pixels([temp_result])
+                result_prev = self._paste(temp_result, result_prev, chain[idx], idx)
+            if checkpoint is not None and idx % self.checkpoint_interval == 0:
+                with span("checkpoint"):
+                    checkpoint.save(
+                        idx, chain, self.matching.features[idx], result_prev
+                    )
+            self._evict(idx - 1)
         if result_path != "":
             self.save_result(
                 cv2.cvtColor(result_prev, cv2.COLOR_BGR2RGB), result_path, framer
             )
+        if checkpoint is not None:
+            checkpoint.clear()
         return self.remove_black_areas(cv2.cvtColor(result_prev, cv2.COLOR_BGR2RGB))
@@ -0,0 +1,298 @@
+"""Local HTTP stitching service with a bounded pool of workers"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Mapping, Optional, Sequence
+
+import base64
+import importlib
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from .batch import STITCHER_CLASSES, build_stitcher
+from .execution import ExecutionConfig
+
+logger = logging.getLogger(__name__)
+
+# Tuning options that requests may set per stitcher, the paths, caches and resources stay with the service
+_COMMON_OPTIONS = ["scale", "compiled_kernels"]
+_KEYPOINT_OPTIONS = [
+    "feature_detector",
+    "number_feature",
+    "matcher_type",
+    "tile_grid",
+    "tile_overlap",
+    "flann_checks",
+    "blender",
+    "seam_finder",
+]
+SERVICE_OPTIONS = {
+    "simple": _COMMON_OPTIONS
+    + [
+        "stitcher_type",
+        "registration_resol",
+        "seam_estimation_resol",
+        "compositing_resol",
+    ],
+    "keypoint": _COMMON_OPTIONS + _KEYPOINT_OPTIONS,
+    "sequential": _COMMON_OPTIONS
+    + _KEYPOINT_OPTIONS
+    + ["final_size", "global_alignment", "loop_neighbours", "loop_min_inliers"],
+    "detailed": _COMMON_OPTIONS
+    + [
+        "feature_number",
+        "detector_method",
+        "matcher_type",
+        "confidence_threshold",
+        "camera_estimator",
+        "camera_adjustor",
+        "preset",
+        "overrides",
+        "candidate_neighbours",
+    ],
+    "kornia": _COMMON_OPTIONS + ["loftr_model"],
+}
+
+
+class ServiceBusyError(RuntimeError):
+    """The service queue is full and the request was rejected"""
+
+
+@dataclass
+class ServiceMetrics:
+    """Latency and throughput counters of the service"""
+
+    started: float = field(default_factory=time.perf_counter)
+    counters: Dict[str, int] = field(
+        default_factory=lambda: dict.fromkeys(
+            ["requests", "completed", "failed", "rejected", "in_flight"], 0
+        )
+    )
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, name: str, value: int = 1) -> None:
+        """Increase a counter"""
+        with self.lock:
+            self.counters[name] += value
+
+    def finish(self, latency: float, success: bool) -> None:
+        """Record a finished request"""
+        with self.lock:
+            self.counters["in_flight"] -= 1
+            self.counters["completed" if success else "failed"] += 1
+            self.latencies.append(latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters, latency percentiles of the last requests in seconds and throughput in requests per second"""
+        with self.lock:
+            latencies = np.asarray(self.latencies)
+            snapshot: Dict[str, Any] = dict(self.counters)
+        snapshot["uptime_seconds"] = time.perf_counter() - self.started
+        snapshot["throughput"] = snapshot["completed"] / snapshot["uptime_seconds"]
+        for percentile in [50, 95, 99]:
+            snapshot[f"latency_p{percentile}"] = (
+                float(np.percentile(latencies, percentile)) if latencies.size else 0.0
+            )
+        return snapshot
+
+
+@dataclass
+class StitchingService:  # pylint: disable=too-many-instance-attributes
+    """Stitch images of concurrent requests with a bounded worker pool.
+
+    A new stitcher is created for every request. Only the kornia LoFTR matchers are loaded once per worker thread
+    and reused, the other methods have no state worth keeping between requests. At most workers + queue_size requests are accepted at
+    the same time and the next requests are rejected with 503 until a slot is free.
+    """
+
+    host: str = field(default="127.0.0.1")
+    port: int = field(default=8000)
+    workers: int = field(default=2)
+    queue_size: int = field(default=8)
+    threads: Optional[int] = field(default=None)
+    metrics: ServiceMetrics = field(init=False, default_factory=ServiceMetrics)
+    server: Optional[ThreadingHTTPServer] = field(init=False, default=None)
+    executor: ThreadPoolExecutor = field(init=False)
+    slots: threading.BoundedSemaphore = field(init=False)
+    execution: ExecutionConfig = field(init=False)
+    warm: threading.local = field(init=False, default_factory=threading.local)
+
+    def __post_init__(self) -> None:
+        """Create the worker pool, the queue slots and split the CPUs between the workers"""
+        # numba of largestinteriorrectangle hangs the interpreter exit if it is first imported in a worker thread
+        importlib.import_module("largestinteriorrectangle")
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="stitcher"
+        )
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        # The workers share the opencv and torch thread pools of the process
+        self.execution = ExecutionConfig(self.workers, self.threads)
+        self.execution.apply()
+
+    def stitch(
+        self, images: Sequence[bytes], method: str, options: Mapping[str, Any]
+    ) -> npt.NDArray[Any]:
+        """Stitch encoded images in a worker thread and return the encoded PNG result"""
+        if method not in STITCHER_CLASSES:
+            raise ValueError(
+                f"The stitcher {method} is not defined. Use one of {list(STITCHER_CLASSES)}"
+            )
+        unknown = sorted(set(options) - set(SERVICE_OPTIONS[method]))
+        if unknown:
+            raise ValueError(
+                f"The options {unknown} are not allowed. Use some of {SERVICE_OPTIONS[method]}"
+            )
+        if not self.slots.acquire(blocking=False):
+            self.metrics.add("rejected")
+            raise ServiceBusyError("The stitching queue is full.")
+        self.metrics.add("in_flight")
+        start = time.perf_counter()
+        result = None
+        try:
+            result = self.executor.submit(
+                self._stitch_in_worker, images, method, options
+            ).result()
+        finally:
+            self.metrics.finish(time.perf_counter() - start, result is not None)
+            self.slots.release()
+        if result is None:
+            raise ValueError("Stitching the images failed.")
+        return result
+
+    def _stitch_in_worker(
+        self, images: Sequence[bytes], method: str, options: Mapping[str, Any]
+    ) -> Optional[npt.NDArray[Any]]:
+        """Stitch the images with a new stitcher and the kornia matchers kept by the current worker thread"""
+        if not hasattr(self.warm, "state"):
+            self.warm.state = {}
+        stitcher = build_stitcher(method, options, self.warm.state, image_data=images)
+        result = stitcher.stitcher()
+        if result is None:
+            return None
+        if result.dtype != np.uint8:
+            result = np.clip(result * 255 + 0.5, 0, 255).astype(np.uint8)
+        return cv2.imencode(".png", cv2.cvtColor(result, cv2.COLOR_RGB2BGR))[1]
+
+    def start(self) -> None:
+        """Serve requests in a background thread"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler of the stitching service"""
+
+            def log_message(self, *args: Any) -> None:
+                logger.debug(*args)
+
+            def _reply(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status == 503:
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply_json(self, status: int, content: Any) -> None:
+                self._reply(status, json.dumps(content).encode(), "application/json")
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """Metrics and health of the service"""
+                if self.path == "/metrics":
+                    self._reply_json(200, service.metrics.snapshot())
+                elif self.path == "/resources":
+                    self._reply_json(200, service.execution.report())
+                elif self.path == "/health":
+                    self._reply_json(200, {"status": "ok"})
+                else:
+                    self._reply_json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:  # pylint: disable=invalid-name
+                """Stitch the base64 images of a JSON request and reply with a PNG"""
+                if self.path != "/stitch":
+                    self._reply_json(404, {"error": "not found"})
+                    return
+                service.metrics.add("requests")
+                try:
+                    request = json.loads(
+                        self.rfile.read(int(self.headers["Content-Length"]))
+                    )
+                    result = service.stitch(
+                        [base64.b64decode(image) for image in request["images"]],
+                        request.get("method", "simple"),
+                        request.get("options", {}),
+                    )
+                    self._reply(200, result.tobytes(), "image/png")
+                except ServiceBusyError as error:
+                    self._reply_json(503, {"error": str(error)})
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    self._reply_json(400, {"error": str(error)})
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(
+            "Stitching service on http://%s:%s with %s workers",
+            self.host,
+            self.port,
+            self.workers,
+        )
+
+    def stop(self) -> None:
+        """Stop serving and the worker pool"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.executor.shutdown()
+
+
+@dataclass
+class StitchingClient:
+    """Client of the local stitching service"""
+
+    url: str = field(default="http://127.0.0.1:8000")
+    timeout: float = field(default=300.0)
+
+    def stitch(
+        self,
+        images: Sequence[bytes],
+        method: str = "simple",
+        options: Optional[Mapping[str, Any]] = None,
+    ) -> npt.NDArray[Any]:
+        """Send encoded images and return the stitched RGB image"""
+        request = urllib.request.Request(
+            f"{self.url}/stitch",
+            data=json.dumps(
+                {
+                    "images": [base64.b64encode(image).decode() for image in images],
+                    "method": method,
+                    "options": dict(options or {}),
+                }
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                encoded = np.frombuffer(response.read(), dtype=np.uint8)
+        except urllib.error.HTTPError as error:
+            message = json.loads(error.read())["error"]
+            if error.code == 503:
+                raise ServiceBusyError(message) from error
+            raise ValueError(message) from error
+        return cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters of the service"""
+        with urllib.request.urlopen(
+            f"{self.url}/metrics", timeout=self.timeout
+        ) as response:
+            return json.loads(response.read())  # type: ignore[no-any-return]
@@ -0,0 +1,185 @@
+"""Synthetic datasets of overlapping, homography-perturbed views with ground-truth transforms"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import json
+import logging
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+GROUND_TRUTH = "ground_truth.json"
+
+
+def synthetic_source(shape: Tuple[int, int], seed: int = 0) -> npt.NDArray[Any]:
+    """Create a textured BGR image with structures at several scales to cut views from"""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    for scale in [64, 16, 4]:
+        noise = rng.integers(
+            0, 256, (height // scale + 2, width // scale + 2, 3), dtype=np.uint8
+        )
+        resized = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        cv2.scaleAdd(resized, 1 / 3, image, image)
+    for _ in range(height * width // 20000):
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        color = tuple(int(value) for value in rng.integers(0, 256, 3))
+        cv2.circle(image, center, int(rng.integers(3, 30)), color, -1)
+    return np.asarray(image)
+
+
+def view_layout(count: int, rows: int) -> List[Tuple[int, int]]:
+    """Return the (row, col) grid cell of every view in a serpentine order so that consecutive views overlap"""
+    cols = -(-count // rows)
+    cells = []
+    for index in range(count):
+        row, col = divmod(index, cols)
+        cells.append((row, cols - 1 - col if row % 2 else col))
+    return cells
+
+
+def _source_shape(
+    count: int, view_shape: Tuple[int, int], overlap: float, rows: int, margin: int
+) -> Tuple[int, int]:
+    """Return the source size that fits the grid of views with a margin for the perturbations"""
+    cols = -(-count // rows)
+    return (
+        int(view_shape[0] * (1 - overlap)) * (rows - 1) + view_shape[0] + 2 * margin,
+        int(view_shape[1] * (1 - overlap)) * (cols - 1) + view_shape[1] + 2 * margin,
+    )
+
+
+def _perturbed_homography(
+    rng: np.random.Generator,
+    origin: npt.NDArray[Any],
+    view_shape: Tuple[int, int],
+    perturbation: float,
+) -> npt.NDArray[Any]:
+    """Return the view-to-source homography of a view at origin whose corners are moved randomly"""
+    height, width = view_shape
+    corners = np.array(
+        [[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32
+    )
+    jitter = rng.uniform(-1, 1, (4, 2)) * perturbation * np.array([width, height])
+    return cv2.getPerspectiveTransform(
+        corners, (corners + origin + jitter).astype(np.float32)
+    )
+
+
+def generate_views(  # pylint: disable=R0913, R0914, R0917
+    count: int,
+    view_shape: Tuple[int, int] = (480, 640),
+    overlap: float = 0.5,
+    perturbation: float = 0.03,
+    rows: int = 1,
+    source: Optional[npt.NDArray[Any]] = None,
+    seed: int = 0,
+) -> Iterator[Tuple[npt.NDArray[Any], npt.NDArray[Any]]]:
+    """Cut overlapping views out of a source image one by one and yield them with their view-to-source homographies.
+
+    The views are placed on a grid with the given overlap, and the corners of every view are moved randomly by up to
+    perturbation times the view size. Without a source, a synthetic texture of the required size is used.
+    """
+    height, width = view_shape
+    margin = int(np.ceil(perturbation * max(height, width))) + 1
+    shape = _source_shape(count, view_shape, overlap, rows, margin)
+    if source is None:
+        source = synthetic_source(shape, seed)
+    elif source.shape[0] < shape[0] or source.shape[1] < shape[1]:
+        logger.warning("The source is resized from %s to %s.", source.shape[:2], shape)
+        source = cv2.resize(source, (shape[1], shape[0]))
+    rng = np.random.default_rng(seed)
+    step = (np.array([width, height]) * (1 - overlap)).astype(int)
+    for row, col in view_layout(count, rows):
+        homography = _perturbed_homography(
+            rng, margin + np.array([col, row]) * step, view_shape, perturbation
+        )
+        view = cv2.warpPerspective(
+            source, homography, (width, height), flags=cv2.WARP_INVERSE_MAP
+        )
+        yield view, homography
+
+
+def relative_homographies(
+    homographies: Sequence[npt.NDArray[Any]],
+) -> List[npt.NDArray[Any]]:
+    """Return the homographies that map every view into the coordinates of the first view"""
+    reference = np.linalg.inv(homographies[0])
+    return [reference @ homography for homography in homographies]
+
+
+def write_dataset(  # pylint: disable=R0913, R0914, R0917
+    output_dir: Path,
+    count: int,
+    view_shape: Tuple[int, int] = (480, 640),
+    overlap: float = 0.5,
+    perturbation: float = 0.03,
+    rows: int = 1,
+    source: Optional[npt.NDArray[Any]] = None,
+    seed: int = 0,
+) -> Path:
+    """Write the views of generate_views as images and their ground-truth transforms as ground_truth.json"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for stale in output_dir.glob("frame_*.png"):
+        stale.unlink()
+    files = [f"frame_{index:04d}.png" for index in range(count)]
+    homographies = []
+    for name, (view, homography) in zip(
+        files,
+        generate_views(count, view_shape, overlap, perturbation, rows, source, seed),
+    ):
+        cv2.imwrite(str(output_dir / name), view)
+        homographies.append(homography)
+    ground_truth = {
+        "files": files,
+        "view_shape": list(view_shape),
+        "overlap": overlap,
+        "perturbation": perturbation,
+        "rows": rows,
+        "seed": seed,
+        "source_homographies": [homography.tolist() for homography in homographies],
+        "homographies": [
+            homography.tolist() for homography in relative_homographies(homographies)
+        ],
+    }
+    with open(output_dir / GROUND_TRUTH, "w", encoding="utf-8") as truth_file:
+        json.dump(ground_truth, truth_file, indent=2)
+    logger.info("Synthetic dataset of %s views saved to %s", count, output_dir)
+    return output_dir
+
+
+def read_ground_truth(dataset: Path) -> Optional[Dict[str, Any]]:
+    """Return the ground truth of a synthetic dataset or None for other datasets"""
+    if not (dataset / GROUND_TRUTH).exists():
+        return None
+    with open(dataset / GROUND_TRUTH, "r", encoding="utf-8") as truth_file:
+        ground_truth: Dict[str, Any] = json.load(truth_file)
+    return ground_truth
+
+
+def alignment_error(
+    estimated: Sequence[npt.NDArray[Any]],
+    ground_truth: Sequence[Any],
+    view_shape: Sequence[int],
+) -> Dict[str, float]:
+    """Return the mean and max distance in pixels between the view corners mapped by estimated and true homographies.
+
+    Both sequences map every view into the coordinates of the first view.
+    """
+    height, width = view_shape[:2]
+    corners = np.array(
+        [[[0, 0]], [[width, 0]], [[width, height]], [[0, height]]], dtype=np.float64
+    )
+    errors = [
+        np.linalg.norm(
+            cv2.perspectiveTransform(corners, np.asarray(estimate, dtype=np.float64))
+            - cv2.perspectiveTransform(corners, np.asarray(truth, dtype=np.float64)),
+            axis=-1,
+        ).mean()
+        for estimate, truth in zip(estimated, ground_truth)
+    ]
+    return {"mean_px": float(np.mean(errors)), "max_px": float(np.max(errors))}
@@ -0,0 +1,215 @@
+"""Zoomable DeepZoom tile pyramids written band by band from a panorama"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+import logging
+import math
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+TILE_FORMATS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+    "png": None,
+}
+
+
+def _halve(band: npt.NDArray[Any]) -> npt.NDArray[Any]:
+    """Average every 2x2 block of a band with an even number of rows, repeating the last column of odd widths"""
+    if band.shape[1] % 2:
+        band = np.concatenate([band, band[:, -1:]], axis=1)
+    return np.asarray(
+        cv2.resize(
+            band,
+            (band.shape[1] // 2, band.shape[0] // 2),
+            interpolation=cv2.INTER_AREA,
+        )
+    )
+
+
+@dataclass
+class _Level:  # pylint: disable=too-many-instance-attributes
+    """Rows of one pyramid level that are kept until their tile row and the next level are written"""
+
+    index: int
+    width: int
+    height: int
+    rows: Optional[npt.NDArray[Any]] = field(default=None, repr=False)
+    start: int = field(default=0)
+    tile_row: int = field(default=0)
+    received: int = field(default=0)
+    odd_row: Optional[npt.NDArray[Any]] = field(default=None, repr=False)
+
+
+@dataclass
+class DeepZoomWriter:  # pylint: disable=too-many-instance-attributes
+    """Write a DeepZoom pyramid (a .dzi descriptor and a directory of tiles per level) from horizontal bands.
+
+    Every band is tiled at the full resolution level and averaged into the next level right away, so every level only
+    keeps the rows of its current tile row. The tiles of a row are encoded on a thread pool.
+    """
+
+    path: Path
+    width: int
+    height: int
+    tile_size: int = field(default=254)
+    overlap: int = field(default=1)
+    tile_format: str = field(default="jpg")
+    quality: int = field(default=90)
+    workers: Optional[int] = field(default=None)
+    levels: List[_Level] = field(init=False, repr=False)
+    executor: ThreadPoolExecutor = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Create the levels from the full resolution down to one pixel"""
+        if self.tile_format not in TILE_FORMATS:
+            raise ValueError(
+                f"The tile format {self.tile_format} is not supported. Use one of {list(TILE_FORMATS)}"
+            )
+        top = math.ceil(math.log2(max(self.width, self.height, 1)))
+        self.levels = [
+            _Level(
+                index,
+                math.ceil(self.width / 2 ** (top - index)),
+                math.ceil(self.height / 2 ** (top - index)),
+            )
+            for index in range(top, -1, -1)
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    @property
+    def tiles_dir(self) -> Path:
+        """Directory of the tile levels next to the descriptor"""
+        return self.path.with_name(f"{self.path.stem}_files")
+
+    def write_band(self, band: npt.NDArray[Any]) -> None:
+        """Add the next rows of the full resolution BGR image"""
+        self._push(0, band)
+
+    def _push(self, depth: int, band: npt.NDArray[Any]) -> None:
+        """Add rows to a level, write its complete tile rows and pass the averaged rows to the next level"""
+        level = self.levels[depth]
+        level.received += len(band)
+        level.rows = band if level.rows is None else np.concatenate([level.rows, band])
+        while level.tile_row * self.tile_size < level.height:
+            bottom = min(
+                (level.tile_row + 1) * self.tile_size + self.overlap, level.height
+            )
+            if level.start + len(level.rows) < bottom:
+                break
+            self._write_tile_row(level, level.rows)
+            keep = (level.tile_row + 1) * self.tile_size - self.overlap - level.start
+            level.rows = level.rows[max(keep, 0) :]
+            level.start += max(keep, 0)
+            level.tile_row += 1
+        if depth + 1 == len(self.levels):
+            return
+        if level.odd_row is not None:
+            band = np.concatenate([level.odd_row, band])
+            level.odd_row = None
+        if len(band) % 2:
+            level.odd_row = band[-1:]
+            band = band[:-1]
+        if level.received == level.height and level.odd_row is not None:
+            band = np.concatenate([band, level.odd_row, level.odd_row])
+            level.odd_row = None
+        if len(band):
+            self._push(depth + 1, _halve(band))
+
+    def _write_tile_row(self, level: _Level, rows: npt.NDArray[Any]) -> None:
+        """Encode and write the tiles of the current tile row of a level in parallel"""
+        top = max(level.tile_row * self.tile_size - self.overlap, 0)
+        bottom = min((level.tile_row + 1) * self.tile_size + self.overlap, level.height)
+        rows = rows[top - level.start : bottom - level.start]
+        directory = self.tiles_dir / str(level.index)
+        directory.mkdir(parents=True, exist_ok=True)
+        columns = range(math.ceil(level.width / self.tile_size))
+        list(
+            self.executor.map(
+                lambda col: self._write_tile(rows, directory, col, level.tile_row),
+                columns,
+            )
+        )
+
+    def _write_tile(
+        self, rows: npt.NDArray[Any], directory: Path, col: int, row: int
+    ) -> None:
+        """Encode the tile of a column with its overlap and write it"""
+        left = max(col * self.tile_size - self.overlap, 0)
+        right = min((col + 1) * self.tile_size + self.overlap, rows.shape[1])
+        flag = TILE_FORMATS[self.tile_format]
+        params = [] if flag is None else [flag, self.quality]
+        encoded = cv2.imencode(f".{self.tile_format}", rows[:, left:right], params)[1]
+        encoded.tofile(str(directory / f"{col}_{row}.{self.tile_format}"))
+
+    def close(self) -> None:
+        """Check that all the rows were written and write the descriptor"""
+        self.executor.shutdown()
+        if self.levels[0].received != self.height:
+            raise ValueError(
+                f"{self.levels[0].received} rows were written instead of {self.height}."
+            )
+        self.path.write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="{DZI_NAMESPACE}" Format="{self.tile_format}" Overlap="{self.overlap}" '
+            f'TileSize="{self.tile_size}">\n'
+            f'  <Size Width="{self.width}" Height="{self.height}"/>\n'
+            "</Image>\n",
+            encoding="utf-8",
+        )
+        logger.info(
+            "DeepZoom pyramid of %s levels saved to %s", len(self.levels), self.path
+        )
+
+
+def image_bands(
+    image: npt.NDArray[Any], rows: int, rgb: bool = False
+) -> Iterator[npt.NDArray[Any]]:
+    """Yield the horizontal bands of an image as 8-bit BGR, converting only one band at a time"""
+    for top in range(0, image.shape[0], rows):
+        band = image[top : top + rows]
+        if band.dtype != np.uint8:
+            band = np.clip(band * 255 + 0.5, 0, 255).astype(np.uint8)
+        if band.ndim == 2:
+            band = cv2.cvtColor(band, cv2.COLOR_GRAY2BGR)
+        elif rgb:
+            band = cv2.cvtColor(band, cv2.COLOR_RGB2BGR)
+        yield np.ascontiguousarray(band)
+
+
+def write_deepzoom(  # pylint: disable=R0913, R0917
+    image: npt.NDArray[Any],
+    path: Path,
+    tile_size: int = 254,
+    overlap: int = 1,
+    tile_format: str = "jpg",
+    quality: int = 90,
+    rgb: bool = False,
+    workers: Optional[int] = None,
+) -> Tuple[int, int]:
+    """Write an image as a DeepZoom pyramid band by band and return the number of levels and tiles"""
+    writer = DeepZoomWriter(
+        path,
+        image.shape[1],
+        image.shape[0],
+        tile_size,
+        overlap,
+        tile_format,
+        quality,
+        workers,
+    )
+    for band in image_bands(image, tile_size, rgb):
+        writer.write_band(band)
+    writer.close()
+    tiles = sum(
+        math.ceil(level.width / tile_size) * math.ceil(level.height / tile_size)
+        for level in writer.levels
+    )
+    return len(writer.levels), tiles
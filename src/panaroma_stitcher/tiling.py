@@ -0,0 +1,95 @@
+"""Tiled feature detection on a thread pool for high-resolution images"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import logging
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+
+def tile_boxes(
+    shape: Sequence[int], grid: Tuple[int, int], overlap: int = 32
+) -> List[Tuple[Box, Box]]:
+    """Split an image into a grid of (core, padded) boxes as (top, bottom, left, right).
+
+    The cores cover the image without overlapping, and the padded boxes extend them by overlap pixels so that the
+    keypoints close to the core borders are described with their full neighbourhood.
+    """
+    height, width = shape[:2]
+    rows = np.linspace(0, height, grid[0] + 1).astype(int)
+    cols = np.linspace(0, width, grid[1] + 1).astype(int)
+    boxes = []
+    for top, bottom in zip(rows[:-1], rows[1:]):
+        for left, right in zip(cols[:-1], cols[1:]):
+            core = (int(top), int(bottom), int(left), int(right))
+            padded = (
+                max(int(top) - overlap, 0),
+                min(int(bottom) + overlap, height),
+                max(int(left) - overlap, 0),
+                min(int(right) + overlap, width),
+            )
+            boxes.append((core, padded))
+    return boxes
+
+
+def _detect_tile(
+    create_detector: Callable[[], Any],
+    image: npt.NDArray[Any],
+    boxes: Tuple[Box, Box],
+    budget: Optional[int],
+) -> Tuple[List[Any], Optional[npt.NDArray[Any]]]:
+    """Detect the strongest keypoints of the core of a tile and describe them in image coordinates"""
+    core, padded = boxes
+    tile = image[padded[0] : padded[1], padded[2] : padded[3]]
+    detector = create_detector()
+    # A keypoint in the overlap of tiles belongs only to the tile whose core contains it
+    keypoints = [
+        keypoint
+        for keypoint in detector.detect(tile, None)
+        if core[0] <= keypoint.pt[1] + padded[0] < core[1]
+        and core[2] <= keypoint.pt[0] + padded[2] < core[3]
+    ]
+    keypoints = sorted(keypoints, key=lambda keypoint: -keypoint.response)[:budget]
+    if not keypoints:
+        return [], None
+    keypoints, descriptors = detector.compute(tile, keypoints)
+    for keypoint in keypoints:
+        keypoint.pt = (keypoint.pt[0] + padded[2], keypoint.pt[1] + padded[0])
+    return list(keypoints), descriptors
+
+
+def detect_and_compute_tiled(  # pylint: disable=R0913, R0917
+    create_detector: Callable[[], Any],
+    image: npt.NDArray[Any],
+    grid: Tuple[int, int],
+    overlap: int = 32,
+    budget: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Tuple[Tuple[Any, ...], Optional[npt.NDArray[Any]]]:
+    """Detect and describe the keypoints of an image tile by tile on a thread pool like detectAndCompute.
+
+    Every tile keeps at most budget keypoints with the highest response so that the features are spread over the
+    image. Each thread creates its own detector since the opencv detectors are not thread-safe.
+    """
+    boxes = tile_boxes(image.shape, grid, overlap)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                lambda tile: _detect_tile(create_detector, image, tile, budget), boxes
+            )
+        )
+    keypoints = tuple(
+        keypoint for tile_keypoints, _ in results for keypoint in tile_keypoints
+    )
+    descriptors = [
+        tile_descriptors
+        for _, tile_descriptors in results
+        if tile_descriptors is not None and len(tile_descriptors) > 0
+    ]
+    logger.debug("Detected %s keypoints in %s tiles.", len(keypoints), len(boxes))
+    return keypoints, np.vstack(descriptors) if descriptors else None
@@ -2,107 +2,246 @@
 
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Sequence, Tuple, Type, TypeVar
 
 import logging
-import torch
 import cv2
-import largestinteriorrectangle as lir
-import kornia as krn
 import numpy as np
-import matplotlib.pyplot as plt
+import numpy.typing as npt
+
+from .cache import ResultCache
+from .execution import ExecutionConfig
+from .geo_index import geo_order, ground_positions, read_poses
+from .profiling import span
+from .tile_pyramid import write_deepzoom
 
 logger = logging.getLogger(__name__)
 
 
+T = TypeVar("T", bound="ImageLoader")
+
+
+def to_opencv_image(source: Any) -> npt.NDArray[Any]:
+    """Convert an image path, encoded bytes, a BGR numpy array or an RGB torch tensor to an opencv BGR image"""
+    if isinstance(source, (str, Path)):
+        return cv2.imread(str(source))
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if isinstance(source, np.ndarray):
+        if source.ndim == 2:
+            return cv2.cvtColor(source, cv2.COLOR_GRAY2BGR)
+        return source
+    tensor = source.detach().cpu()
+    if tensor.ndim == 4:
+        tensor = tensor[0]
+    array = np.asarray(tensor.permute(1, 2, 0).numpy())
+    if array.dtype != np.uint8:
+        array = np.clip(array * 255 + 0.5, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+
+
+def to_kornia_image(source: Any, device: str = "cpu") -> Any:
+    """Convert an image path, encoded bytes, a BGR numpy array or an RGB torch tensor to a 1xCxHxW float kornia image"""
+    import kornia as krn  # pylint: disable=import-outside-toplevel
+
+    if isinstance(source, (str, Path)):
+        return krn.io.load_image(
+            str(source), desired_type=krn.io.ImageLoadType.RGB32, device=device
+        )[None, ...]
+    if isinstance(source, (bytes, bytearray, memoryview, np.ndarray)):
+        rgb = cv2.cvtColor(to_opencv_image(source), cv2.COLOR_BGR2RGB)
+        return (krn.utils.image_to_tensor(rgb, keepdim=False).float() / 255.0).to(
+            device
+        )
+    tensor = source if source.ndim == 4 else source[None, ...]
+    if not tensor.is_floating_point():
+        tensor = tensor.float() / 255.0
+    return tensor.to(device)
+
+
+def padded_foreground_mask(image: Any, compiled: bool = False) -> npt.NDArray[Any]:
+    """Return the mask of the non-black pixels of an image with a black border of 2 pixels for finding its contour"""
+    if compiled:
+        from . import kernels  # pylint: disable=import-outside-toplevel
+
+        if kernels.supported(image):
+            return kernels.nonblack_mask(image, border=2, thresh=0)
+    image_boarder = cv2.copyMakeBorder(image, 2, 2, 2, 2, cv2.BORDER_CONSTANT, (0, 0, 0))  # type: ignore
+    gray_boarder = cv2.cvtColor(image_boarder, cv2.COLOR_BGR2GRAY)
+    thresholded: npt.NDArray[Any] = cv2.threshold(
+        gray_boarder, 0, 255, cv2.THRESH_BINARY
+    )[1]
+    return thresholded
+
+
 @dataclass
-class ImageLoader:
-    """Load/Save images from/to directories"""
+class ImageLoader:  # pylint: disable=too-many-instance-attributes
+    """Load/Save images from/to directories or in-memory image data"""
 
-    image_dir: Path
+    image_dir: Optional[Path] = field(default=None)
     resize_shape: Optional[Tuple[int, int]] = field(default=None)
     device: str = field(default="cpu")
+    image_data: Optional[Sequence[Any]] = field(default=None, repr=False)
+    cache: Optional[ResultCache] = field(default=None, repr=False)
+    compiled_kernels: bool = field(default=False)
+    scale: Optional[float] = field(default=None)
+    memory_budget_mb: Optional[float] = field(default=None)
+    execution: Optional[ExecutionConfig] = field(default=None, repr=False)
+    geo_order: bool = field(default=False)
+    tile_format: str = field(default="jpg")
     images: List[Any] = field(init=False)
 
     def __post_init__(self) -> None:
         """Check the cuda availability and other post-processing requirements"""
-        if self.device == "cuda" and not torch.cuda.is_available():
-            logger.info("%s is not available.", self.device)
-            self.device = "cpu"
+        if self.device == "cuda":
+            import torch  # pylint: disable=import-outside-toplevel
+
+            if not torch.cuda.is_available():
+                logger.info("%s is not available.", self.device)
+                self.device = "cpu"
+
+    @classmethod
+    def from_images(cls: Type[T], images: Sequence[Any], **kwargs: Any) -> T:
+        """Create the loader or a stitcher from in-memory images instead of a directory.
+
+        The images can be BGR numpy arrays (used without a copy), encoded image bytes or RGB torch tensors.
+        """
+        return cls(image_data=images, **kwargs)
+
+    def cache_key_parts(self) -> Dict[str, Any]:
+        """Settings outside of the dataclass fields that change the result and belong in the cache key"""
+        return {}
 
     def _list_images(self) -> List[Path]:
-        """List images in directory"""
-        return sorted(
+        """List images in directory by name or along the GPS positions of their EXIF data"""
+        if self.image_dir is None:
+            raise ValueError("Either image_dir or image_data should be given.")
+        paths = sorted(
             filter(
                 lambda path: path.suffix in [".jpg", ".png", ".tif"],
                 self.image_dir.glob("*"),
             )
         )
+        if not self.geo_order:
+            return paths
+        return [paths[idx] for idx in geo_order(ground_positions(read_poses(paths)))]
 
-    def opencv_load_images(self) -> None:
-        """Load images for opencv stitcher from a directory"""
-        files = self._list_images()
-        if not self.resize_shape:
-            self.images = [cv2.imread(str(filename)) for filename in files]
+    def _sources(self) -> Sequence[Any]:
+        """In-memory image data if it is given and the image files of the directory otherwise"""
+        if self.image_data is not None:
+            return self.image_data
+        return self._list_images()
+
+    def fit_memory_budget(self) -> None:
+        """Set the scales of the stitching stages that fit memory_budget_mb from the image headers before loading.
+
+        Raise MemoryBudgetError with the estimated peak memory if the stitcher cannot fit the budget at any scale.
+        """
+        if self.memory_budget_mb is None:
+            return
+        # pylint: disable=import-outside-toplevel
+        from .memory_budget import fit_budget, frame_shapes, plan_settings
+
+        sources = self._sources()
+        if self.resize_shape:
+            shapes = [(self.resize_shape[1], self.resize_shape[0])] * len(sources)
         else:
+            shapes = frame_shapes(sources)
+        shapes = [
+            (round(height * (self.scale or 1.0)), round(width * (self.scale or 1.0)))
+            for height, width in shapes
+        ]
+        plan = fit_budget(self, shapes, self.memory_budget_mb)
+        for name, value in plan_settings(self, shapes, plan).items():
+            logger.info("Memory budget sets %s to %s.", name, value)
+            setattr(self, name, value)
+
+    def _load_opencv_image(self, source: Any) -> npt.NDArray[Any]:
+        """Load an opencv image resized to resize_shape and scaled by scale keeping the aspect ratio"""
+        image = to_opencv_image(source)
+        if self.resize_shape:
+            image = cv2.resize(image, self.resize_shape)
+        if self.scale is not None and self.scale != 1.0:
+            image = cv2.resize(
+                image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA
+            )
+        return image
+
+    def opencv_load_images(self) -> None:
+        """Load images for opencv stitcher from a directory or the in-memory image data"""
+        if self.execution is not None:
+            self.execution.apply()
+        self.fit_memory_budget()
+        with span("load") as stage:
             self.images = [
-                cv2.resize(cv2.imread(str(filename)), self.resize_shape)
-                for filename in files
+                self._load_opencv_image(source) for source in self._sources()
             ]
+            stage.add_pixels(self.images)
         logger.info(
             "Number of loaded images from %s is: %s",
-            str(self.image_dir),
+            str(self.image_dir or "memory"),
             len(self.images),
         )
 
     def kornia_load_images(self) -> None:
-        """Load images for kornia stitcher from a directory"""
-        files = list(self._list_images())
-        if not self.resize_shape:
-            self.images = [
-                krn.io.load_image(
-                    str(filename),
-                    desired_type=krn.io.ImageLoadType.RGB32,
-                    device=self.device,
-                )[None, ...]
-                for filename in files
-            ]
-        else:
-            self.images = [
-                krn.geometry.resize(
-                    krn.io.load_image(
-                        str(filename),
-                        desired_type=krn.io.ImageLoadType.RGB32,
-                        device=self.device,
-                    )[None, ...],
-                    self.resize_shape,
-                )
-                for filename in files
-            ]
+        """Load images for kornia stitcher from a directory or the in-memory image data"""
+        import kornia as krn  # pylint: disable=import-outside-toplevel
+
+        if self.execution is not None:
+            self.execution.apply()
+        self.fit_memory_budget()
+        with span("load") as stage:
+            if not self.resize_shape:
+                self.images = [
+                    to_kornia_image(source, self.device) for source in self._sources()
+                ]
+            else:
+                self.images = [
+                    krn.geometry.resize(
+                        to_kornia_image(source, self.device), self.resize_shape
+                    )
+                    for source in self._sources()
+                ]
+            if self.scale is not None and self.scale != 1.0:
+                self.images = [
+                    krn.geometry.rescale(image, self.scale, antialias=True)
+                    for image in self.images
+                ]
+            stage.add_pixels(self.images)
         logger.info(
             "Number of loaded images from %s is: %s",
-            str(self.image_dir),
+            str(self.image_dir or "memory"),
             len(self.images),
         )
 
     def remove_black_areas(self, img: Any) -> Any:
         """Remove black areas from stitched images"""
-        image_boarder = cv2.copyMakeBorder(img, 2, 2, 2, 2, cv2.BORDER_CONSTANT, (0, 0, 0))  # type: ignore
-        gray_boarder = cv2.cvtColor(image_boarder, cv2.COLOR_BGR2GRAY)
-        thresholded = cv2.threshold(gray_boarder, 0, 255, cv2.THRESH_BINARY)[1]
-        contours = cv2.findContours(
-            thresholded.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
-        )[0]
-        contour = np.array([contours[0][:, 0, :]])
-        inner_bb = lir.lir(contour)
+        import largestinteriorrectangle as lir  # pylint: disable=import-outside-toplevel
+
+        with span("crop") as stage:
+            stage.add_pixels([img])
+            thresholded = padded_foreground_mask(img, self.compiled_kernels)
+            contours = cv2.findContours(
+                thresholded, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+            )[0]
+            contour = np.array([contours[0][:, 0, :]])
+            inner_bb = lir.lir(contour)
         return img[
             inner_bb[1] : inner_bb[1] + inner_bb[3],
             inner_bb[0] : inner_bb[0] + inner_bb[2],
         ]
 
     def save_result(self, img: Any, save_path: str, framer: bool = True) -> None:
-        """Save the final stitching result"""
+        """Save the final stitching result as an image or as a DeepZoom tile pyramid if the path ends with .dzi"""
+        import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
         if framer:
-            plt.imsave(save_path, self.remove_black_areas(img))
-        else:
-            plt.imsave(save_path, img)
+            img = self.remove_black_areas(img)
+        with span("encode") as stage:
+            stage.add_pixels([img])
+            if Path(save_path).suffix == ".dzi":
+                write_deepzoom(
+                    img, Path(save_path), tile_format=self.tile_format, rgb=True
+                )
+            else:
+                plt.imsave(save_path, img)
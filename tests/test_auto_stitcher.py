@@ -0,0 +1,61 @@
+"""This is a test for the auto stitcher"""
+
+import numpy as np
+from panaroma_stitcher.auto_stitcher import AutoStitcher, check_pairs, projected_canvas
+from panaroma_stitcher.synthetic import generate_views, relative_homographies
+
+VIEWS, HOMOGRAPHIES = zip(*generate_views(3, (240, 320)))
+
+
+def test_check_pairs() -> None:
+    """Test for registering the consecutive views at a low resolution"""
+    truth = relative_homographies(HOMOGRAPHIES)
+    records = check_pairs(VIEWS)
+    assert [record["pair"] for record in records] == [(0, 1), (1, 2)]
+    assert all(record["inlier_ratio"] > 0.5 for record in records)
+    assert all(record["condition"] < 1.5 for record in records)
+    expected = projected_canvas(truth[:2], [(240, 320)] * 2)
+    canvas = projected_canvas([np.eye(3), records[0]["homography"]], [(240, 320)] * 2)
+    assert expected is not None and canvas is not None
+    assert np.allclose(canvas, expected, atol=3)
+
+
+def test_projected_canvas() -> None:
+    """Test for the canvas of translated frames and of a frame behind the camera"""
+    shift = np.array([[1.0, 0, 50], [0, 1, -10], [0, 0, 1]])
+    assert projected_canvas([np.eye(3), shift], [(100, 200)] * 2) == (
+        0,
+        -10,
+        250,
+        100,
+    )
+    behind = np.array([[1.0, 0, 0], [0, 1, 0], [-0.01, 0, 1]])
+    assert projected_canvas([behind], [(100, 200)]) is None
+
+
+def test_negative_canvas() -> None:
+    """Test for skipping the sequential backend when the frames are projected left of the first frame"""
+    check = AutoStitcher.from_images(list(VIEWS)[::-1], isolate=False).precheck()
+    assert check["canvas"][0] < 0
+    assert "first frame" in check["skip"]["sequential"]
+    assert "keypoint" not in check["skip"]
+
+
+def test_no_overlap() -> None:
+    """Test for refusing unrelated frames without running any backend"""
+    rng = np.random.default_rng(0)
+    noise = [rng.integers(0, 255, (240, 320, 3), dtype=np.uint8) for _ in range(3)]
+    stitcher = AutoStitcher.from_images(noise, isolate=False)
+    assert stitcher.stitcher() is None
+    assert {attempt["status"] for attempt in stitcher.attempts} == {"skipped"}
+
+
+def test_fallback() -> None:
+    """Test for falling back from a failing backend to the next one"""
+    stitcher = AutoStitcher.from_images(
+        list(VIEWS), backends=["sequential", "simple"], isolate=False, max_condition=0.5
+    )
+    result = stitcher.stitcher()
+    assert result is not None and result.shape[1] > 320
+    assert [attempt["status"] for attempt in stitcher.attempts] == ["skipped", "ok"]
+    assert stitcher.attempts[1]["seconds"] > 0
@@ -0,0 +1,49 @@
+"""This is a test for batch stitching"""
+
+import json
+from pathlib import Path
+from panaroma_stitcher.batch import finished_jobs, job_settings, read_jobs, run_batch
+
+
+def test_read_jobs(tmp_path: Path) -> None:
+    """Test for reading the jobs of a manifest file"""
+    manifest = tmp_path / "jobs.txt"
+    manifest.write_text(
+        './test_data/boat\n\n{"data_path": "./test_data/map", "result_path": "map.jpg"}\n',
+        encoding="utf-8",
+    )
+    jobs = read_jobs(manifest, tmp_path)
+    assert jobs[0] == {
+        "data_path": "./test_data/boat",
+        "result_path": str(tmp_path / "boat.png"),
+    }
+    assert jobs[1]["result_path"] == "map.jpg"
+
+
+def test_finished_jobs(tmp_path: Path) -> None:
+    """Test for skipping the finished jobs of a manifest only with the same settings"""
+    manifest = tmp_path / "manifest.jsonl"
+    assert finished_jobs(manifest) == set()
+    settings = job_settings("sequential", {"number_feature": 500}, (400, 300), True)
+    with open(manifest, "w", encoding="utf-8") as manifest_file:
+        manifest_file.write(json.dumps({"data_path": "a", "status": "ok"}) + "\n")
+        manifest_file.write(json.dumps({"data_path": "b", "status": "error"}) + "\n")
+        record = {"data_path": "c", "status": "ok", **settings}
+        manifest_file.write(json.dumps(record) + "\n")
+    assert finished_jobs(manifest) == {"a", "c"}
+    assert finished_jobs(manifest, settings) == {"c"}
+    other = job_settings("sequential", {"number_feature": 100}, (400, 300), True)
+    assert finished_jobs(manifest, other) == set()
+
+
+def test_run_batch(tmp_path: Path) -> None:
+    """Test for running and resuming a batch"""
+    jobs = [
+        {"data_path": "./test_data/mountain", "result_path": str(tmp_path / "m.png")}
+    ]
+    manifest = tmp_path / "manifest.jsonl"
+    records = run_batch(jobs, manifest, "sequential", {"number_feature": 500})
+    assert records[0]["status"] == "ok"
+    assert (tmp_path / "m.png").exists()
+    assert not run_batch(jobs, manifest, "sequential", {"number_feature": 500})
+    assert run_batch(jobs, manifest, "sequential", {"number_feature": 400})
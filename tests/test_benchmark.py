@@ -0,0 +1,48 @@
+"""This is a test for the stitcher benchmark"""
+
+from pathlib import Path
+from panaroma_stitcher.benchmark import compare, list_datasets, run_case, run_suite
+from panaroma_stitcher.synthetic import write_dataset
+
+
+def test_run_suite() -> None:
+    """Test for benchmarking a stitcher on a dataset"""
+    results = run_suite(Path("./test_data/boat"), ["sequential"], [0.5], isolate=False)
+    record = results["results"][0]
+    assert record["status"] == "ok"
+    assert {"setup", "load", "stitch", "detection", "warping"} <= set(record["stages"])
+    assert record["output_megapixels"] > 0
+    assert record["peak_rss_mb"] > 0
+
+
+def test_synthetic_case(tmp_path: Path) -> None:
+    """Test for the alignment error of a stitcher on a synthetic dataset at the full and a lower scale"""
+    write_dataset(tmp_path, 3, (240, 320))
+    for scale in [1.0, 0.5]:
+        record = run_case("sequential", tmp_path, scale)
+        assert record["status"] == "ok"
+        assert record["alignment_error"]["mean_px"] < 5 * scale
+
+
+def test_compare() -> None:
+    """Test for flagging regressions against a baseline"""
+    record = {
+        "stitcher": "simple",
+        "dataset": "boat",
+        "scale": 1.0,
+        "status": "ok",
+        "wall_seconds": 1.0,
+        "peak_rss_mb": 100.0,
+    }
+    baseline = {"results": [record]}
+    assert not compare({"results": [{**record, "wall_seconds": 1.1}]}, baseline)
+    regressions = compare({"results": [{**record, "wall_seconds": 1.5}]}, baseline)
+    assert [regression["metric"] for regression in regressions] == ["wall_seconds"]
+    regressions = compare({"results": [{**record, "status": "error"}]}, baseline)
+    assert regressions[0]["metric"] == "status"
+
+
+def test_list_datasets() -> None:
+    """Test for listing image directories of a data root"""
+    datasets = list_datasets(Path("./test_data"))
+    assert Path("./test_data/boat") in datasets
@@ -0,0 +1,58 @@
+"""This is a test for blending frames in the overlap bands of the lightweight stitchers"""
+
+from typing import Any
+import cv2
+import numpy as np
+import numpy.typing as npt
+import pytest
+from panaroma_stitcher.blending import SeamBlender, overlap_band
+from panaroma_stitcher.keypoint_stitcher import KeypointStitcher
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.synthetic import generate_views
+
+VIEWS = [view for view, _ in generate_views(3, (240, 320))]
+
+
+def _exposure_step(image: npt.NDArray[Any]) -> float:
+    """Return the largest step between neighbouring columns of the smoothed overlap"""
+    smoothed = cv2.GaussianBlur(image.astype(np.float32), (0, 0), 3)
+    return float(np.abs(np.diff(smoothed[20:220, 150:330].mean(axis=2), axis=1)).max())
+
+
+def test_overlap_band() -> None:
+    """Test for the box of an overlap with a margin clipped to the masks"""
+    first, second = np.zeros((50, 80), np.uint8), np.zeros((50, 80), np.uint8)
+    first[:, :40], second[10:, 30:] = 255, 255
+    assert overlap_band(first, second) == (30, 10, 40, 50)
+    assert overlap_band(first, second, 5) == (25, 5, 45, 50)
+    assert overlap_band(first, np.zeros_like(second)) is None
+
+
+def test_blend() -> None:
+    """Test for hiding an exposure step in the overlap without changing the pixels outside its band"""
+    canvas = np.zeros((300, 600, 3), np.uint8)
+    canvas[:240, :320] = VIEWS[0] // 4 + 100
+    frame = np.zeros_like(canvas)
+    frame[:240, 160:480] = VIEWS[0] // 4 + 140
+    pasted = np.where(frame.any(axis=2)[..., None], frame, canvas)
+    blended = SeamBlender("multiband", "voronoi").blend(frame, canvas)
+    assert _exposure_step(blended) < _exposure_step(pasted) / 2
+    assert np.array_equal(blended[:, :140], pasted[:, :140])
+    assert np.array_equal(blended[:, 340:], pasted[:, 340:])
+    with pytest.raises(ValueError):
+        SeamBlender("laplace")
+
+
+def test_stitchers() -> None:
+    """Test for blending in the sequential and keypoint stitchers and for rejecting unknown names when they are created"""
+    options = {"number_feature": 500, "blender": "feather", "seam_finder": "dp_color"}
+    result = SequentialStitcher.from_images(
+        VIEWS, final_size=(300, 800), **options
+    ).stitcher()
+    assert result is not None and result.shape[1] > 600
+    result = KeypointStitcher.from_images(VIEWS[:2], **options).stitcher()
+    assert result is not None and result.shape[1] > 400
+    with pytest.raises(ValueError):
+        SequentialStitcher.from_images(VIEWS, seam_finder="graph")
+    with pytest.raises(ValueError):
+        KeypointStitcher.from_images(VIEWS[:2], blender="laplace")
@@ -0,0 +1,60 @@
+"""This is a test for the result cache"""
+
+from pathlib import Path
+import cv2
+import numpy as np
+from panaroma_stitcher.cache import ResultCache
+from panaroma_stitcher.kornia import KorniaStitcher
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+
+
+def test_put_get_and_evict(tmp_path: Path) -> None:
+    """Test for storing, loading and evicting results"""
+    cache = ResultCache(tmp_path, max_bytes=25_000, memory_items=1)
+    result = np.full((100, 100), 7, dtype=np.uint8)
+    assert cache.get("first") is None
+    cache.put("first", result)
+    cached = cache.get("first")
+    assert cached is not None and np.array_equal(cached, result)
+    cache.put("second", result)
+    cache.put("third", result)
+    assert cache.get("first") is None
+    cached = cache.get("third")
+    assert cached is not None and np.array_equal(cached, result)
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+
+
+def test_stitcher_cache(tmp_path: Path) -> None:
+    """Test for the cache keys of stitchers and for results served from the cache"""
+    images = [np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8) for _ in range(2)]
+    cache = ResultCache(tmp_path)
+    stitcher = SequentialStitcher.from_images(images, cache=cache)
+    key = cache.key(stitcher)
+    assert key == cache.key(SequentialStitcher.from_images(list(images)))
+    assert key != cache.key(SequentialStitcher.from_images(images, number_feature=10))
+    assert key != cache.key(SequentialStitcher.from_images(images[::-1]))
+    cache.put(key, images[0])
+    result = stitcher.stitcher()
+    assert result is not None and np.array_equal(result, images[0])
+    assert cache.stats()["hits"] == 1
+    kornia = KorniaStitcher.from_images(images)
+    kornia.matcher_settings = {"matcher": "loftr", "model": "outdoor"}
+    outdoor_key = cache.key(kornia)
+    kornia.matcher_settings = {"matcher": "loftr", "model": "indoor"}
+    assert outdoor_key != cache.key(kornia)
+
+
+def test_saved_result(tmp_path: Path) -> None:
+    """Test for saving the same image from a stitch and from the cache"""
+    images = [np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8) for _ in range(2)]
+    cache = ResultCache(tmp_path / "cache")
+    stitcher = SequentialStitcher.from_images(images, cache=cache)
+    stitcher.stitcher(str(tmp_path / "stitched.png"))
+    stitcher.stitcher(str(tmp_path / "cached.png"))
+    assert cache.stats()["hits"] == 1
+    stitched = cv2.imread(str(tmp_path / "stitched.png"))
+    assert np.array_equal(stitched, cv2.imread(str(tmp_path / "cached.png")))
+    stitcher.stitcher(str(tmp_path / "uncropped.png"), framer=False)
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,88 @@
+"""This is a test for resuming sequential stitches from checkpoints"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict
+import cv2
+import numpy as np
+import pytest
+from panaroma_stitcher.checkpoint import pack_keypoints, unpack_keypoints
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.synthetic import generate_views
+
+VIEWS = [view for view, _ in generate_views(5, (240, 320), overlap=0.6)]
+SETTINGS = {"number_feature": 500, "final_size": (300, 1000)}
+
+
+def test_pack_keypoints() -> None:
+    """Test for saving keypoints without loss"""
+    keypoints = cv2.SIFT.create(50).detect(VIEWS[0], None)
+    restored = unpack_keypoints(pack_keypoints(keypoints))
+    assert [point.pt for point in restored] == [point.pt for point in keypoints]
+    assert [point.octave for point in restored] == [point.octave for point in keypoints]
+    assert pack_keypoints(()).shape == (0, 7)
+
+
+def test_resume(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test for resuming an interrupted stitch to the same result as an uninterrupted one"""
+    expected = SequentialStitcher.from_images(VIEWS, **SETTINGS).stitcher()
+    finder = SequentialStitcher._transform_finder  # pylint: disable=protected-access
+    pairs = []
+
+    def interrupted(self, left, right, keys=(None, None)):  # type: ignore
+        pairs.append(keys)
+        if keys == (3, 4) and len(pairs) < 5:
+            raise KeyboardInterrupt
+        return finder(self, left, right, keys)
+
+    monkeypatch.setattr(SequentialStitcher, "_transform_finder", interrupted)
+    options = {"checkpoint_dir": tmp_path / "checkpoint", "checkpoint_interval": 2}
+    with pytest.raises(KeyboardInterrupt):
+        SequentialStitcher.from_images(VIEWS, **SETTINGS, **options).stitcher()
+    assert (tmp_path / "checkpoint" / "canvas_2.npy").exists()
+    result = SequentialStitcher.from_images(VIEWS, **SETTINGS, **options).stitcher()
+    assert pairs[4:] == [(2, 3), (3, 4)]
+    assert result is not None and expected is not None
+    assert np.array_equal(result, expected)
+    assert not (tmp_path / "checkpoint").exists()
+
+
+def test_other_settings(tmp_path: Path) -> None:
+    """Test for ignoring the checkpoint of other settings and keeping the other files of its directory"""
+    directory = tmp_path / "results"
+    directory.mkdir()
+    (directory / "precious.txt").write_text("kept", encoding="utf-8")
+    options = {"checkpoint_dir": directory, "checkpoint_interval": 1}
+    stitcher = SequentialStitcher.from_images(VIEWS[:3], **SETTINGS, **options)
+    stitcher.checkpoint_dir = None
+    expected = stitcher.stitcher()
+    stitcher = SequentialStitcher.from_images(VIEWS[:3], **SETTINGS, **options)
+    state: Dict[str, Any] = {"frame": 1, "chain": np.zeros((2, 3, 3)), "key": "other"}
+    np.savez(directory / "state.npz", **state)
+    result = stitcher.stitcher()
+    assert result is not None and expected is not None
+    assert np.array_equal(result, expected)
+    assert sorted(path.name for path in directory.iterdir()) == ["precious.txt"]
+
+
+def test_blended_crash(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test for resuming a blended stitch that crashed after writing a canvas but before replacing the state"""
+    settings = {**SETTINGS, "blender": "multiband", "seam_finder": "voronoi"}
+    expected = SequentialStitcher.from_images(VIEWS, **settings).stitcher()
+    replace = os.replace
+    calls = []
+
+    def crashing(source: Path, target: Path) -> None:
+        calls.append(target)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        replace(source, target)
+
+    monkeypatch.setattr(os, "replace", crashing)
+    options = {"checkpoint_dir": tmp_path, "checkpoint_interval": 1}
+    with pytest.raises(KeyboardInterrupt):
+        SequentialStitcher.from_images(VIEWS, **settings, **options).stitcher()
+    assert (tmp_path / "canvas_2.npy").exists()
+    result = SequentialStitcher.from_images(VIEWS, **settings, **options).stitcher()
+    assert result is not None and expected is not None
+    assert result.tobytes() == expected.tobytes()
@@ -1,8 +1,10 @@
 """This is a test for detailed stitcher"""
 
 from pathlib import Path
+import pytest
 
 from panaroma_stitcher.detailed_stitcher import DetailedStitcher
+from panaroma_stitcher.presets import PRESETS
 
 
 def test_stitcher(tmp_path: Path) -> None:
@@ -10,3 +12,27 @@ def test_stitcher(tmp_path: Path) -> None:
     stitcher = DetailedStitcher(Path("./test_data/mountain"))
     stitcher.stitcher(str(tmp_path / "test_result.png"), True)
     assert Path(tmp_path / "test_result.png").exists()
+
+
+def test_calibrate_and_compose(tmp_path: Path) -> None:
+    """Test for composing images with a saved rig calibration"""
+    stitcher = DetailedStitcher(Path("./test_data/mountain"))
+    stitcher.calibrate(str(tmp_path / "rig.npz"))
+    assert Path(tmp_path / "rig.npz").exists()
+    result = stitcher.compose(
+        str(tmp_path / "rig.npz"), str(tmp_path / "test_result.png"), True
+    )
+    assert Path(tmp_path / "test_result.png").exists()
+    assert result.shape[2] == 3
+
+
+def test_create_config() -> None:
+    """Test for presets and overrides in the config of detailed stitcher"""
+    stitcher = DetailedStitcher(
+        Path("./test_data/mountain"), preset="fast", overrides={"range_width": 3}
+    )
+    config = stitcher._create_config()  # pylint: disable=protected-access
+    assert config["medium_megapix"] == PRESETS["fast"]["medium_megapix"]
+    assert config["range_width"] == 3
+    with pytest.raises(ValueError):
+        DetailedStitcher(Path("./test_data/mountain"), preset="unknown")
@@ -0,0 +1,47 @@
+"""This is a test for the execution config of the thread pools"""
+
+from pathlib import Path
+import os
+import cv2
+import numba
+import numpy as np
+import pytest
+from panaroma_stitcher import execution, kernels
+from panaroma_stitcher.execution import ExecutionConfig, cgroup_cpus
+
+
+def test_cgroup_cpus(tmp_path: Path) -> None:
+    """Test for reading the CPU quota of a container"""
+    (tmp_path / "cpu.max").write_text("250000 100000\n", encoding="utf-8")
+    assert cgroup_cpus(str(tmp_path / "cpu.max")) == 3
+    (tmp_path / "cpu.max").write_text("max 100000\n", encoding="utf-8")
+    assert cgroup_cpus(str(tmp_path / "cpu.max")) is None
+    assert cgroup_cpus(str(tmp_path / "missing")) is None
+
+
+def test_threads_per_worker(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test for splitting the CPUs between the workers"""
+    monkeypatch.setattr(execution, "available_cpus", lambda: 8)
+    assert ExecutionConfig().threads_per_worker() == 8
+    assert ExecutionConfig(workers=3).threads_per_worker() == 2
+    assert ExecutionConfig(workers=16).threads_per_worker() == 1
+    assert ExecutionConfig(workers=4, threads=3).threads_per_worker() == 3
+
+
+def test_apply(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test for sizing the opencv thread pool and reporting the effective threads after numba launched its threads"""
+    for variable in execution.THREAD_VARIABLES:
+        # Recorded by monkeypatch so that the variables written by apply are restored or removed after the test
+        monkeypatch.setenv(variable, os.environ.get(variable, "1"))
+    threads = cv2.getNumThreads()
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    kernels.paste_nonblack(frame, frame.copy())
+    try:
+        report = ExecutionConfig(threads=numba.get_num_threads() + 1).apply()
+        assert cv2.getNumThreads() == numba.get_num_threads() + 1
+        assert report["opencv_threads"] == cv2.getNumThreads()
+        assert report["cpu_affinity"]
+        assert os.environ["OMP_NUM_THREADS"] == str(numba.get_num_threads() + 1)
+        assert numba.njit(lambda value: value + 1)(1) == 2
+    finally:
+        cv2.setNumThreads(threads)
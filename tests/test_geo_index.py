@@ -0,0 +1,67 @@
+"""This is a test for the GPS index of aerial images"""
+
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from PIL import Image
+from panaroma_stitcher.geo_index import (
+    geo_order,
+    ground_positions,
+    read_pose,
+    spatial_pairs,
+)
+from panaroma_stitcher.utility import ImageLoader
+
+
+def _write_frame(
+    path: Path, latitude: float, yaw: Optional[float] = None, value: int = 0
+) -> None:
+    """Write a small uniform JPEG with a GPS position and optionally a DJI gimbal yaw"""
+    exif = Image.Exif()
+    exif.get_ifd(0x8825).update(
+        {1: "N", 2: (47.0, 0.0, latitude), 3: "W", 4: (19.0, 0.0, 0.0)}
+    )
+    xmp = b""
+    if yaw is not None:
+        xmp = f'<rdf:Description drone-dji:GimbalYawDegree="{yaw}"/>'.encode()
+    Image.fromarray(np.full((32, 32, 3), value, dtype=np.uint8)).save(
+        path, exif=exif, xmp=xmp
+    )
+
+
+def test_read_pose(tmp_path: Path) -> None:
+    """Test for reading the GPS position and yaw from the image headers"""
+    _write_frame(tmp_path / "frame.jpg", 30.0, yaw=-12.5)
+    pose = read_pose(tmp_path / "frame.jpg")
+    assert pose is not None
+    assert np.isclose(pose.latitude, 47 + 30 / 3600)
+    assert np.isclose(pose.longitude, -19)
+    assert pose.yaw == -12.5
+    Image.fromarray(np.zeros((32, 32, 3), dtype=np.uint8)).save(tmp_path / "a.png")
+    assert read_pose(tmp_path / "a.png") is None
+    assert read_pose(np.zeros((32, 32, 3), dtype=np.uint8)) is None
+
+
+def test_spatial_pairs() -> None:
+    """Test for pruning the pairs of a survey to spatial neighbours"""
+    lines = [(col * 20.0, row * 40.0) for row in range(10) for col in range(20)]
+    positions = np.array(lines)
+    pairs = spatial_pairs(positions)
+    assert (0, 1) in pairs and (0, 20) in pairs
+    assert (0, 199) not in pairs
+    assert len(pairs) < 10 * len(positions)
+    positions[5] = np.nan
+    assert {(idx, 5) for idx in range(5)} <= spatial_pairs(positions)
+
+
+def test_geo_order(tmp_path: Path) -> None:
+    """Test for ordering the frames of a flight line by their GPS positions"""
+    positions = np.array([[0.0, 0.0], [2.0, 0.0], [np.nan, 0.0], [1.0, 0.0]])
+    assert geo_order(positions) == [0, 3, 1, 2]
+    for name, latitude, value in [("a", 0.0, 50), ("b", 2.0, 150), ("c", 1.0, 100)]:
+        _write_frame(tmp_path / f"{name}.jpg", latitude, value=value)
+    loader = ImageLoader(image_dir=tmp_path, geo_order=True)
+    loader.opencv_load_images()
+    assert [round(image.mean() / 50) for image in loader.images] == [1, 2, 3]
+    positions = ground_positions([read_pose(tmp_path / "a.jpg"), None])
+    assert np.allclose(positions[0], 0) and np.isnan(positions[1]).all()
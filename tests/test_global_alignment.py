@@ -0,0 +1,78 @@
+"""This is a test for the global alignment over loop-closure pairs"""
+
+from typing import Any, List
+import cv2
+import numpy as np
+import numpy.typing as npt
+from panaroma_stitcher.global_alignment import loop_candidates, refine
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.synthetic import (
+    alignment_error,
+    generate_views,
+    relative_homographies,
+    view_layout,
+)
+
+SHAPE = (240, 320)
+
+
+def _grid(count: int, rows: int) -> List[npt.NDArray[Any]]:
+    """Return the homographies of frames on a serpentine grid with half overlaps"""
+    return [
+        np.array([[1.0, 0, col * 160], [0, 1, row * 120], [0, 0, 1]])
+        for row, col in view_layout(count, rows)
+    ]
+
+
+def test_loop_candidates() -> None:
+    """Test for pairing the frames of neighbouring rows but not consecutive frames"""
+    pairs = loop_candidates(_grid(12, 2), [SHAPE] * 12)
+    assert (0, 11) in pairs and (5, 6) not in pairs
+    assert all(j - i >= 2 for i, j in pairs)
+    assert len(pairs) <= 12 * 2
+
+
+def test_refine() -> None:
+    """Test for removing the drift of a chain with noisy correspondences"""
+    rng = np.random.default_rng(0)
+    truth = _grid(12, 2)
+    constraints = []
+    for i, j in [(idx - 1, idx) for idx in range(1, 12)] + loop_candidates(
+        truth, [SHAPE] * 12
+    ):
+        points = rng.uniform([0, 0], [320, 240], (200, 2))
+        mapped = cv2.perspectiveTransform(
+            points[:, None], np.linalg.inv(truth[j]) @ truth[i]
+        )[:, 0]
+        inside = (mapped[:, 0] > 0) & (mapped[:, 0] < 320)
+        inside &= (mapped[:, 1] > 0) & (mapped[:, 1] < 240)
+        noise = rng.normal(0, 0.5, mapped.shape)
+        constraints.append((i, j, points[inside], mapped[inside] + noise[inside]))
+    drift = np.array([[1.002, 0.003, 1], [-0.003, 1.002, 1], [0, 0, 1]])
+    chain = [np.linalg.matrix_power(drift, idx) @ truth[idx] for idx in range(12)]
+    refined, report = refine(chain, constraints, [SHAPE] * 12)
+    assert np.allclose(refined[0], np.eye(3), atol=1e-12)
+    before = alignment_error(chain, truth, SHAPE)["mean_px"]
+    assert alignment_error(refined, truth, SHAPE)["mean_px"] < before / 5
+    assert report["after"]["rms_px"] < 1 < report["before"]["rms_px"]
+    assert report["loop_pairs"] == len(constraints) - 11
+    refined, _ = refine(chain, constraints, [SHAPE] * 12, max_groups=3)
+    assert np.allclose(refined[0], np.eye(3), atol=1e-12)
+    assert alignment_error(refined, truth, SHAPE)["mean_px"] < before / 5
+
+
+def test_stitcher() -> None:
+    """Test for reducing the alignment error of a two-row sequence against the ground truth"""
+    views, truth = zip(*generate_views(20, SHAPE, rows=2))
+    truth = relative_homographies(truth)
+    chained = SequentialStitcher.from_images(list(views), number_feature=500)
+    stitcher = SequentialStitcher.from_images(
+        list(views), number_feature=500, global_alignment=True, final_size=(600, 1800)
+    )
+    error = alignment_error(stitcher.homographies(), truth, SHAPE)["mean_px"]
+    assert error < alignment_error(chained.homographies(), truth, SHAPE)["mean_px"] / 2
+    assert stitcher.alignment_report is not None
+    assert stitcher.alignment_report["loop_pairs"] > 0
+    assert len(stitcher.matching.features) == len(views)
+    result = stitcher.stitcher()
+    assert result is not None and result.shape[1] > 1000
@@ -0,0 +1,35 @@
+"""This is a test for the compiled compositing and mask kernels"""
+
+import cv2
+import numpy as np
+from panaroma_stitcher import kernels
+from panaroma_stitcher.benchmark import run_kernels
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.utility import padded_foreground_mask
+
+
+def test_paste_and_mask() -> None:
+    """Test for the kernels against the opencv call chains on a warped frame"""
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    canvas = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    homography = np.array([[1.1, 0.1, 30.0], [0.05, 0.9, 20.0], [0.0002, 0.0, 1.0]])
+    frame = np.asarray(cv2.warpPerspective(image, homography, (160, 120)), np.uint8)
+    roi = kernels.frame_roi(homography, image.shape, canvas.shape)
+    assert roi is not None
+    assert kernels.supported(frame, canvas)
+    expected = SequentialStitcher.stitch_cleaner(frame, canvas)
+    assert np.array_equal(
+        kernels.paste_nonblack(frame, canvas.copy(), 1, roi), expected
+    )
+    assert np.array_equal(
+        padded_foreground_mask(frame, True), padded_foreground_mask(frame)
+    )
+    assert not kernels.supported(frame.astype(np.float32))
+
+
+def test_run_kernels() -> None:
+    """Test for benchmarking the kernels"""
+    records = run_kernels((100, 150), repeats=2)["cases"]
+    assert set(records) == {"paste", "mask"}
+    assert all(record["identical"] for record in records.values())
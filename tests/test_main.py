@@ -1,5 +1,6 @@
 """Test for main console"""
 
+from pathlib import Path
 from click.testing import CliRunner
 from panaroma_stitcher.main import panaroma_stitcher_cli
 
@@ -52,3 +53,25 @@ def test_detailed_stitcher() -> None:
     )
     assert result.exit_code == 0
     assert result
+
+
+def test_data_path(tmp_path: Path) -> None:
+    """Test for requiring the data path only in the commands that load images"""
+    runner = CliRunner()
+    result = runner.invoke(
+        panaroma_stitcher_cli,
+        [
+            "synthesize",
+            "-n",
+            "2",
+            "--view_shape",
+            "60",
+            "80",
+            "--output_dir",
+            str(tmp_path),
+        ],
+    )
+    assert result.exit_code == 0
+    result = runner.invoke(panaroma_stitcher_cli, ["geo-index"])
+    assert result.exit_code == 2
+    assert "--data_path" in result.output
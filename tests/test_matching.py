@@ -0,0 +1,38 @@
+"""This is a test for the descriptor matching engine"""
+
+from typing import Any, List
+import cv2
+import numpy as np
+import numpy.typing as npt
+from panaroma_stitcher.matching import MatchingEngine, compare_to_brute_force
+
+
+def test_indexes() -> None:
+    """Test for KD-tree and LSH indexes kept per image key"""
+    rng = np.random.default_rng(0)
+    float_train = rng.random((300, 128), dtype=np.float32)
+    binary_train = rng.integers(0, 256, (300, 32), dtype=np.uint8)
+    engine = MatchingEngine(checks=64)
+    trains: List[npt.NDArray[Any]] = [float_train, binary_train]
+    for train in trains:
+        matches = engine.match(train[::3], train, train_key=train.dtype.name)
+        assert [match.trainIdx for match in matches] == list(range(0, 300, 3))
+    assert set(engine.indexes) == {"float32", "uint8"}
+    index = engine.indexes["float32"]
+    engine.match(float_train[:5], float_train, train_key="float32")
+    assert engine.indexes["float32"] is index
+    engine.evict("uint8")
+    assert set(engine.indexes) == {"float32"}
+    assert engine.match(None, float_train) == []
+    assert isinstance(MatchingEngine("bf").create(binary=True), cv2.BFMatcher)
+
+
+def test_compare_to_brute_force() -> None:
+    """Test for the recall of the engine against brute force"""
+    rng = np.random.default_rng(1)
+    train = rng.random((500, 128), dtype=np.float32)
+    query = train[:200] + rng.normal(0, 0.01, (200, 128)).astype(np.float32)
+    record = compare_to_brute_force(MatchingEngine(checks=128), query, train, 1)
+    assert record["matches"] == 200
+    assert record["recall"] > 0.9
+    assert compare_to_brute_force(MatchingEngine("bf"), query, train, 1)["recall"] == 1
@@ -0,0 +1,59 @@
+"""This is a test for the memory budget of the stitchers"""
+
+from pathlib import Path
+import cv2
+import numpy as np
+import pytest
+from panaroma_stitcher.detailed_stitcher import DetailedStitcher
+from panaroma_stitcher.memory_budget import (
+    MemoryBudgetError,
+    MemoryPlan,
+    estimate,
+    frame_shapes,
+)
+from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.synthetic import generate_views
+
+VIEWS = [view for view, _ in generate_views(3, (240, 320))]
+
+
+def test_frame_shapes(tmp_path: Path) -> None:
+    """Test for reading the frame sizes from headers, bytes and arrays"""
+    cv2.imwrite(str(tmp_path / "frame.png"), VIEWS[0])
+    encoded = cv2.imencode(".jpg", VIEWS[0])[1].tobytes()
+    assert frame_shapes([tmp_path / "frame.png", encoded, VIEWS[0]]) == [(240, 320)] * 3
+
+
+def test_sequential_budget() -> None:
+    """Test for scaling the frames and the canvas of the sequential stitcher to the budget"""
+    stitcher = SequentialStitcher.from_images(VIEWS, final_size=(400, 800))
+    full = estimate(stitcher, [(240, 320)] * 3, MemoryPlan(1.0, 1.0, 1.0, 1.0))
+    half = estimate(stitcher, [(240, 320)] * 3, MemoryPlan(0.5, 0.5, 0.5, 0.5))
+    assert half.peak_mb < full.peak_mb
+    stitcher = SequentialStitcher.from_images(
+        VIEWS, final_size=(400, 800), memory_budget_mb=full.peak_mb
+    )
+    assert stitcher.images[0].shape == (240, 320, 3)
+    stitcher = SequentialStitcher.from_images(
+        VIEWS, final_size=(400, 800), memory_budget_mb=half.peak_mb
+    )
+    assert stitcher.images[0].shape == (120, 160, 3)
+    assert stitcher.final_size == (200, 400)
+
+
+def test_detailed_budget() -> None:
+    """Test for lowering the compose resolution of the detailed stitcher before the loaded frames"""
+    stitcher = DetailedStitcher.from_images(VIEWS)
+    plan = estimate(stitcher, [(240, 320)] * 3, MemoryPlan(1.0, 0.5, 0.5, 0.5))
+    stitcher = DetailedStitcher.from_images(VIEWS, memory_budget_mb=plan.peak_mb)
+    assert stitcher.images[0].shape == (240, 320, 3)
+    assert np.isclose(stitcher.overrides["final_megapix"], 0.25 * 240 * 320 / 1e6)
+
+
+def test_over_budget() -> None:
+    """Test for refusing a budget that does not fit at any scale"""
+    with pytest.raises(MemoryBudgetError, match="over the memory budget of 10 MB"):
+        SequentialStitcher.from_images(VIEWS, memory_budget_mb=10)
+    overrides = {"final_megapix": 0.0001}
+    with pytest.raises(MemoryBudgetError, match="at the smallest scale 0.03"):
+        DetailedStitcher.from_images(VIEWS, overrides=overrides, memory_budget_mb=10)
@@ -0,0 +1,56 @@
+"""This is a test for the online mosaic session"""
+
+import cv2
+import numpy as np
+from panaroma_stitcher.online import MosaicSession
+from panaroma_stitcher.synthetic import (
+    alignment_error,
+    generate_views,
+    relative_homographies,
+)
+
+VIEWS, HOMOGRAPHIES = zip(*generate_views(8, (120, 160), overlap=0.6))
+
+
+def test_add_frame() -> None:
+    """Test for registering every frame against the recent frames"""
+    session = MosaicSession(window=2)
+    records = [session.add_frame(view) for view in VIEWS]
+    assert all(record["added"] for record in records)
+    assert [record["reference"] for record in records[:3]] == [None, 0, 1]
+    homographies = [item for item in session.homographies if item is not None]
+    assert len(homographies) == len(VIEWS)
+    error = alignment_error(
+        homographies, relative_homographies(HOMOGRAPHIES), (120, 160)
+    )
+    assert error["mean_px"] < 10
+    mosaic = session.mosaic()
+    assert mosaic is not None and mosaic.shape[1] > 3 * 160
+    assert len(session.matching.features) == 2
+
+
+def test_growth_and_preview() -> None:
+    """Test for growing the canvas a logarithmic number of times and downscaling only the new frames"""
+    session = MosaicSession(preview_factor=4)
+    for view in VIEWS:
+        session.add_frame(view)
+    assert session.growths <= 3
+    height, width = session.canvas.shape[:2]
+    expected = cv2.resize(
+        session.canvas, (width // 4, height // 4), interpolation=cv2.INTER_AREA
+    )
+    assert np.array_equal(session.preview_canvas, expected)
+    preview, mosaic = session.preview(), session.mosaic()
+    assert preview is not None and mosaic is not None
+    assert preview.shape[:2] == (mosaic.shape[0] // 4, mosaic.shape[1] // 4)
+
+
+def test_unregistered_frame() -> None:
+    """Test for leaving a frame that does not match out of the mosaic"""
+    session = MosaicSession()
+    assert session.mosaic() is None and session.preview() is None
+    session.add_frame(VIEWS[0])
+    noise = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    record = session.add_frame(noise)
+    assert not record["added"] and session.homographies[1] is None
+    assert session.add_frame(VIEWS[1])["reference"] == 0
@@ -24,3 +24,15 @@ def test_stitcher(tmp_path: Path) -> None:
     stitcher = SimpleStitcher(Path("./test_data/mountain"))
     stitcher.stitcher(str(tmp_path / "test_result.png"), True)
     assert Path(tmp_path / "test_result.png").exists()
+
+
+def test_estimate_and_compose(tmp_path: Path) -> None:
+    """Test for composing new images with the transforms estimated by SimpleStitcher"""
+    stitcher = SimpleStitcher(
+        Path("./test_data/mountain"), registration_resol=0.3, compositing_resol=0.5
+    )
+    with pytest.raises(ValueError):
+        stitcher.compose()
+    assert stitcher.estimate()
+    stitcher.compose(stitcher.images, str(tmp_path / "test_result.png"), True)
+    assert Path(tmp_path / "test_result.png").exists()
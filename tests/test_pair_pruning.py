@@ -0,0 +1,30 @@
+"""This is a test for candidate pair pruning"""
+
+import numpy as np
+from panaroma_stitcher.pair_pruning import (
+    candidate_pairs,
+    global_signatures,
+    matching_mask,
+)
+
+
+def test_global_signatures() -> None:
+    """Test for global signatures of images"""
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (40, 60, 3), dtype=np.uint8) for _ in range(3)]
+    signatures = global_signatures(images)
+    assert signatures.shape[0] == 3
+    assert np.allclose(np.linalg.norm(signatures, axis=1), 1.0, atol=1e-4)
+
+
+def test_candidate_pairs_and_mask() -> None:
+    """Test for the k-nearest-neighbour candidate pairs and their matching mask"""
+    signatures = np.array(
+        [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.1, 0.9]], dtype=np.float32
+    )
+    pairs = candidate_pairs(signatures, 1, connected=False)
+    assert pairs == {(0, 1), (2, 3)}
+    assert candidate_pairs(signatures, 1) == {(0, 1), (2, 3), (1, 3)}
+    mask = matching_mask(pairs, 4)
+    assert mask[0, 1] == mask[1, 0] == 1
+    assert mask.sum() == 4
@@ -1,8 +1,38 @@
 """Package level tests"""
 
+import subprocess
+import sys
+import panaroma_stitcher
 from panaroma_stitcher import __version__
 
 
 def test_version() -> None:
     """Unit test for checking the version of the code"""
     assert __version__ == "0.2.0"
+
+
+def test_lazy_imports() -> None:
+    """Test that the package, the cli and the opencv stitchers do not import the heavy backends"""
+    code = (
+        "import panaroma_stitcher.main, panaroma_stitcher.opencv_simple; "
+        "import panaroma_stitcher.keypoint_stitcher, panaroma_stitcher.sequential_stitcher"
+    )
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    modules = {
+        line.split("|")[-1].strip()
+        for line in output.splitlines()
+        if line.startswith("import time:")
+    }
+    assert "panaroma_stitcher.opencv_simple" in modules
+    assert not modules & {"torch", "kornia", "matplotlib", "stitching", "numba"}
+
+
+def test_public_api() -> None:
+    """Test that the public classes of the package are still available"""
+    assert set(panaroma_stitcher.__all__) <= set(dir(panaroma_stitcher))
+    assert panaroma_stitcher.ImageLoader.__name__ == "ImageLoader"
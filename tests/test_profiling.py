@@ -0,0 +1,80 @@
+"""This is a test for the profiling spans"""
+
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+import numpy as np
+from panaroma_stitcher import profiling
+
+
+def test_disabled_span() -> None:
+    """Test for the shared no-op span when profiling is disabled"""
+    profiling.disable()
+    assert not profiling.is_enabled()
+    assert profiling.span("load") is profiling.span("crop")
+
+
+def test_json_and_chrome_sinks(tmp_path: Path) -> None:
+    """Test for nested spans written as JSON and chrome traces"""
+    image = np.zeros((10, 20, 3), dtype=np.uint8)
+    for sink in ["json", "chrome"]:
+        profiling.enable(sink, str(tmp_path / f"{sink}.json"), memory=True)
+        with profiling.span("stitch"):
+            with profiling.span("warping") as stage:
+                stage.add_pixels([image, image])
+        profiling.disable()
+    with open(tmp_path / "json.json", "r", encoding="utf-8") as trace_file:
+        records = json.load(trace_file)
+    assert [record["name"] for record in records] == ["warping", "stitch"]
+    assert records[0]["pixels"] == 400
+    assert records[0]["parent"] == "stitch"
+    assert "peak_memory_mb" in records[0]
+    with open(tmp_path / "chrome.json", "r", encoding="utf-8") as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    assert events[1]["ph"] == "X"
+    assert events[1]["dur"] >= events[0]["dur"]
+
+
+def test_lazy_stages_and_tracing() -> None:
+    """Test for timing generator stages where they are consumed and for keeping the tracing of the caller"""
+
+    class Stages:  # pylint: disable=too-few-public-methods
+        """Stage with a lazy output like the final resolution of the stitching library"""
+
+        @staticmethod
+        def _images() -> Iterator[int]:
+            """Warp two images lazily"""
+            for index in range(2):
+                time.sleep(0.05)
+                yield index
+
+        def warp(self) -> Tuple[Iterator[int], str]:
+            """Return the lazily warped images with their corners"""
+            return self._images(), "corners"
+
+    class Sink:
+        """Collect the span records"""
+
+        def __init__(self) -> None:
+            self.records: List[Dict[str, Any]] = []
+
+        def emit(self, record: Dict[str, Any]) -> None:
+            """Keep a record"""
+            self.records.append(record)
+
+        def close(self) -> None:
+            """Nothing to flush"""
+
+    sink = Sink()
+    tracemalloc.start()
+    profiling.enable(sink, memory=True)
+    stages = Stages()
+    profiling.profile_methods(stages, {"warp": "warping"})
+    images, corners = stages.warp()
+    assert list(images) == [0, 1] and corners == "corners"
+    profiling.disable()
+    assert tracemalloc.is_tracing()
+    tracemalloc.stop()
+    assert sum(record["wall_seconds"] for record in sink.records) >= 0.1
@@ -0,0 +1,35 @@
+"""This is a test for the remap compositor"""
+
+from pathlib import Path
+import numpy as np
+import pytest
+from panaroma_stitcher.remap_compositor import RemapCompositor, benchmark
+
+
+def test_build_and_compose(tmp_path: Path) -> None:
+    """Test for composing a translated rig with precomputed remap tables"""
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 255, (60, 160, 3), dtype=np.uint8)
+    frames = [scene[:, :100], scene[:, 60:]]
+    homographies = [
+        np.eye(3),
+        np.array([[1.0, 0.0, 60.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]),
+    ]
+    compositor = RemapCompositor.build(
+        homographies, [(100, 60), (100, 60)], tmp_path / "lut"
+    )
+    assert Path(tmp_path / "lut" / "meta.json").exists()
+    assert compositor.canvas_size == (160, 60)
+    assert compositor.frame_sizes == [(100, 60), (100, 60)]
+    with pytest.raises(ValueError):
+        compositor.compose([scene[:, :100], scene[:, 80:]])
+    result = RemapCompositor(tmp_path / "lut", workers=2, band_height=16).compose(
+        frames
+    )
+    assert result.shape == scene.shape
+    assert np.abs(result.astype(int) - scene.astype(int)).max() <= 1
+
+
+def test_benchmark() -> None:
+    """Test for throughput benchmark of the remap compositor"""
+    assert benchmark("1080p", frames=2, repeats=1) > 0
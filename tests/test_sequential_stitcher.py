@@ -3,6 +3,7 @@
 from pathlib import Path
 import cv2
 from panaroma_stitcher.sequential_stitcher import SequentialStitcher
+from panaroma_stitcher.synthetic import generate_views
 
 
 def test_detect_and_describe() -> None:
@@ -44,3 +45,14 @@ def test_stitcher(tmp_path: Path) -> None:
     )
     stitcher.stitcher(str(tmp_path / "test_result.png"), True)
     assert Path(tmp_path / "test_result.png").exists()
+
+
+def test_evicted_features() -> None:
+    """Test for keeping only the features and index of the last frame during a stitch"""
+    views = [view for view, _ in generate_views(4, (240, 320), overlap=0.6)]
+    stitcher = SequentialStitcher.from_images(
+        views, matcher_type="flann", number_feature=500, final_size=(300, 1000)
+    )
+    assert stitcher.stitcher() is not None
+    assert list(stitcher.matching.features) == [3]
+    assert not stitcher.matching.indexes
@@ -0,0 +1,47 @@
+"""This is a test for the stitching service"""
+
+from pathlib import Path
+from typing import Iterator
+import pytest
+from panaroma_stitcher.service import (
+    ServiceBusyError,
+    StitchingClient,
+    StitchingService,
+)
+
+
+@pytest.fixture(name="service")
+def fixture_service() -> Iterator[StitchingService]:
+    """Start a local service on a free port"""
+    service = StitchingService(port=0, workers=1, queue_size=0)
+    service.start()
+    yield service
+    service.stop()
+
+
+def test_stitch(service: StitchingService) -> None:
+    """Test for stitching uploaded images through the client"""
+    client = StitchingClient(f"http://127.0.0.1:{service.port}")
+    images = [
+        path.read_bytes() for path in sorted(Path("./test_data/mountain").glob("*.jpg"))
+    ]
+    result = client.stitch(images, "sequential", {"number_feature": 500})
+    assert result.ndim == 3
+    assert client.metrics()["completed"] == 1
+
+
+def test_backpressure_and_errors(service: StitchingService) -> None:
+    """Test for rejecting requests when the queue is full and for bad requests"""
+    client = StitchingClient(f"http://127.0.0.1:{service.port}")
+    with pytest.raises(ValueError):
+        client.stitch([b""], "unknown")
+    with pytest.raises(ValueError, match="checkpoint_dir"):
+        client.stitch([b""], "sequential", {"checkpoint_dir": "/"})
+    service.slots.acquire()
+    with pytest.raises(ServiceBusyError):
+        client.stitch([b""], "simple")
+    service.slots.release()
+    metrics = client.metrics()
+    assert metrics["requests"] == 3
+    assert metrics["rejected"] == 1
+    assert metrics["in_flight"] == 0
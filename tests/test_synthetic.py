@@ -0,0 +1,39 @@
+"""This is a test for the synthetic dataset generator"""
+
+from pathlib import Path
+import cv2
+import numpy as np
+from panaroma_stitcher.synthetic import (
+    alignment_error,
+    generate_views,
+    read_ground_truth,
+    view_layout,
+    write_dataset,
+)
+
+
+def test_generate_views() -> None:
+    """Test for cutting perturbed views out of a source image"""
+    source = np.random.default_rng(0).integers(0, 255, (400, 600, 3), dtype=np.uint8)
+    views, homographies = zip(*generate_views(3, (100, 150), source=source))
+    assert len(views) == 3 and views[0].shape == (100, 150, 3)
+    expected = cv2.warpPerspective(
+        source, homographies[1], (150, 100), flags=cv2.WARP_INVERSE_MAP
+    )
+    assert np.array_equal(views[1], expected)
+    assert view_layout(6, 2) == [(0, 0), (0, 1), (0, 2), (1, 2), (1, 1), (1, 0)]
+
+
+def test_write_dataset(tmp_path: Path) -> None:
+    """Test for writing views with ground-truth transforms and measuring alignment errors"""
+    write_dataset(tmp_path, 4, (120, 160), rows=2)
+    ground_truth = read_ground_truth(tmp_path)
+    assert ground_truth is not None
+    assert len(list(tmp_path.glob("frame_*.png"))) == 4
+    assert np.allclose(ground_truth["homographies"][0], np.eye(3))
+    truth = [np.asarray(homography) for homography in ground_truth["homographies"]]
+    assert alignment_error(truth, truth, (120, 160))["max_px"] == 0
+    shifted = list(truth)
+    shifted[1] = np.array([[1, 0, 3], [0, 1, 4], [0, 0, 1]]) @ shifted[1]
+    assert np.isclose(alignment_error(shifted, truth, (120, 160))["max_px"], 5)
+    assert read_ground_truth(tmp_path / "missing") is None
@@ -0,0 +1,43 @@
+"""This is a test for the DeepZoom tile pyramid"""
+
+from pathlib import Path
+import cv2
+import numpy as np
+import pytest
+from panaroma_stitcher.tile_pyramid import DeepZoomWriter, write_deepzoom
+from panaroma_stitcher.utility import ImageLoader
+
+IMAGE = np.random.default_rng(0).integers(0, 255, (150, 201, 3), dtype=np.uint8)
+
+
+def test_write_deepzoom(tmp_path: Path) -> None:
+    """Test for writing the tiles of every level with their overlap"""
+    levels, tiles = write_deepzoom(
+        IMAGE, tmp_path / "pano.dzi", tile_size=64, tile_format="png"
+    )
+    assert levels == 9
+    assert len(list((tmp_path / "pano_files").rglob("*.png"))) == tiles
+    assert np.array_equal(
+        cv2.imread(str(tmp_path / "pano_files" / "8" / "1_2.png")), IMAGE[127:, 63:129]
+    )
+    expected = cv2.resize(IMAGE[:, :200], (100, 75), interpolation=cv2.INTER_AREA)
+    level = cv2.imread(str(tmp_path / "pano_files" / "7" / "0_0.png"))
+    assert np.array_equal(level[:, :65], expected[:65, :65])
+    assert cv2.imread(str(tmp_path / "pano_files" / "0" / "0_0.png")).shape == (1, 1, 3)
+    assert 'Width="201" Height="150"' in (tmp_path / "pano.dzi").read_text("utf-8")
+
+
+def test_incomplete_pyramid(tmp_path: Path) -> None:
+    """Test for refusing a pyramid whose rows were not all written"""
+    writer = DeepZoomWriter(tmp_path / "pano.dzi", 201, 150)
+    writer.write_band(IMAGE[:100])
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+def test_save_result(tmp_path: Path) -> None:
+    """Test for saving an RGB result as a pyramid of webp tiles"""
+    loader = ImageLoader(tile_format="webp")
+    loader.save_result(IMAGE, str(tmp_path / "pano.dzi"), framer=False)
+    assert (tmp_path / "pano_files" / "8" / "0_0.webp").exists()
+    assert 'Format="webp"' in (tmp_path / "pano.dzi").read_text("utf-8")
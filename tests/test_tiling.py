@@ -0,0 +1,31 @@
+"""This is a test for the tiled feature detection"""
+
+import cv2
+import numpy as np
+from panaroma_stitcher.tiling import detect_and_compute_tiled, tile_boxes
+
+
+def test_tile_boxes() -> None:
+    """Test for the cores covering the image and the padded tiles"""
+    boxes = tile_boxes((100, 150), (2, 3), overlap=10)
+    assert len(boxes) == 6
+    assert sum((c[1] - c[0]) * (c[3] - c[2]) for c, _ in boxes) == 100 * 150
+    assert boxes[0][1] == (0, 60, 0, 60)
+    assert boxes[-1][1] == (40, 100, 90, 150)
+
+
+def test_detect_and_compute_tiled() -> None:
+    """Test for spreading the keypoints over tiles without duplicates in the overlaps"""
+    rng = np.random.default_rng(0)
+    image = np.full((300, 400), 128, dtype=np.uint8)
+    image[:, :200] = rng.integers(0, 255, (300, 200), dtype=np.uint8)
+    for top in range(40, 260, 50):
+        for left in range(230, 380, 50):
+            image[top : top + 15, left : left + 15] = 255
+    keypoints, descriptors = detect_and_compute_tiled(
+        lambda: cv2.ORB.create(500), image, (2, 2), overlap=32, budget=50
+    )
+    assert descriptors is not None and len(descriptors) == len(keypoints)
+    assert len({keypoint.pt for keypoint in keypoints}) == len(keypoints)
+    right = sum(keypoint.pt[0] >= 200 for keypoint in keypoints)
+    assert 0 < right and len(keypoints) - right <= 100
@@ -2,7 +2,9 @@
 
 from pathlib import Path
 import pytest
+import cv2
 import numpy as np
+import torch
 from panaroma_stitcher.utility import ImageLoader
 
 
@@ -49,3 +51,25 @@ def test_save_result(tmp_path: Path) -> None:
         np.ones([100, 100]), str(tmp_path / "test_result.png"), False
     )
     assert Path(tmp_path / "test_result.png").exists()
+
+
+def test_from_images() -> None:
+    """Unit test for loading in-memory arrays, encoded bytes and tensors"""
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 255, (20, 30, 3), dtype=np.uint8)
+    encoded = cv2.imencode(".png", array)[1].tobytes()
+    tensor = torch.from_numpy(cv2.cvtColor(array, cv2.COLOR_BGR2RGB)).permute(2, 0, 1)
+    image_handler = ImageLoader.from_images([array, encoded, tensor.float() / 255])
+    image_handler.opencv_load_images()
+    assert image_handler.images[0] is array
+    for image in image_handler.images[1:]:
+        assert np.array_equal(image, array)
+    image_handler.kornia_load_images()
+    assert image_handler.images[1].shape == (1, 3, 20, 30)
+    assert torch.allclose(image_handler.images[0], image_handler.images[2])
+
+
+def test_missing_images() -> None:
+    """Unit test for a loader without a directory or in-memory images"""
+    with pytest.raises(ValueError):
+        ImageLoader().opencv_load_images()